@@ -8,13 +8,27 @@ from flask_cors import CORS
 from flask_migrate import Migrate
 from flask_session import Session
 
+def normalize_database_url(url: str):
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
 app = flask.Flask(__name__)
 if config.DATABASE_URL is not None:
-    if config.DATABASE_URL.startswith("postgres://"):
-        config.DATABASE_URL = config.DATABASE_URL.replace("postgres://", "postgresql://", 1)
+    config.DATABASE_URL = normalize_database_url(config.DATABASE_URL)
     app.config["SQLALCHEMY_DATABASE_URI"] = config.DATABASE_URL
 else:
     app.config["SQLALCHEMY_DATABASE_URI"] = f"{config.DB_ENGINE}+{config.DB_DRIVER}://{config.DB_USERNAME}:{quote_plus(config.DB_PASSWORD)}@{config.DB_SERVER}/{config.DB_NAME}"
+if config.DB_REPLICA_URL is not None:
+    app.config["SQLALCHEMY_BINDS"] = {"replica": normalize_database_url(config.DB_REPLICA_URL)}
+if not app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+    }
 app.config["SESSION_TYPE"] = "filesystem"
 app.config["SESSION_COOKIE_SAMESITE"] = "None"
 app.config["SESSION_COOKIE_SECURE"] = True
@@ -40,8 +54,20 @@ app.register_blueprint(webapp.routes.auth)
 app.register_blueprint(webapp.routes.user)
 app.register_blueprint(webapp.routes.tracks)
 app.register_blueprint(webapp.routes.webhooks)
+app.register_blueprint(webapp.routes.relay)
+
+app.cli.add_command(webapp.commands.maintenance)
+app.cli.add_command(webapp.commands.migrations)
+app.cli.add_command(webapp.commands.profiles)
+app.cli.add_command(webapp.commands.relay)
+app.cli.add_command(webapp.commands.tracks)
 
 Session(app)
 
 webapp.models.db.init_app(app)
+webapp.models.init_engines(app)
+webapp.middleware.deadlines.init_app(app)
+webapp.middleware.queries.init_app(app)
+webapp.middleware.profiling.init_app(app)
+webapp.middleware.serialization.init_app(app)
 migrate = Migrate(app, webapp.models.db)
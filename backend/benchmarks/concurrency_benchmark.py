@@ -0,0 +1,157 @@
+"""Measures how many simultaneous slow URL imports and playback requests one dyno sustains with each
+gunicorn worker class.
+
+A local "slow source" server stands in for remote audio hosts: it serves a small WAV file after a
+configurable delay. For each worker class, gunicorn is started with the current environment (which must
+point at a development database and bucket), and `--concurrency` clients each run one URL import
+(`POST /tracks/new` with a `source`) followed by playback requests (`GET /tracks/<id>`).
+
+Usage (from the backend directory):
+    python benchmarks/concurrency_benchmark.py EMAIL PASSWORD [--workers N] [--concurrency N] [--delay S]"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER_CLASSES = ["sync", "gthread", "gevent"]
+APP_PORT = 8765
+
+
+def wav_file(seconds: float = 1.0, rate: int = 8000) -> bytes:
+    samples = int(seconds * rate)
+    buffer = io.BytesIO()
+    buffer.write(b"RIFF" + struct.pack("<I", 36 + samples) + b"WAVE")
+    buffer.write(b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, rate, rate, 1, 8))
+    buffer.write(b"data" + struct.pack("<I", samples) + b"\x80" * samples)
+    return buffer.getvalue()
+
+def slow_source_server(delay: float):
+    body = wav_file()
+
+    class Handler(BaseHTTPRequestHandler):
+        # Imports start with a HEAD, then read their sample with a range request when the source supports them
+        def respond(self, with_body: bool):
+            time.sleep(delay)
+            start, stop, partial = 0, len(body), False
+            byte_range = self.headers.get("Range", "")
+            if with_body and byte_range.startswith("bytes=") and "," not in byte_range:
+                first, _, last = byte_range[len("bytes="):].partition("-")
+                if first.isdigit():
+                    start, stop = int(first), min(int(last) + 1 if last.isdigit() else len(body), len(body))
+                    partial = True
+            self.send_response(206 if partial else 200)
+            self.send_header("Content-Type", "audio/wav")
+            self.send_header("Content-Length", str(stop - start))
+            self.send_header("Accept-Ranges", "bytes")
+            if partial:
+                self.send_header("Content-Range", f"bytes {start}-{stop - 1}/{len(body)}")
+            self.end_headers()
+            if with_body:
+                self.wfile.write(body[start:stop])
+
+        def do_HEAD(self):
+            self.respond(False)
+
+        def do_GET(self):
+            self.respond(True)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def client(base_url: str, email: str, password: str, source: str, plays: int):
+    session = requests.Session()
+    session.post(f"{base_url}/auth/login", json={"email": email, "password": password}).raise_for_status()
+    timings = {"import": [], "play": []}
+
+    start = time.perf_counter()
+    response = session.post(f"{base_url}/tracks/new", data={
+        "metadata": json.dumps({"track_name": "Benchmark", "playlists": ["Benchmark"], "source": source})
+    })
+    timings["import"].append(time.perf_counter() - start)
+    track_id = response.json().get("id")
+    if track_id is None:
+        return timings, None
+
+    for _ in range(plays):
+        start = time.perf_counter()
+        session.get(f"{base_url}/tracks/{track_id}", json={})
+        timings["play"].append(time.perf_counter() - start)
+    return timings, track_id
+
+def run(worker_class: str, args, source: str):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "--config", "gunicorn.conf.py", "--bind", f"127.0.0.1:{APP_PORT}"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "WEB_CONCURRENCY": str(args.workers), "HOOT_GUNICORN_WORKER_CLASS": worker_class},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{APP_PORT}"
+    try:
+        for _ in range(60):
+            try:
+                requests.get(f"{base_url}/user", json={}, timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.5)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            results = list(executor.map(
+                lambda _: client(base_url, args.email, args.password, source, args.plays),
+                range(args.concurrency)
+            ))
+        elapsed = time.perf_counter() - start
+
+        session = requests.Session()
+        session.post(f"{base_url}/auth/login", json={"email": args.email, "password": args.password})
+        track_ids = [track_id for _, track_id in results if track_id is not None]
+        session.delete(f"{base_url}/tracks", json={"ids": track_ids})
+    finally:
+        process.terminate()
+        process.wait()
+
+    imports = sorted(t for timings, _ in results for t in timings["import"])
+    plays = sorted(t for timings, _ in results for t in timings["play"])
+    print(
+        f"{worker_class:>8}: {len(track_ids)}/{args.concurrency} imports in {elapsed:6.2f} s, "
+        f"import p50 {statistics.median(imports):6.2f} s p95 {imports[int(len(imports) * 0.95) - 1]:6.2f} s, "
+        f"play p50 {statistics.median(plays) * 1000 if plays else 0:7.1f} ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("email")
+    parser.add_argument("password")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--plays", type=int, default=5)
+    parser.add_argument("--delay", type=float, default=2.0, help="Seconds the slow source waits before responding.")
+    parser.add_argument("--worker-classes", nargs="+", default=WORKER_CLASSES)
+    args = parser.parse_args()
+
+    server = slow_source_server(args.delay)
+    source = f"http://127.0.0.1:{server.server_address[1]}/benchmark.wav"
+    for worker_class in args.worker_classes:
+        run(worker_class, args, source)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
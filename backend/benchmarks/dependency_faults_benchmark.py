@@ -0,0 +1,280 @@
+"""Measures request latency while the app's dependencies are slow or failing.
+
+Local stand-ins replace the real dependencies: a moto server plays S3, behind a proxy that injects faults
+(delayed responses, 503 "SlowDown" errors, or calls that hang), and a small HTTP server plays a remote
+audio host with the same faults. gunicorn is started with the current environment (which must point at a
+development database), pointed at the stand-ins, and `--concurrency` clients repeatedly start and cancel a
+resumable upload (two S3 calls) and import a track from a URL (remote source and S3), under each fault profile.
+
+For each profile this prints latency percentiles, the response statuses, and how many calls reached the
+stand-ins per request, which shows how much retries amplify the load on a failing dependency.
+
+Usage (from the backend directory):
+    python benchmarks/dependency_faults_benchmark.py EMAIL PASSWORD [--workers N] [--concurrency N] [--duration S]"""
+
+import argparse
+import collections
+import http.client
+import io
+import json
+import logging
+import os
+import random
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PORT = 8766
+BUCKET = "hoot-benchmark"
+
+# name -> (probability of a delay, delay in seconds, probability of a 503, probability of hanging)
+PROFILES = {
+    "healthy": (0.0, 0.0, 0.0, 0.0),
+    "slow": (0.2, 5.0, 0.0, 0.0),
+    "errors": (0.0, 0.0, 0.3, 0.0),
+    "hanging": (0.0, 0.0, 0.0, 0.1),
+    "outage": (0.0, 0.0, 1.0, 0.0),
+}
+HANG_SECONDS = 120
+
+
+class Faults:
+    def __init__(self):
+        self.profile = PROFILES["healthy"]
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def inject(self, handler: BaseHTTPRequestHandler) -> bool:
+        """Delays or fails the call as the current profile says. Returns whether the call was answered."""
+        with self._lock:
+            self.calls += 1
+        delay_rate, delay, error_rate, hang_rate = self.profile
+        roll = random.random()
+        if roll < hang_rate:
+            time.sleep(HANG_SECONDS)
+            return True
+        if roll < hang_rate + error_rate:
+            body = b"<Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>"
+            handler.send_response(503)
+            handler.send_header("Content-Type", "application/xml")
+            handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+            return True
+        if random.random() < delay_rate:
+            time.sleep(delay)
+        return False
+
+
+def wav_file(seconds: float = 1.0, rate: int = 8000) -> bytes:
+    samples = int(seconds * rate)
+    buffer = io.BytesIO()
+    buffer.write(b"RIFF" + struct.pack("<I", 36 + samples) + b"WAVE")
+    buffer.write(b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, rate, rate, 1, 8))
+    buffer.write(b"data" + struct.pack("<I", samples) + b"\x80" * samples)
+    return buffer.getvalue()
+
+def serve(handler) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def s3_proxy(faults: Faults, upstream_port: int) -> ThreadingHTTPServer:
+    """Forwards every request to the moto server, unless a fault is injected."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def forward(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if faults.inject(self):
+                return
+            connection = http.client.HTTPConnection("127.0.0.1", upstream_port)
+            connection.request(self.command, self.path, body, dict(self.headers))
+            response = connection.getresponse()
+            data = response.read()
+            self.send_response(response.status)
+            for name, value in response.getheaders():
+                if name.lower() not in ("content-length", "transfer-encoding", "connection"):
+                    self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except ConnectionError:
+                # The app gave up on the call
+                pass
+            connection.close()
+
+        do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = forward
+
+        def log_message(self, *args):
+            pass
+
+    return serve(Handler)
+
+def source_server(faults: Faults) -> ThreadingHTTPServer:
+    body = wav_file()
+
+    class Handler(BaseHTTPRequestHandler):
+        def respond(self, with_body: bool):
+            if faults.inject(self):
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/wav")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if with_body:
+                self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.respond(False)
+
+        def do_GET(self):
+            self.respond(True)
+
+        def log_message(self, *args):
+            pass
+
+    return serve(Handler)
+
+def allow_insecure_cookies(session: requests.Session):
+    # The session cookie is marked secure, but the app is served over plain HTTP here
+    for cookie in session.cookies:
+        cookie.secure = False
+
+def client(base_url: str, email: str, password: str, source: str, stop_at: float):
+    session = requests.Session()
+    # gunicorn may drop idle keep-alive connections between requests, which requests doesn't retry
+    session.headers["Connection"] = "close"
+    session.post(f"{base_url}/auth/login", json={"email": email, "password": password}).raise_for_status()
+    allow_insecure_cookies(session)
+    results = []
+
+    def timed(label, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=HANG_SECONDS * 2, **kwargs)
+        except requests.RequestException:
+            results.append((label, time.perf_counter() - start, "error"))
+            return None
+        results.append((label, time.perf_counter() - start, response.status_code))
+        allow_insecure_cookies(session)
+        return response
+
+    while time.time() < stop_at:
+        response = timed("upload", "POST", f"{base_url}/tracks/uploads", json={
+            "track_name": "Benchmark", "playlists": [], "filename": "benchmark.wav", "size": 1024,
+        })
+        if response is not None and response.status_code == 201:
+            timed("upload", "DELETE", f"{base_url}/tracks/uploads/{response.json()['id']}")
+
+        response = timed("import", "POST", f"{base_url}/tracks/new", data={
+            "metadata": json.dumps({"track_name": "Benchmark", "playlists": [], "source": source})
+        })
+        if response is not None and response.status_code == 200:
+            timed("delete", "DELETE", f"{base_url}/tracks/{response.json()['id']}", json={})
+    return results
+
+def percentile(values: list[float], fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def run_profile(name: str, args, faults: Faults, base_url: str, source: str):
+    faults.profile = PROFILES[name]
+    faults.calls = 0
+    stop_at = time.time() + args.duration
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        results = [
+            result
+            for client_results in executor.map(
+                lambda _: client(base_url, args.email, args.password, source, stop_at),
+                range(args.concurrency)
+            )
+            for result in client_results
+        ]
+
+    print(f"{name}: {faults.calls / max(1, len(results)):.1f} dependency calls per request")
+    for label in sorted(set(label for label, _, _ in results)):
+        latencies = sorted(latency for result_label, latency, _ in results if result_label == label)
+        statuses = collections.Counter(str(status) for result_label, _, status in results if result_label == label)
+        print(
+            f"  {label:>6}: {len(latencies):5d} requests, p50 {percentile(latencies, 0.5):6.2f} s, "
+            f"p99 {percentile(latencies, 0.99):6.2f} s, max {latencies[-1]:6.2f} s, "
+            f"statuses {dict(sorted(statuses.items()))}"
+        )
+
+def main():
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("email")
+    parser.add_argument("password")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds each fault profile runs for.")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    args = parser.parse_args()
+
+    moto = ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    moto.start()
+    moto_port = moto._server.server_port
+    boto_env = {"HOOT_AWS_ACCESS_KEY_ID": "benchmark", "HOOT_AWS_SECRET_ACCESS_KEY": "benchmark"}
+    import boto3
+    boto3.client(
+        "s3",
+        endpoint_url=f"http://127.0.0.1:{moto_port}",
+        aws_access_key_id="benchmark",
+        aws_secret_access_key="benchmark",
+        region_name="eu-west-3",
+    ).create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": "eu-west-3"})
+
+    faults = Faults()
+    proxy = s3_proxy(faults, moto_port)
+    source = source_server(faults)
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "--config", "gunicorn.conf.py", "--bind", f"127.0.0.1:{APP_PORT}"],
+        cwd=BACKEND_DIR,
+        env={
+            **os.environ,
+            **boto_env,
+            "WEB_CONCURRENCY": str(args.workers),
+            "HOOT_S3_ENDPOINT_URL": f"http://127.0.0.1:{proxy.server_address[1]}",
+            "HOOT_S3_BUCKET_NAME": BUCKET,
+            "HOOT_RATE_LIMITS": "0",
+            "HOOT_GUNICORN_TIMEOUT": str(HANG_SECONDS * 2),
+        },
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{APP_PORT}"
+    try:
+        for _ in range(60):
+            try:
+                requests.get(f"{base_url}/user", json={}, timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.5)
+
+        for name in args.profiles:
+            run_profile(name, args, faults, base_url, f"http://127.0.0.1:{source.server_address[1]}/benchmark.wav")
+    finally:
+        process.terminate()
+        process.wait()
+        proxy.shutdown()
+        source.shutdown()
+        moto.stop()
+
+if __name__ == "__main__":
+    main()
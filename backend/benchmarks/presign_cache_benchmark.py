@@ -0,0 +1,47 @@
+"""Estimates how often a browser can reuse cached audio, depending on the presign bucket width.
+
+A replay hits the browser cache only if it resolves to the same URL as the first play, i.e. when no bucket
+boundary falls between the two. Without bucketing, the URL stored for a track is reused until it expires
+and is then replaced by a new one, which behaves like a bucket as wide as the expiry.
+
+Usage: python benchmarks/presign_cache_benchmark.py [--samples N]"""
+
+import argparse
+import random
+
+
+HOUR = 60 * 60
+BUCKETS = [0, 1 * HOUR, 3 * HOUR, 6 * HOUR, 12 * HOUR, 24 * HOUR]
+REPLAY_INTERVALS = [10 * 60, 1 * HOUR, 4 * HOUR, 24 * HOUR, 7 * 24 * HOUR]
+MIN_VALIDITY = 1 * HOUR
+UNBUCKETED_EXPIRY = 1 * HOUR
+
+
+def same_url(first: float, second: float, bucket: int) -> bool:
+    bucket = bucket or UNBUCKETED_EXPIRY
+    return first // bucket == second // bucket
+
+def hit_rate(bucket: int, interval: int, samples: int) -> float:
+    hits = 0
+    for _ in range(samples):
+        first = random.uniform(0, 30 * 24 * HOUR)
+        hits += same_url(first, first + interval, bucket)
+    return hits / samples
+
+def duration(seconds: int) -> str:
+    return f"{seconds / HOUR:g}h" if seconds >= HOUR else f"{seconds // 60}m"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'bucket':>8} {'expires':>8} | " + " ".join(f"{duration(i):>7}" for i in REPLAY_INTERVALS))
+    for bucket in BUCKETS:
+        expires = UNBUCKETED_EXPIRY if bucket == 0 else min(bucket + MIN_VALIDITY, 7 * 24 * HOUR)
+        rates = [hit_rate(bucket, interval, args.samples) for interval in REPLAY_INTERVALS]
+        label = "none" if bucket == 0 else duration(bucket)
+        print(f"{label:>8} {duration(expires):>8} | " + " ".join(f"{rate:7.1%}" for rate in rates))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Compares JSON encoders and response encodings on `GET /tracks` payloads of realistic sizes.
+
+Usage (from the backend directory): python benchmarks/serialization_benchmark.py [--iterations N]"""
+
+import argparse
+import json
+import os
+import secrets
+import sys
+import time
+
+os.environ.setdefault("EMAIL_PORT", "465")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from webapp.middleware import serialization
+
+
+LIBRARY_SIZES = [(5, 20), (20, 50), (50, 200)]
+
+
+def presigned_url(track_id: int) -> str:
+    return (
+        f"https://hoot-bucket.s3.amazonaws.com/user_42/track_{secrets.token_hex(16)}.mp3"
+        "?response-cache-control=private%2C%20max-age%3D604800%2C%20immutable&response-content-type=audio%2Fmpeg"
+        "&X-Amz-Algorithm=AWS4-HMAC-SHA256&X-Amz-Credential=AKIAEXAMPLEEXAMPLE%2F20260101%2Feu-west-3%2Fs3%2Faws4_request"
+        f"&X-Amz-Date=20260101T000000Z&X-Amz-Expires=25200&X-Amz-SignedHeaders=host&X-Amz-Signature={secrets.token_hex(32)}"
+    )
+
+def library(playlists: int, tracks_per_playlist: int):
+    track_id = 0
+    result = {}
+    for playlist in range(playlists):
+        result[f"Playlist {playlist}"] = []
+        for _ in range(tracks_per_playlist):
+            track_id += 1
+            result[f"Playlist {playlist}"].append({
+                "id": track_id,
+                "name": f"Ambience loop {track_id}",
+                "size": 4 * 1024 * 1024 + track_id,
+                "source": presigned_url(track_id),
+                "source_expiration": 1767225600.0,
+            })
+    return result
+
+def timed(func, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = func()
+    return (time.perf_counter() - start) / iterations * 1000, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    encoders = {"json": lambda obj: json.dumps(obj, sort_keys=True, separators=(",", ":")).encode()}
+    if serialization.orjson is not None:
+        encoders["orjson"] = lambda obj: serialization.orjson.dumps(obj, option=serialization.OrjsonProvider.options)
+
+    for playlists, tracks_per_playlist in LIBRARY_SIZES:
+        payload = library(playlists, tracks_per_playlist)
+        print(f"{playlists} playlists x {tracks_per_playlist} tracks:")
+        for name, encoder in encoders.items():
+            elapsed, body = timed(lambda: encoder(payload), args.iterations)
+            print(f"  encode {name:>8}: {elapsed:7.2f} ms, {len(body) / 1024:8.1f} KiB")
+        for name, compressor in serialization.available_encodings().items():
+            elapsed, compressed = timed(lambda: compressor(body), args.iterations)
+            print(f"  {name:>15}: {elapsed:7.2f} ms, {len(compressed) / 1024:8.1f} KiB ({len(compressed) / len(body):.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Measures the cold-start import time of the app and the memory used by a dyno's gunicorn workers,
+comparing the lazy import path against eagerly importing every heavy module and client.
+
+Usage (from the backend directory): python benchmarks/startup_benchmark.py [--workers N] [--runs N]"""
+
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV = {
+    **os.environ,
+    "EMAIL_PORT": os.getenv("EMAIL_PORT", "465"),
+    "HOOT_DB_ENGINE": os.getenv("HOOT_DB_ENGINE", "postgresql"),
+    "HOOT_DB_DRIVER": os.getenv("HOOT_DB_DRIVER", "psycopg2"),
+    "HOOT_DB_PASSWORD": os.getenv("HOOT_DB_PASSWORD", "benchmark"),
+}
+
+IMPORT_SNIPPETS = {
+    "lazy": "import app",
+    "eager": "import app; from webapp.services import clients; clients.preload_modules(); clients.s3_client()",
+}
+
+
+def import_time(snippet: str, runs: int):
+    code = f"import time; start = time.perf_counter(); {snippet}; print(time.perf_counter() - start)"
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=BACKEND_DIR, env=ENV)
+        timings.append(float(output.decode().strip().splitlines()[-1]) * 1000)
+    return statistics.median(timings)
+
+def memory_kb(pid: int):
+    """Returns the (RSS, PSS) of a process in KiB. PSS splits shared pages between the processes sharing them."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key] = int(value.split()[0])
+    return values["Rss"], values["Pss"]
+
+def worker_memory(preload: bool, workers: int):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "--config", "gunicorn.conf.py", "--bind", "127.0.0.1:0"],
+        cwd=BACKEND_DIR,
+        env={**ENV, "WEB_CONCURRENCY": str(workers), "HOOT_GUNICORN_PRELOAD": "1" if preload else "0"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        children = []
+        deadline = time.time() + 30
+        while len(children) < workers and time.time() < deadline:
+            time.sleep(0.5)
+            with open(f"/proc/{process.pid}/task/{process.pid}/children", "r") as f:
+                children = [int(pid) for pid in f.read().split()]
+        # Give the workers a moment to finish importing everything
+        time.sleep(2)
+        usage = [memory_kb(pid) for pid in children]
+        master = memory_kb(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+
+    return master, usage
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print("Import time (median):")
+    for name, snippet in IMPORT_SNIPPETS.items():
+        print(f"  {name:>6}: {import_time(snippet, args.runs):8.1f} ms")
+
+    print(f"Gunicorn memory with {args.workers} workers:")
+    for preload in (False, True):
+        master, usage = worker_memory(preload, args.workers)
+        total_pss = master[1] + sum(pss for _, pss in usage)
+        print(
+            f"  preload={'on ' if preload else 'off'}: "
+            f"worker RSS {statistics.mean(rss for rss, _ in usage) / 1024:6.1f} MiB, "
+            f"worker PSS {statistics.mean(pss for _, pss in usage) / 1024:6.1f} MiB, "
+            f"dyno PSS {total_pss / 1024:6.1f} MiB"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 import os
 
-import boto3
 import dotenv
 
 dotenv.load_dotenv()
@@ -17,6 +16,17 @@ DB_SERVER = os.getenv("HOOT_DB_SERVER")
 DB_NAME = os.getenv("HOOT_DB_NAME")
 DB_ENGINE = os.getenv("HOOT_DB_ENGINE")
 DB_DRIVER = os.getenv("HOOT_DB_DRIVER")
+DB_REPLICA_URL = os.getenv("HOOT_DB_REPLICA_URL")
+DB_POOL_SIZE = int(os.getenv("HOOT_DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("HOOT_DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(os.getenv("HOOT_DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("HOOT_DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("HOOT_DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("HOOT_DB_STATEMENT_TIMEOUT_MS", "15000"))
+# Set when connecting through PgBouncer in transaction pooling mode
+DB_PGBOUNCER = os.getenv("HOOT_DB_PGBOUNCER", "0") == "1"
+# Optional shared store used by caches and rate limits across workers
+REDIS_URL = os.getenv("HOOT_REDIS_URL")
 PATREON_CLIENT_ID = os.getenv("PATREON_CLIENT_ID")
 PATREON_CLIENT_SECRET = os.getenv("PATREON_CLIENT_SECRET")
 PATREON_WEBHOOKS_SECRET = os.getenv("PATREON_WEBHOOKS_SECRET")
@@ -29,9 +39,114 @@ EMAIL_NAME = os.getenv("EMAIL_NAME")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "prod")
 WEBSITE = os.getenv("WEBSITE")
 
-S3_CLIENT = boto3.client(
-    "s3",
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name="eu-west-3"
-)
+# Requests must finish within REQUEST_DEADLINE seconds (TRANSFER_DEADLINE for uploads and imports). Calls to
+# external services get whatever is left, up to their own timeout. Retries of each service are only
+# allowed while they stay under RETRY_BUDGET_RATIO of its calls (plus MIN_PER_SECOND).
+REQUEST_DEADLINE = float(os.getenv("HOOT_REQUEST_DEADLINE", "20"))
+TRANSFER_DEADLINE = float(os.getenv("HOOT_TRANSFER_DEADLINE", "900"))
+CONNECT_TIMEOUT = float(os.getenv("HOOT_CONNECT_TIMEOUT", "3"))
+S3_ENDPOINT_URL = os.getenv("HOOT_S3_ENDPOINT_URL")
+S3_READ_TIMEOUT = float(os.getenv("HOOT_S3_READ_TIMEOUT", "15"))
+S3_MAX_ATTEMPTS = int(os.getenv("HOOT_S3_MAX_ATTEMPTS", "3"))
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("HOOT_S3_MAX_POOL_CONNECTIONS", "32"))
+PATREON_TIMEOUT = float(os.getenv("HOOT_PATREON_TIMEOUT", "5"))
+EMAIL_TIMEOUT = float(os.getenv("HOOT_EMAIL_TIMEOUT", "10"))
+REDIS_TIMEOUT = float(os.getenv("HOOT_REDIS_TIMEOUT", "0.5"))
+RETRY_BUDGET_RATIO = float(os.getenv("HOOT_RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("HOOT_RETRY_BUDGET_MIN_PER_SECOND", "1"))
+
+# Per-request SQL query checks ("off", "warn" or "raise")
+QUERY_CHECKS = os.getenv("HOOT_QUERY_CHECKS", "off" if ENVIRONMENT == "prod" else "warn")
+QUERY_N_PLUS_ONE_THRESHOLD = int(os.getenv("HOOT_QUERY_N_PLUS_ONE_THRESHOLD", "3"))
+
+# Migrations fail rather than wait longer than this for a lock, and statements time out after
+# MIGRATION_STATEMENT_TIMEOUT_MS (0 disables the timeout)
+MIGRATION_LOCK_TIMEOUT_MS = int(os.getenv("HOOT_MIGRATION_LOCK_TIMEOUT_MS", "5000"))
+MIGRATION_STATEMENT_TIMEOUT_MS = int(os.getenv("HOOT_MIGRATION_STATEMENT_TIMEOUT_MS", "0"))
+
+# Presigned URLs are identical within each bucket, so browsers can cache the audio they point to
+PRESIGN_BUCKET_SECONDS = int(os.getenv("HOOT_PRESIGN_BUCKET_SECONDS", str(6 * 60 * 60)))
+PRESIGN_MIN_VALIDITY_SECONDS = int(os.getenv("HOOT_PRESIGN_MIN_VALIDITY_SECONDS", str(60 * 60)))
+PRESIGN_CACHE_CONTROL = os.getenv("HOOT_PRESIGN_CACHE_CONTROL", "private, max-age=604800, immutable")
+
+# Lifetime of the presigned URLs included in library exports (7 days is the maximum S3 allows)
+EXPORT_URL_EXPIRATION = int(os.getenv("HOOT_EXPORT_URL_EXPIRATION", str(7 * 24 * 60 * 60)))
+
+# Imports from URLs: large files from sources that support range requests are fetched in parallel parts
+IMPORT_TIMEOUT = int(os.getenv("HOOT_IMPORT_TIMEOUT", "60"))
+IMPORT_PART_SIZE = int(os.getenv("HOOT_IMPORT_PART_SIZE", str(16 * 1024 * 1024)))
+IMPORT_PARALLELISM = int(os.getenv("HOOT_IMPORT_PARALLELISM", "4"))
+
+# Number of objects copied at once when a shared playlist is cloned into separate copies
+SHARE_COPY_PARALLELISM = int(os.getenv("HOOT_SHARE_COPY_PARALLELISM", "8"))
+
+# Uploads of many files in one request: at most MAX_FILES files, uploaded PARALLELISM at a time
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("HOOT_UPLOAD_BATCH_MAX_FILES", "200"))
+UPLOAD_BATCH_PARALLELISM = int(os.getenv("HOOT_UPLOAD_BATCH_PARALLELISM", "8"))
+
+# Resumable uploads: every chunk but the last is CHUNK_SIZE bytes (S3 parts can't be smaller than 5 MiB).
+# Sessions that receive nothing for SESSION_TTL seconds are aborted.
+UPLOAD_CHUNK_SIZE = max(int(os.getenv("HOOT_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+UPLOAD_SESSION_TTL = int(os.getenv("HOOT_UPLOAD_SESSION_TTL", str(24 * 60 * 60)))
+
+# Optional relay serving audio through a local disk cache of at most CACHE_BYTES. Tracks' sources point at
+# RELAY_URL (the base URL of a server running this app) when it and RELAY_SECRET are set. Clients waiting for
+# an object that is being fetched give up after STALL_SECONDS without progress.
+RELAY_URL = os.getenv("HOOT_RELAY_URL")
+RELAY_SECRET = os.getenv("HOOT_RELAY_SECRET")
+RELAY_CACHE_DIR = os.getenv("HOOT_RELAY_CACHE_DIR", "relay_cache")
+RELAY_CACHE_BYTES = int(os.getenv("HOOT_RELAY_CACHE_BYTES", str(5 * 1024 * 1024 * 1024)))
+RELAY_STALL_SECONDS = float(os.getenv("HOOT_RELAY_STALL_SECONDS", "30"))
+
+# Serialized library snapshots. Without a shared store, other workers may serve a stale
+# snapshot for up to LIBRARY_CACHE_LOCAL_TTL seconds after a change.
+LIBRARY_CACHE_ENTRIES = int(os.getenv("HOOT_LIBRARY_CACHE_ENTRIES", "256"))
+LIBRARY_CACHE_TTL = int(os.getenv("HOOT_LIBRARY_CACHE_TTL", "3600"))
+LIBRARY_CACHE_LOCAL_TTL = int(os.getenv("HOOT_LIBRARY_CACHE_LOCAL_TTL", "10"))
+
+# Admission control: token buckets per user and per client IP hold up to BURST tokens and refill at RATE
+# tokens per second. Each request takes as many tokens as its route costs. Set TRUSTED_PROXIES to the number of reverse
+# proxies in front of the app so the client IP is read from X-Forwarded-For.
+RATE_LIMITS = os.getenv("HOOT_RATE_LIMITS", "1") == "1"
+RATE_LIMIT_USER_BURST = float(os.getenv("HOOT_RATE_LIMIT_USER_BURST", "100"))
+RATE_LIMIT_USER_RATE = float(os.getenv("HOOT_RATE_LIMIT_USER_RATE", "2"))
+RATE_LIMIT_IP_BURST = float(os.getenv("HOOT_RATE_LIMIT_IP_BURST", "200"))
+RATE_LIMIT_IP_RATE = float(os.getenv("HOOT_RATE_LIMIT_IP_RATE", "4"))
+MAX_CONCURRENT_UPLOADS = int(os.getenv("HOOT_MAX_CONCURRENT_UPLOADS", "2"))
+# In-flight slots of workers that died without releasing them are reclaimed after this long
+CONCURRENCY_LEASE_SECONDS = int(os.getenv("HOOT_CONCURRENCY_LEASE_SECONDS", "3600"))
+TRUSTED_PROXIES = int(os.getenv("HOOT_TRUSTED_PROXIES", "1" if ENVIRONMENT == "prod" else "0"))
+
+# Playback events are counted in memory and written to track_stats every FLUSH_INTERVAL seconds.
+# Events for new tracks are dropped while MAX_BUFFERED counters, or MAX_BUFFERED_PER_USER counters of the
+# same user, are waiting to be written.
+EVENTS_FLUSH_INTERVAL = float(os.getenv("HOOT_EVENTS_FLUSH_INTERVAL", "5"))
+EVENTS_MAX_BUFFERED = int(os.getenv("HOOT_EVENTS_MAX_BUFFERED", "50000"))
+EVENTS_MAX_BUFFERED_PER_USER = int(os.getenv("HOOT_EVENTS_MAX_BUFFERED_PER_USER", "1000"))
+EVENTS_MAX_BATCH = int(os.getenv("HOOT_EVENTS_MAX_BATCH", "500"))
+
+# Background purge of deleted tracks' objects
+PURGE_INTERVAL_SECONDS = float(os.getenv("HOOT_PURGE_INTERVAL_SECONDS", "60"))
+PURGE_BATCH_SIZE = int(os.getenv("HOOT_PURGE_BATCH_SIZE", "1000"))
+PURGE_MAX_RETRIES = int(os.getenv("HOOT_PURGE_MAX_RETRIES", "3"))
+
+# Background cleanup of unverified users, expired verification codes, expired session files and expired
+# upload sessions, every INTERVAL seconds (0 disables it) in batches of BATCH_SIZE rows or files with a
+# pause between batches
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("HOOT_MAINTENANCE_INTERVAL_SECONDS", "3600"))
+MAINTENANCE_BATCH_SIZE = int(os.getenv("HOOT_MAINTENANCE_BATCH_SIZE", "500"))
+MAINTENANCE_PAUSE_SECONDS = float(os.getenv("HOOT_MAINTENANCE_PAUSE_SECONDS", "0.2"))
+UNVERIFIED_USER_DAYS = float(os.getenv("HOOT_UNVERIFIED_USER_DAYS", "7"))
+
+# Response compression (a negative minimum size disables it)
+COMPRESSION_MIN_SIZE = int(os.getenv("HOOT_COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("HOOT_COMPRESSION_GZIP_LEVEL", "5"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("HOOT_COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("HOOT_COMPRESSION_ZSTD_LEVEL", "6"))
+
+# Sampling profiler for slow or randomly selected requests
+PROFILE_SLOW_MS = float(os.getenv("HOOT_PROFILE_SLOW_MS")) if os.getenv("HOOT_PROFILE_SLOW_MS") else None
+PROFILE_SAMPLE_RATE = float(os.getenv("HOOT_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("HOOT_PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("HOOT_PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("HOOT_PROFILE_MAX_FILES", "200"))
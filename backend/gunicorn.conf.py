@@ -0,0 +1,53 @@
+import os
+
+
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+preload_app = os.getenv("HOOT_GUNICORN_PRELOAD", "1") == "1"
+
+# Almost all of the time spent in a request is spent waiting on S3, Patreon, SMTP or remote downloads.
+# "gthread" serves `threads` requests per worker with no extra dependencies; "gevent" serves
+# `worker_connections` requests per worker using greenlets (requires gevent and psycogreen).
+worker_class = os.getenv("HOOT_GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("HOOT_GUNICORN_THREADS", "8"))
+worker_connections = int(os.getenv("HOOT_GUNICORN_WORKER_CONNECTIONS", "100"))
+timeout = int(os.getenv("HOOT_GUNICORN_TIMEOUT", "120"))
+
+if worker_class == "gevent":
+    # Patch before the app (and its thread locals, sockets and DB driver) is imported by the master
+    from gevent import monkey
+    monkey.patch_all()
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+
+def on_starting(server):
+    # With preload_app the master has already imported the app; import the heavy modules
+    # too so that workers share them copy-on-write instead of each importing their own copy.
+    if preload_app:
+        from webapp.services import clients
+        clients.preload_modules()
+
+def post_fork(server, worker):
+    # Connections opened by the master must never be reused by a worker
+    if preload_app:
+        from webapp.models import db
+        with server.app.wsgi().app_context():
+            # The replica's engine too, when one is configured
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+def worker_exit(server, worker):
+    # Write the playback events this worker counted but hasn't flushed yet
+    from webapp.services import events_service
+    try:
+        with server.app.wsgi().app_context():
+            events_service.flush()
+    except Exception:
+        server.log.exception("Couldn't flush playback events")
+
+def post_worker_init(worker):
+    # Session files are local to each host, so every host needs a cleaner; the first worker to get there sweeps them
+    from webapp.services import maintenance_service, purge_service
+    maintenance_service.start_worker(worker.wsgi)
+    # Tracks deleted before this worker started are purged without waiting for another deletion
+    purge_service.start_purger(worker.wsgi)
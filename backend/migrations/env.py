@@ -1,10 +1,13 @@
 import logging
 from logging.config import fileConfig
 
+import sqlalchemy as sa
 from flask import current_app
 
 from alembic import context
 
+import config as app_config
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -16,6 +19,10 @@ logger = logging.getLogger('alembic.env')
 
 
 def get_engine():
+    # `flask db upgrade -x database_url=...` migrates another database, e.g. for rehearsals
+    database_url = context.get_x_argument(as_dictionary=True).get('database_url')
+    if database_url:
+        return sa.create_engine(database_url, poolclass=sa.pool.NullPool)
     try:
         # this works with Flask-SQLAlchemy<3 and Alchemical
         return current_app.extensions['migrate'].db.get_engine()
@@ -45,6 +52,15 @@ target_db = current_app.extensions['migrate'].db
 # ... etc.
 
 
+# Indexes on expressions or with PostgreSQL-only operator classes can't be declared on the models, so
+# autogenerate leaves them to the migrations that create them
+MIGRATION_MANAGED_INDEXES = {'ix_tracks_object_key', 'ix_tracks_owner_id_name_trgm'}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    return not (type_ == 'index' and name in MIGRATION_MANAGED_INDEXES)
+
+
 def get_metadata():
     if hasattr(target_db, 'metadatas'):
         return target_db.metadatas[None]
@@ -65,7 +81,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -97,9 +114,20 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            # Give up on locks that can't be taken quickly rather than blocking every query queued behind them,
+            # and make the migration easy to find in pg_stat_activity
+            connection.execute(sa.text(f"SET lock_timeout = {app_config.MIGRATION_LOCK_TIMEOUT_MS}"))
+            connection.execute(sa.text(f"SET statement_timeout = {app_config.MIGRATION_STATEMENT_TIMEOUT_MS}"))
+            connection.execute(sa.text("SET application_name = 'hoot-migration'"))
+            connection.commit()
+
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
+            include_object=include_object,
+            # A failed migration only rolls back itself, and locks are released after each one
+            transaction_per_migration=True,
             **conf_args
         )
 
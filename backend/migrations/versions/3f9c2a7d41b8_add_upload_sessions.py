@@ -0,0 +1,48 @@
+"""Add upload sessions
+
+Revision ID: 3f9c2a7d41b8
+Revises: 538060eb51a9
+Create Date: 2026-10-19 21:14:05.318274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d41b8'
+down_revision = '538060eb51a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('upload_sessions',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('track_name', sa.String(length=64), nullable=False),
+    sa.Column('playlists', sa.JSON(), nullable=False),
+    sa.Column('filename', sa.String(length=256), nullable=False),
+    sa.Column('mime', sa.String(length=128), nullable=True),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('received', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('chunk_size', sa.Integer(), nullable=False),
+    sa.Column('object_key', sa.String(length=128), nullable=False),
+    sa.Column('multipart_upload_id', sa.String(length=256), nullable=False),
+    sa.Column('parts', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('upload_sessions', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_upload_sessions_expires_at'), ['expires_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_upload_sessions_owner_id'), ['owner_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('upload_sessions', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_sessions_owner_id'))
+        batch_op.drop_index(batch_op.f('ix_upload_sessions_expires_at'))
+
+    op.drop_table('upload_sessions')
@@ -0,0 +1,37 @@
+"""Add track soft deletion
+
+Revision ID: 538060eb51a9
+Revises: 80ddccd35af5
+Create Date: 2026-10-19 20:02:47.551093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from webapp.models import online_migrations
+
+
+# revision identifiers, used by Alembic.
+revision = '538060eb51a9'
+down_revision = '80ddccd35af5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tracks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    online_migrations.create_index_concurrently(
+        'ix_tracks_deleted_at',
+        'tracks',
+        ['deleted_at'],
+        where='deleted_at IS NOT NULL'
+    )
+
+
+def downgrade():
+    online_migrations.drop_index_concurrently('ix_tracks_deleted_at', 'tracks')
+
+    with op.batch_alter_table('tracks', schema=None) as batch_op:
+        batch_op.drop_column('deleted_at')
@@ -0,0 +1,62 @@
+"""Unique playlist names per owner
+
+Revision ID: 80ddccd35af5
+Revises: ce1436f92110
+Create Date: 2026-10-19 19:30:12.104253
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from webapp.models import online_migrations
+
+
+# revision identifiers, used by Alembic.
+revision = '80ddccd35af5'
+down_revision = 'ce1436f92110'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Merge playlists that were duplicated by concurrent uploads into the oldest one
+    op.execute("""
+        UPDATE playlist_tracks SET playlist_id = (
+            SELECT MIN(p2.id) FROM playlists p1
+            JOIN playlists p2 ON p1.owner_id = p2.owner_id AND p1.name = p2.name
+            WHERE p1.id = playlist_tracks.playlist_id
+        )
+        WHERE playlist_id IN (
+            SELECT p1.id FROM playlists p1
+            JOIN playlists p2 ON p1.owner_id = p2.owner_id AND p1.name = p2.name AND p2.id < p1.id
+        )
+    """)
+    # Semi-joins rather than NOT IN, which PostgreSQL can't hash on large tables
+    op.execute("""
+        DELETE FROM playlists WHERE EXISTS (
+            SELECT 1 FROM playlists p2
+            WHERE p2.owner_id = playlists.owner_id AND p2.name = playlists.name AND p2.id < playlists.id
+        )
+    """)
+    op.execute("""
+        DELETE FROM playlist_tracks WHERE EXISTS (
+            SELECT 1 FROM playlist_tracks pt2
+            WHERE pt2.playlist_id = playlist_tracks.playlist_id AND pt2.track_id = playlist_tracks.track_id
+                AND pt2.id < playlist_tracks.id
+        )
+    """)
+
+    online_migrations.create_unique_constraint_concurrently('uq_playlists_owner_id_name', 'playlists', ['owner_id', 'name'])
+    online_migrations.create_unique_constraint_concurrently(
+        'uq_playlist_tracks_playlist_id_track_id',
+        'playlist_tracks',
+        ['playlist_id', 'track_id']
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('playlist_tracks', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_playlist_tracks_playlist_id_track_id', type_='unique')
+
+    with op.batch_alter_table('playlists', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_playlists_owner_id_name', type_='unique')
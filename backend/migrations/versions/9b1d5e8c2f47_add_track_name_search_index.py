@@ -0,0 +1,41 @@
+"""Add track name search index
+
+Revision ID: 9b1d5e8c2f47
+Revises: 3f9c2a7d41b8
+Create Date: 2026-10-19 22:03:41.772519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from webapp.models import online_migrations
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1d5e8c2f47'
+down_revision = '3f9c2a7d41b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Search falls back to a plain LIKE scan on other databases
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # btree_gin lets the trigram index lead with owner_id, so searches only visit the user's own tracks
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+    online_migrations.create_index_concurrently(
+        'ix_tracks_owner_id_name_trgm',
+        'tracks',
+        ['owner_id', sa.text('lower(name) gin_trgm_ops')],
+        postgresql_using='gin'
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    online_migrations.drop_index_concurrently('ix_tracks_owner_id_name_trgm', 'tracks')
@@ -0,0 +1,46 @@
+"""Add playlist sharing
+
+Revision ID: a2f94c17e0d5
+Revises: d8a3f61b7c20
+Create Date: 2026-10-20 01:14:37.208146
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from webapp.models import online_migrations
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2f94c17e0d5'
+down_revision = 'd8a3f61b7c20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('playlists', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('share_code', sa.String(length=32), nullable=True))
+
+    online_migrations.create_index_concurrently(
+        'ix_playlists_share_code',
+        'playlists',
+        ['share_code'],
+        unique=True,
+        where='share_code IS NOT NULL'
+    )
+    # Objects can be shared by several tracks: the purger and the garbage collector look tracks up by object
+    # key, in bytewise order like S3 lists them
+    online_migrations.create_index_concurrently(
+        'ix_tracks_object_key',
+        'tracks',
+        [sa.text('object_key COLLATE "C"')] if op.get_bind().dialect.name == 'postgresql' else ['object_key']
+    )
+
+
+def downgrade():
+    online_migrations.drop_index_concurrently('ix_tracks_object_key', 'tracks')
+    online_migrations.drop_index_concurrently('ix_playlists_share_code', 'playlists')
+
+    with op.batch_alter_table('playlists', schema=None) as batch_op:
+        batch_op.drop_column('share_code')
@@ -0,0 +1,33 @@
+"""Add track stats
+
+Revision ID: c4e7a9f0b312
+Revises: 9b1d5e8c2f47
+Create Date: 2026-10-19 22:41:18.046327
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e7a9f0b312'
+down_revision = '9b1d5e8c2f47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('track_stats',
+    sa.Column('track_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('plays', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('skips', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('stops', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('last_event_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['track_id'], ['tracks.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('track_id', 'day')
+    )
+
+
+def downgrade():
+    op.drop_table('track_stats')
@@ -0,0 +1,34 @@
+"""Add user lookup indexes
+
+Revision ID: d8a3f61b7c20
+Revises: c4e7a9f0b312
+Create Date: 2026-10-19 23:58:02.513904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from webapp.models import online_migrations
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a3f61b7c20'
+down_revision = 'c4e7a9f0b312'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Users are looked up by email on login and signup, and by verification code when verifying
+    online_migrations.create_index_concurrently('ix_users_email', 'users', ['email'])
+    online_migrations.create_index_concurrently(
+        'ix_users_verification_code',
+        'users',
+        ['verification_code'],
+        where='verification_code IS NOT NULL'
+    )
+
+
+def downgrade():
+    online_migrations.drop_index_concurrently('ix_users_verification_code', 'users')
+    online_migrations.drop_index_concurrently('ix_users_email', 'users')
@@ -0,0 +1,114 @@
+import io
+import itertools
+import os
+import sys
+import tempfile
+import wave
+
+import pytest
+
+_database = os.path.join(tempfile.mkdtemp(prefix="hoot-tests-"), "hoot.db")
+os.environ.update(
+    ENVIRONMENT="test",
+    DATABASE_URL=f"sqlite:///{_database}",
+    EMAIL_PORT="465",
+    HOOT_QUERY_CHECKS="raise",
+    HOOT_RATE_LIMITS="0",
+    HOOT_S3_BUCKET_NAME="hoot-tests",
+    HOOT_AWS_ACCESS_KEY_ID="testing",
+    HOOT_AWS_SECRET_ACCESS_KEY="testing",
+    HOOT_MAINTENANCE_INTERVAL_SECONDS="0",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_emails = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def app():
+    import boto3
+    from moto import mock_aws
+
+    with mock_aws():
+        import app as hoot
+        import config
+        from webapp import models
+        from webapp.services import clients
+
+        clients._clients.clear()
+        boto3.client("s3", region_name="eu-west-3").create_bucket(
+            Bucket=config.S3_BUCKET_NAME,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-3"},
+        )
+        hoot.app.config["SESSION_COOKIE_SECURE"] = False
+        with hoot.app.app_context():
+            models.db.create_all()
+        yield hoot.app
+        clients._clients.clear()
+
+
+@pytest.fixture
+def make_user(app):
+    """Creates a verified user with `playlists` playlists of `tracks` tracks each, and returns a test client
+    logged in as them."""
+    import bcrypt
+    from webapp import models
+
+    def make(playlists: int = 0, tracks: int = 0):
+        email = f"user{next(_emails)}@hoot.test"
+        with app.app_context():
+            user = models.User(
+                username=email.split("@")[0],
+                email=email,
+                password=bcrypt.hashpw(b"password1", bcrypt.gensalt(4)).decode(),
+                verified=True,
+            )
+            models.db.session.add(user)
+            models.db.session.flush()
+            for i in range(playlists):
+                playlist = models.Playlist(owner_id=user.id, name=f"playlist {i}")
+                for j in range(tracks):
+                    playlist.tracks.append(models.Track(
+                        owner_id=user.id,
+                        name=f"track {i}.{j}",
+                        size=1000,
+                        object_key=f"user_{user.id}/track_{i}_{j}.mp3",
+                    ))
+                models.db.session.add(playlist)
+            models.db.session.commit()
+
+        client = app.test_client()
+        response = client.post("/auth/login", json={"email": email, "password": "password1"})
+        assert response.status_code == 200, response.json
+        return client
+
+    return make
+
+
+@pytest.fixture
+def wav_file():
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(b"\x00\x00" * 8000)
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.fixture
+def bucket_keys(app):
+    """Returns a function listing the keys stored in the bucket, optionally under a prefix."""
+    import config
+    from webapp.services import clients
+
+    def keys(prefix: str = "") -> set[str]:
+        paginator = clients.s3_client().get_paginator("list_objects_v2")
+        return {
+            obj["Key"]
+            for page in paginator.paginate(Bucket=config.S3_BUCKET_NAME, Prefix=prefix)
+            for obj in page.get("Contents", [])
+        }
+
+    return keys
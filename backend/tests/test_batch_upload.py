@@ -0,0 +1,96 @@
+"""Uploads of many files in a single request (`POST /tracks/batch`)."""
+
+import io
+import json
+
+import pytest
+
+import config
+from webapp import models
+
+
+def _post(client, files: list[tuple[bytes, str]], tracks: list[dict]):
+    return client.post(
+        "/tracks/batch",
+        data={
+            "metadata": json.dumps({"tracks": tracks}),
+            "file": [(io.BytesIO(content), filename) for content, filename in files],
+        },
+    )
+
+def test_mixed_batch(make_user, wav_file, bucket_keys):
+    client = make_user()
+    audio = wav_file.getvalue()
+    keys = bucket_keys()
+
+    response = _post(
+        client,
+        [(audio, "a.wav"), (b"just some notes\n" * 100, "notes.txt"), (audio, "b.wav"), (audio, "c.wav")],
+        [
+            {"track_name": "a", "playlists": ["mix", "first"]},
+            {"track_name": "notes"},
+            {"track_name": "b", "playlists": ["mix"]},
+            {"track_name": "c"},
+        ],
+    )
+
+    assert response.status_code == 200, response.json
+    assert [(track["name"], track["playlists"]) for track in response.json["tracks"]] == [
+        ("a", ["first", "mix"]),
+        ("b", ["mix"]),
+        ("c", []),
+    ]
+    assert response.json["rejected"] == [{"position": 1, "filename": "notes.txt", "error": "Invalid file type (only audio allowed)"}]
+    assert len(bucket_keys() - keys) == 3
+
+    # The ids returned by the multi-row insert are the ones of the right tracks
+    library = client.get("/tracks", json={}).json
+    assert [track["name"] for track in library["mix"]] == ["a", "b"]
+    assert [track["name"] for track in library["first"]] == ["a"]
+    for track in response.json["tracks"]:
+        assert client.get(f"/tracks/{track['id']}", json={}).json["name"] == track["name"]
+
+def test_batch_over_quota(make_user, wav_file, bucket_keys, monkeypatch):
+    client = make_user()
+    audio = wav_file.getvalue()
+    # Room for one file only: the first one is uploaded before the second one is refused
+    monkeypatch.setattr(models.User, "total_storage", lambda self: len(audio) * 3 // 2)
+    keys = bucket_keys()
+
+    response = _post(client, [(audio, "a.wav"), (audio, "b.wav")], [{"track_name": "a"}, {"track_name": "b"}])
+
+    assert response.status_code == 400
+    assert response.json["error"] == "Files exceed your quota"
+    assert bucket_keys() == keys
+    assert client.get("/tracks", json={}).json == {}
+
+@pytest.mark.parametrize("tracks", [1, 3])
+def test_metadata_count_mismatch(make_user, wav_file, bucket_keys, tracks):
+    client = make_user()
+    audio = wav_file.getvalue()
+    keys = bucket_keys()
+
+    response = _post(client, [(audio, "a.wav"), (audio, "b.wav")], [{"track_name": f"t{i}"} for i in range(tracks)])
+
+    assert response.status_code == 400
+    assert response.json["error"] == "Invalid metadata"
+    assert bucket_keys() == keys
+
+def test_too_many_files(make_user, wav_file, bucket_keys, monkeypatch):
+    client = make_user()
+    audio = wav_file.getvalue()
+    monkeypatch.setattr(config, "UPLOAD_BATCH_MAX_FILES", 2)
+    keys = bucket_keys()
+
+    response = _post(client, [(audio, f"{i}.wav") for i in range(3)], [{"track_name": str(i)} for i in range(3)])
+
+    assert response.status_code == 400
+    assert response.json["error"] == "Too many files (at most 2)"
+    assert bucket_keys() == keys
+
+def test_not_multipart(make_user):
+    client = make_user()
+
+    response = client.post("/tracks/batch", json={"tracks": []})
+
+    assert response.status_code == 400
@@ -0,0 +1,70 @@
+"""Reconciling the bucket against the tracks table (`flask tracks gc`)."""
+
+import datetime
+
+import config
+from webapp import models
+from webapp.services import clients, gc_service
+
+
+def _user(name: str) -> models.User:
+    user = models.User(username=name, email=f"{name}@hoot.test", password="-", verified=True)
+    models.db.session.add(user)
+    models.db.session.flush()
+    return user
+
+def _track(owner: models.User, object_key: str, deleted: bool = False) -> models.Track:
+    track = models.Track(owner_id=owner.id, name=object_key, size=1, object_key=object_key)
+    if deleted:
+        track.deleted_at = datetime.datetime.now(datetime.timezone.utc)
+    models.db.session.add(track)
+    return track
+
+def _collect(**kwargs) -> tuple[gc_service.GCReport, list[tuple[int, str]]]:
+    missing = []
+    report = gc_service.collect_orphans(
+        datetime.timedelta(0),
+        on_missing=lambda owner_id, object_key: missing.append((owner_id, object_key)),
+        **kwargs,
+    )
+    return report, missing
+
+def test_missing_objects_are_reported_with_their_track_owner(app):
+    with app.app_context():
+        publisher, cloner, empty = _user("gc-publisher"), _user("gc-cloner"), _user("gc-empty")
+        shared_key = f"user_{publisher.id}/shared.wav"
+        stored_key = f"user_{publisher.id}/stored.wav"
+        clients.s3_client().put_object(Bucket=config.S3_BUCKET_NAME, Key=stored_key, Body=b"x")
+        _track(publisher, stored_key)
+        # The publisher deleted the track, but a clone still references its object
+        _track(publisher, shared_key, deleted=True)
+        _track(cloner, shared_key)
+        _track(empty, f"user_{empty.id}/lost.wav")
+        models.db.session.commit()
+
+        _, missing = _collect(dry_run=True)
+
+        ours = {publisher.id, cloner.id, empty.id}
+        assert sorted(entry for entry in missing if entry[0] in ours) == sorted([
+            (cloner.id, shared_key),
+            (empty.id, f"user_{empty.id}/lost.wav"),
+        ])
+
+def test_orphans_are_deleted(app, bucket_keys):
+    with app.app_context():
+        owner = _user("gc-orphans")
+        prefix = f"user_{owner.id}/"
+        for name in ("kept.wav", "orphan.wav", "purged.wav"):
+            clients.s3_client().put_object(Bucket=config.S3_BUCKET_NAME, Key=prefix + name, Body=b"x")
+        _track(owner, prefix + "kept.wav")
+        # Objects of deleted tracks are left to the purger
+        _track(owner, prefix + "purged.wav", deleted=True)
+        models.db.session.commit()
+
+        report, _ = _collect(dry_run=True)
+        assert bucket_keys(prefix) == {prefix + "kept.wav", prefix + "orphan.wav", prefix + "purged.wav"}
+        assert report.orphaned_objects >= 1
+
+        _collect()
+
+    assert bucket_keys(prefix) == {prefix + "kept.wav", prefix + "purged.wav"}
@@ -0,0 +1,47 @@
+"""Query budgets of the hottest routes. The app runs with `HOOT_QUERY_CHECKS=raise`, so a route that goes over
+its declared budget or lazy-loads in a loop fails too, on top of the counts asserted here."""
+
+import json
+
+import pytest
+
+from webapp.middleware.queries import count_queries
+
+
+@pytest.mark.parametrize("playlists, tracks", [(0, 0), (1, 5), (10, 20)])
+def test_get_tracks(make_user, playlists, tracks):
+    client = make_user(playlists, tracks)
+
+    with count_queries(3, label="GET /tracks"):
+        response = client.get("/tracks", json={})
+
+    assert response.status_code == 200
+    assert sum(len(playlist) for playlist in response.json.values()) == playlists * tracks
+
+@pytest.mark.parametrize("playlists", [1, 10])
+def test_get_track(make_user, playlists):
+    client = make_user(playlists, 1)
+    track_id = client.get("/tracks", json={}).json["playlist 0"][0]["id"]
+
+    with count_queries(5, label="GET /tracks/<id>"):
+        response = client.get(f"/tracks/{track_id}", json={})
+
+    assert response.status_code == 200
+
+@pytest.mark.parametrize("playlists", [0, 1, 10])
+def test_add_track(make_user, wav_file, playlists):
+    client = make_user(2, 10)
+    names = [f"new playlist {i}" for i in range(playlists)]
+
+    # Outside PostgreSQL, new playlists are inserted one at a time
+    with count_queries(6 + len(names), label="POST /tracks/new"):
+        response = client.post(
+            "/tracks/new",
+            data={
+                "metadata": json.dumps({"track_name": "new track", "playlists": names}),
+                "file": (wav_file, "new track.wav"),
+            },
+        )
+
+    assert response.status_code == 200, response.json
+    assert sorted(response.json["playlists"]) == sorted(names)
@@ -0,0 +1,130 @@
+"""The caching audio relay (`/relay/<key>`)."""
+
+import os
+import urllib.parse
+import uuid
+
+import pytest
+
+import config
+from webapp.services import clients, relay_service
+
+
+SIZE = 100_000
+
+
+@pytest.fixture
+def relay(app, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "RELAY_URL", "http://localhost")
+    monkeypatch.setattr(config, "RELAY_SECRET", "secret")
+    monkeypatch.setattr(config, "RELAY_CACHE_DIR", str(tmp_path / "relay_cache"))
+    monkeypatch.setattr(config, "RELAY_STALL_SECONDS", 5)
+    monkeypatch.setattr(relay_service, "_cached_bytes", None)
+    return app.test_client()
+
+def _stored_object(size: int = SIZE) -> tuple[str, bytes]:
+    key = f"user_0/track_{uuid.uuid4()}.mp3"
+    body = os.urandom(size)
+    clients.s3_client().put_object(Bucket=config.S3_BUCKET_NAME, Key=key, Body=body, ContentType="audio/mpeg")
+    return key, body
+
+def _path(key: str) -> str:
+    url = urllib.parse.urlsplit(relay_service.relay_url(key)[0])
+    return f"{url.path}?{url.query}"
+
+def test_miss_then_hit(relay):
+    key, body = _stored_object()
+
+    first = relay.get(_path(key))
+    assert first.status_code == 200
+    assert first.headers["X-Relay-Cache"] == "miss"
+    assert first.headers["Content-Type"] == "audio/mpeg"
+    assert first.data == body
+
+    second = relay.get(_path(key))
+    assert second.status_code == 200
+    assert second.headers["X-Relay-Cache"] == "hit"
+    assert second.data == body
+
+@pytest.mark.parametrize("header, start, stop", [
+    ("bytes=10-19", 10, 20),
+    ("bytes=-10", SIZE - 10, SIZE),
+    (f"bytes={SIZE - 5}-", SIZE - 5, SIZE),
+])
+def test_ranges(relay, header, start, stop):
+    key, body = _stored_object()
+
+    response = relay.get(_path(key), headers={"Range": header})
+
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes {start}-{stop - 1}/{SIZE}"
+    assert response.data == body[start:stop]
+
+def test_unsatisfiable_range(relay):
+    key, _ = _stored_object()
+
+    response = relay.get(_path(key), headers={"Range": f"bytes={SIZE}-"})
+
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{SIZE}"
+
+def test_if_none_match(relay):
+    key, _ = _stored_object()
+    etag = relay.get(_path(key)).headers["ETag"]
+
+    response = relay.get(_path(key), headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+
+def test_if_range(relay):
+    key, body = _stored_object()
+    etag = relay.get(_path(key)).headers["ETag"]
+
+    matching = relay.get(_path(key), headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert matching.status_code == 206
+    assert matching.data == body[:10]
+
+    # The client's copy is another version: the whole object is sent instead
+    other = relay.get(_path(key), headers={"Range": "bytes=0-9", "If-Range": '"another-version"'})
+    assert other.status_code == 200
+    assert other.data == body
+
+def test_signature_rejected(relay, monkeypatch):
+    key, _ = _stored_object()
+    url = urllib.parse.urlsplit(relay_service.relay_url(key)[0])
+    query = dict(urllib.parse.parse_qsl(url.query))
+
+    tampered = {**query, "signature": "0" * len(query["signature"])}
+    assert relay.get(f"{url.path}?{urllib.parse.urlencode(tampered)}").status_code == 403
+    # A valid signature for another key
+    other_key, _ = _stored_object()
+    assert relay.get(f"/relay/{other_key}?{url.query}").status_code == 403
+    expired = {"expires": "1", "signature": relay_service._signature(key, 1)}
+    assert relay.get(f"{url.path}?{urllib.parse.urlencode(expired)}").status_code == 403
+    assert relay.get(url.path).status_code == 403
+
+    monkeypatch.setattr(config, "RELAY_URL", None)
+    assert relay.get(f"{url.path}?{url.query}").status_code == 403
+
+def test_missing_object(relay):
+    response = relay.get(_path(f"user_0/track_{uuid.uuid4()}.mp3"))
+
+    assert response.status_code == 404
+
+def test_eviction(relay, monkeypatch):
+    monkeypatch.setattr(config, "RELAY_CACHE_BYTES", SIZE * 5 // 2)
+    keys = []
+    for i in range(3):
+        key, _ = _stored_object()
+        assert relay.get(_path(key)).status_code == 200
+        # Served in this order: the first one is the least recently served
+        os.utime(relay_service._path(key), (1_000_000 + i, 1_000_000 + i))
+        keys.append(key)
+
+    # Fetching the third object went over the budget, and evicted the least recently served one
+    assert relay_service.evict() == SIZE * 2
+    assert [os.path.exists(relay_service._path(key)) for key in keys] == [False, True, True]
+    assert relay.get(_path(keys[2])).headers["X-Relay-Cache"] == "hit"
+    assert relay.get(_path(keys[0])).headers["X-Relay-Cache"] == "miss"
+    assert [os.path.exists(relay_service._path(key)) for key in keys] == [True, False, True]
@@ -0,0 +1,114 @@
+"""Publishing playlists and cloning them (`/tracks/shares`), and purging objects that clones still reference."""
+
+import io
+import json
+
+import pytest
+
+from webapp import models
+from webapp.services import purge_service
+
+
+@pytest.fixture(autouse=True)
+def no_background_purge(monkeypatch):
+    # Purges run from the tests, so that they see their outcome
+    monkeypatch.setattr(purge_service, "wake_purger", lambda: None)
+
+@pytest.fixture
+def publisher(make_user, wav_file):
+    """A client whose "shared" playlist of two tracks is published. Returns it with the share code."""
+    client = make_user()
+    for name in ("first", "second"):
+        response = client.post("/tracks/new", data={
+            "metadata": json.dumps({"track_name": name, "playlists": ["shared"]}),
+            "file": (io.BytesIO(wav_file.getvalue()), f"{name}.wav"),
+        })
+        assert response.status_code == 200, response.json
+    response = client.post("/tracks/shares", json={"playlist": "shared"})
+    assert response.status_code == 200, response.json
+    return client, response.json["code"]
+
+def _object_keys(app, track_ids) -> list[str]:
+    with app.app_context():
+        return [models.db.session.get(models.Track, track_id).object_key for track_id in track_ids]
+
+def _track_ids(client, playlist: str) -> list[int]:
+    return [track["id"] for track in client.get("/tracks", json={}).json.get(playlist, [])]
+
+def _delete_and_purge(app, client, track_ids):
+    for track_id in track_ids:
+        assert client.delete(f"/tracks/{track_id}", json={}).status_code == 200
+    with app.app_context():
+        while purge_service.purge_deleted_tracks() > 0:
+            pass
+
+def test_publisher_delete_keeps_cloned_objects(app, make_user, publisher, bucket_keys):
+    publisher_client, code = publisher
+    published_ids = _track_ids(publisher_client, "shared")
+    keys = _object_keys(app, published_ids)
+    shared = make_user().get(f"/tracks/shares/{code}", json={})
+    assert shared.status_code == 200
+    assert [track["name"] for track in shared.json["tracks"]] == ["first", "second"]
+
+    client = make_user()
+    response = client.post(f"/tracks/shares/{code}/clone", json={})
+    assert response.status_code == 200, response.json
+    cloned_ids = [track["id"] for track in response.json["tracks"]]
+    # Clones reference the publisher's objects
+    assert _object_keys(app, cloned_ids) == keys
+
+    _delete_and_purge(app, publisher_client, published_ids)
+    assert set(keys) <= bucket_keys()
+    for track_id in cloned_ids:
+        assert client.get(f"/tracks/{track_id}", json={}).status_code == 200
+
+    # Once the last track referencing them is purged, the objects go too
+    _delete_and_purge(app, client, cloned_ids)
+    assert set(keys).isdisjoint(bucket_keys())
+
+def test_cloning_twice_counts_once(make_user, publisher, monkeypatch):
+    _, code = publisher
+    client = make_user()
+
+    first = client.post(f"/tracks/shares/{code}/clone", json={})
+    assert first.status_code == 200, first.json
+    used_storage = first.json["used_storage"]
+    assert used_storage == sum(track["size"] for track in first.json["tracks"])
+
+    # Even with no room left, the same objects can be added again since they don't count twice
+    monkeypatch.setattr(models.User, "total_storage", lambda self: used_storage)
+    second = client.post(f"/tracks/shares/{code}/clone", json={"playlist": "again"})
+    assert second.status_code == 200, second.json
+    assert second.json["used_storage"] == used_storage
+
+    copied = client.post(f"/tracks/shares/{code}/clone", json={"playlist": "copies", "copy": True})
+    assert copied.status_code == 400
+    assert copied.json["error"] == "The playlist exceeds your quota"
+
+def test_copies_are_independent(app, make_user, publisher, bucket_keys):
+    publisher_client, code = publisher
+    published_ids = _track_ids(publisher_client, "shared")
+    keys = _object_keys(app, published_ids)
+
+    client = make_user()
+    response = client.post(f"/tracks/shares/{code}/clone", json={"copy": True})
+    assert response.status_code == 200, response.json
+    copied_ids = [track["id"] for track in response.json["tracks"]]
+    copied_keys = _object_keys(app, copied_ids)
+    assert set(copied_keys).isdisjoint(keys)
+    with app.app_context():
+        owner_id = models.db.session.get(models.Track, copied_ids[0]).owner_id
+    assert all(key.startswith(f"user_{owner_id}/") for key in copied_keys)
+
+    _delete_and_purge(app, publisher_client, published_ids)
+    assert set(keys).isdisjoint(bucket_keys())
+    assert set(copied_keys) <= bucket_keys()
+
+def test_unpublished_playlist_cannot_be_cloned(make_user, publisher):
+    publisher_client, code = publisher
+    assert publisher_client.delete("/tracks/shares", json={"playlist": "shared"}).status_code == 200
+
+    response = make_user().post(f"/tracks/shares/{code}/clone", json={})
+
+    assert response.status_code == 400
+    assert response.json["error"] == "Invalid share code"
@@ -1,7 +1,8 @@
 __all__ = [
+    "commands",
     "models",
     "routes",
     "middleware",
 ]
 
-from . import middleware, models, routes
+from . import commands, middleware, models, routes
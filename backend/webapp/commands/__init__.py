@@ -0,0 +1,13 @@
+__all__ = [
+    "maintenance",
+    "migrations",
+    "profiles",
+    "relay",
+    "tracks",
+]
+
+from .maintenance_command import maintenance
+from .migrations_command import migrations
+from .profiles_command import profiles
+from .relay_command import relay
+from .tracks_command import tracks
@@ -0,0 +1,28 @@
+__all__ = [
+    "maintenance"
+]
+
+import datetime
+
+import click
+from flask.cli import AppGroup
+
+import config
+from ..services import maintenance_service
+
+
+maintenance = AppGroup("maintenance", help="Database and session cleanup.")
+
+@maintenance.command("run")
+@click.option("--days", default=config.UNVERIFIED_USER_DAYS, type=float, help="Delete unverified users who signed up longer ago than this.")
+def run(days):
+    """Deletes abandoned unverified users, expired verification codes, expired sessions and expired uploads."""
+    report = maintenance_service.run(datetime.timedelta(days=days))
+    click.echo(f"Deleted {report.unverified_users} unverified users")
+    click.echo(f"Cleared {report.expired_codes} expired verification codes")
+    click.echo(
+        f"Deleted {report.sessions} of {report.sessions_checked} sessions "
+        f"({report.session_bytes / 1024 / 1024:.1f} MiB)"
+    )
+    click.echo(f"Aborted {report.expired_uploads} expired upload sessions and {report.untracked_uploads} abandoned multipart uploads")
+    click.echo(f"Done in {report.duration:.1f}s")
@@ -0,0 +1,63 @@
+__all__ = [
+    "migrations"
+]
+
+import click
+import sqlalchemy as sa
+from flask.cli import AppGroup
+
+from .. import models
+from ..services import rehearsal_service
+
+
+migrations = AppGroup("migrations", help="Check that migrations can run while the app is serving requests.")
+
+def format_duration(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.1f}s"
+
+@migrations.command("rehearse")
+@click.option("--database-url", required=True, help="Scratch PostgreSQL database to rehearse on. Everything in it is dropped.")
+@click.option("--base", default=None, help="Revision to seed the data at. Defaults to the revision of the app's database.")
+@click.option("--users", default=100000, help="Number of synthetic users.")
+@click.option("--playlists", default=500000, help="Number of synthetic playlists.")
+@click.option("--tracks", default=5000000, help="Number of synthetic tracks, each in one playlist.")
+@click.option("--interval", default=0.05, help="Seconds between lock and latency samples.")
+@click.option("--yes", is_flag=True, help="Don't ask for confirmation before resetting the scratch database.")
+def rehearse(database_url, base, users, playlists, tracks, interval, yes):
+    """Applies pending migrations to a synthetic production-sized dataset and reports the locks they take."""
+    url = sa.make_url(database_url)
+    if url.render_as_string(hide_password=False) == models.db.engine.url.render_as_string(hide_password=False):
+        raise click.UsageError("Refusing to rehearse on the app's own database")
+    if not yes:
+        click.confirm(f"Everything in {url.render_as_string()} will be dropped. Continue?", abort=True)
+
+    if base is None:
+        base = rehearsal_service.current_revision()
+    click.echo(f"Seeding at revision {base or 'base'}")
+
+    reports = rehearsal_service.rehearse(
+        database_url,
+        base,
+        {"users": users, "playlists": playlists, "tracks": tracks, "playlist_tracks": tracks},
+        interval,
+        echo=click.echo,
+    )
+    if len(reports) == 0:
+        click.echo("No pending migrations")
+        return
+
+    for report in reports:
+        click.echo(f"\n{report.revision} ({report.description}): {format_duration(report.duration)}")
+        tables = sorted(set(table for table, _ in report.locks) | set(report.read_latency) | set(report.write_latency))
+        for table in tables:
+            reads_blocked = report.blocked(table, rehearsal_service.READ_BLOCKING_LOCKS)
+            writes_blocked = report.blocked(table, rehearsal_service.WRITE_BLOCKING_LOCKS)
+            click.echo(
+                f"  {table}: reads blocked {format_duration(reads_blocked)} "
+                f"(slowest {format_duration(report.read_latency.get(table, 0))}), "
+                f"writes blocked {format_duration(writes_blocked)} "
+                f"(slowest {format_duration(report.write_latency.get(table, 0))})"
+            )
+            for (name, mode), duration in sorted(report.locks.items()):
+                if name == table:
+                    click.echo(f"    {mode} held for {format_duration(duration)}")
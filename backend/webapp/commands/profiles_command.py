@@ -0,0 +1,82 @@
+__all__ = [
+    "profiles"
+]
+
+import collections
+import json
+import os
+
+import click
+from flask.cli import AppGroup
+
+import config
+from ..middleware.profiling import read_profile
+
+
+profiles = AppGroup("profiles", help="Inspect request profiles written by the profiling middleware.")
+
+def to_speedscope(name: str, stacks: collections.Counter, interval_ms: float):
+    frames, frame_indexes = [], {}
+    samples, weights = [], []
+    for stack, count in stacks.items():
+        sample = []
+        for frame_name in stack.split(";"):
+            if frame_name not in frame_indexes:
+                frame_indexes[frame_name] = len(frames)
+                frames.append({"name": frame_name})
+            sample.append(frame_indexes[frame_name])
+        samples.append(sample)
+        weights.append(count * interval_ms)
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "hoot",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+
+@profiles.command("aggregate")
+@click.option("--source", default=None, help="Directory containing the request profiles.")
+@click.option("--output", default="flamegraphs", help="Directory to write the per-endpoint flame graphs to.")
+def aggregate(source, output):
+    """Merges request profiles into one collapsed-stack file and one speedscope file per endpoint."""
+    source = source or config.PROFILE_DIR
+    if not os.path.isdir(source):
+        raise click.ClickException(f"No profiles found in '{source}'")
+
+    endpoints = collections.defaultdict(collections.Counter)
+    requests, durations, interval_ms = collections.Counter(), collections.defaultdict(list), config.PROFILE_INTERVAL_MS
+    for name in sorted(os.listdir(source)):
+        if not name.endswith(".collapsed"):
+            continue
+        metadata, stacks = read_profile(os.path.join(source, name))
+        endpoint = metadata.get("endpoint", "unknown")
+        endpoints[endpoint].update(stacks)
+        requests[endpoint] += 1
+        durations[endpoint].append(float(metadata.get("duration_ms", 0)))
+        interval_ms = float(metadata.get("interval_ms", interval_ms))
+
+    os.makedirs(output, exist_ok=True)
+    for endpoint, stacks in endpoints.items():
+        filename = endpoint.replace("/", "_")
+        with open(os.path.join(output, f"{filename}.collapsed"), "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(output, f"{filename}.speedscope.json"), "w") as f:
+            json.dump(to_speedscope(endpoint, stacks, interval_ms), f)
+
+        endpoint_durations = sorted(durations[endpoint])
+        click.echo(
+            f"{endpoint}: {requests[endpoint]} profiles, "
+            f"median {endpoint_durations[len(endpoint_durations) // 2]:.1f} ms, "
+            f"max {endpoint_durations[-1]:.1f} ms"
+        )
@@ -0,0 +1,33 @@
+__all__ = [
+    "relay"
+]
+
+import click
+from flask.cli import AppGroup
+
+from ..services import relay_service
+
+
+relay = AppGroup("relay", help="Audio relay cache.")
+
+@relay.command("stats")
+def stats():
+    """Prints the relay's hit ratio and how much it saved, for every process of this host."""
+    report = relay_service.stats()
+    click.echo(
+        f"{report.requests} requests: {report.hits} hits, {report.coalesced} joined a running fetch, "
+        f"{report.misses} misses (hit ratio {report.hit_ratio():.1%})"
+    )
+    click.echo(
+        f"Served {report.bytes_served / 1024 / 1024:.1f} MiB, fetched {report.bytes_fetched / 1024 / 1024:.1f} MiB "
+        f"from storage (saved {report.bytes_saved() / 1024 / 1024:.1f} MiB)"
+    )
+
+@relay.command("evict")
+def evict():
+    """Deletes the least recently served objects until the cache fits in its budget."""
+    cached_bytes = relay_service.evict()
+    if cached_bytes is None:
+        click.echo("Another process is already evicting")
+    else:
+        click.echo(f"{cached_bytes / 1024 / 1024:.1f} MiB cached")
@@ -0,0 +1,48 @@
+__all__ = [
+    "tracks"
+]
+
+import datetime
+
+import click
+from flask.cli import AppGroup
+
+from ..services import gc_service, purge_service, upload_service
+
+
+tracks = AppGroup("tracks", help="Track storage maintenance.")
+
+@tracks.command("purge")
+@click.option("--batch-size", default=None, type=int, help="Number of objects to delete per request (at most 1000).")
+def purge(batch_size):
+    """Deletes the stored objects of every deleted track, then the tracks themselves."""
+    total = 0
+    while True:
+        purged = purge_service.purge_deleted_tracks(batch_size)
+        if purged == 0:
+            break
+        total += purged
+    click.echo(f"Purged {total} tracks")
+
+@tracks.command("gc")
+@click.option("--grace-hours", default=24, type=float, help="Only delete orphaned objects older than this.")
+@click.option("--dry-run", is_flag=True, help="Report orphaned objects without deleting them.")
+def gc(grace_hours, dry_run):
+    """Deletes stored objects that don't belong to any track and reports tracks whose object is missing."""
+    report = gc_service.collect_orphans(
+        datetime.timedelta(hours=grace_hours),
+        dry_run,
+        on_missing=lambda owner_id, object_key: click.echo(f"Missing object: {object_key} (user {owner_id})"),
+    )
+    click.echo(f"Checked {report.objects_checked} objects")
+    click.echo(
+        f"{'Found' if dry_run else 'Deleted'} {report.orphaned_objects if dry_run else report.deleted_objects} "
+        f"orphaned objects ({report.deleted_bytes / 1024 / 1024:.1f} MiB)"
+    )
+    click.echo(f"{report.missing_objects} tracks are missing their object")
+
+@tracks.command("expire-uploads")
+def expire_uploads():
+    """Aborts expired resumable uploads and multipart uploads that were abandoned before getting a session."""
+    expired, untracked = upload_service.expire_sessions()
+    click.echo(f"Aborted {expired} expired upload sessions and {untracked} abandoned multipart uploads")
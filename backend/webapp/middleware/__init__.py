@@ -1,5 +1,11 @@
 __all__ = [
     "auth",
+    "database",
+    "deadlines",
+    "limits",
+    "profiling",
+    "queries",
+    "serialization",
 ]
 
-from . import auth
+from . import auth, database, deadlines, limits, profiling, queries, serialization
@@ -1,7 +1,6 @@
 import datetime
 from functools import wraps
 
-import bcrypt
 from flask import g, session
 from werkzeug.local import LocalProxy
 
@@ -29,6 +28,12 @@ class LazyLoadProxy:
         return getattr(self._value, item)
     
 
+def current_user_id() -> int | None:
+    """Returns the logged in user's id without loading the user."""
+    if not session.get("_authenticated", False):
+        return None
+    return session.get("_user_id")
+
 def verify_password(password: str):
     if len(password) < 8 or len(password) > 64:
         return {"error": "Password must be between 8 and 64 characters"}
@@ -75,6 +80,8 @@ def login(email: str, password: str) -> models.User | None:
     if user is None or user.password is None:
         return None
     
+    import bcrypt
+
     if not bcrypt.checkpw(password.encode(), user.password.encode()):
         return None
 
@@ -93,6 +100,8 @@ def change_password(old_password: str, new_password: str, force: bool = False, u
     if not force and (len(old_password) == 0 or len(new_password) == 0):
         return {"error": "Invalid request"}
 
+    import bcrypt
+
     user = models.User.query.get(session["_user_id"] if user_id is None else user_id)
 
     if not force:
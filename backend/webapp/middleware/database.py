@@ -0,0 +1,18 @@
+__all__ = [
+    "read_only",
+]
+
+from functools import wraps
+
+from flask import g
+
+
+def read_only(route_func):
+    """Decorator that marks a route as read-only, allowing its queries to be served by the read replica."""
+
+    @wraps(route_func)
+    def f(*func_args, **func_kwargs):
+        g._read_only = True
+        return route_func(*func_args, **func_kwargs)
+
+    return f
@@ -0,0 +1,40 @@
+"""Per-request deadlines.
+
+Every request must finish within `config.REQUEST_DEADLINE` seconds, or what its route sets with `time_limit`.
+Outbound calls made while handling it are given whatever is left (see `services.outbound`), and fail with
+`DeadlineExceeded` once nothing is, which `jsonify` turns into a 504."""
+
+__all__ = [
+    "init_app",
+    "time_limit",
+]
+
+import time
+from functools import wraps
+
+import flask
+
+import config
+from ..services import outbound
+
+
+def time_limit(seconds: float):
+    """Decorator that replaces the default deadline of a route, e.g. for transfers of large files."""
+    def decorator(route_func):
+        @wraps(route_func)
+        def f(*func_args, **func_kwargs):
+            with outbound.deadline(flask.g._request_start + seconds):
+                return route_func(*func_args, **func_kwargs)
+        return f
+    return decorator
+
+def _before_request():
+    flask.g._request_start = time.monotonic()
+    outbound.set_deadline(flask.g._request_start + config.REQUEST_DEADLINE)
+
+def _teardown_request(exc):
+    outbound.set_deadline(None)
+
+def init_app(app: flask.Flask):
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
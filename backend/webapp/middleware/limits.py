@@ -0,0 +1,231 @@
+"""Admission control for expensive routes.
+
+Every client has a token bucket per user and per IP address. A request takes `cost` tokens from each of
+its buckets, and is rejected with a 429 before the route runs if any of them doesn't have enough. Routes
+can also cap how many of a user's requests are in flight at once (e.g. uploads).
+
+Buckets are kept in Redis when `HOOT_REDIS_URL` is set, so limits hold across workers and servers.
+Otherwise each worker enforces them on its own. If Redis can't be reached, requests are let through."""
+
+__all__ = [
+    "client_ip",
+    "concurrency_limit",
+    "rate_limit",
+]
+
+import logging
+import math
+import threading
+import time
+import uuid
+from functools import wraps
+
+import flask
+
+import config
+from ..services import clients
+from .auth import current_user_id
+
+
+# Takes ARGV[1] tokens from every bucket in KEYS, or from none of them. Each bucket's capacity and refill
+# rate follow in ARGV. Returns how many seconds to wait until all buckets have enough tokens, "0" if
+# they were taken.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+    local state = redis.call("HMGET", key, "tokens", "updated_at")
+    local tokens = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    levels[i] = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+    local needed = math.min(cost, capacity)
+    if levels[i] < needed then
+        wait = math.max(wait, (needed - levels[i]) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+    local tokens = math.max(0, levels[i] - cost)
+    redis.call("HSET", key, "tokens", tostring(tokens), "updated_at", tostring(now))
+    redis.call("PEXPIRE", key, math.ceil((capacity - tokens) / rate * 1000) + 1000)
+end
+return "0"
+"""
+
+# Adds ARGV[3] to the in-flight set KEYS[1] unless it already holds ARGV[1] members. Members older than
+# ARGV[2] seconds were left behind by dead workers and are dropped first.
+CONCURRENCY_SCRIPT = """
+local now = tonumber(redis.call("TIME")[1])
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now - tonumber(ARGV[2]))
+if redis.call("ZCARD", KEYS[1]) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call("ZADD", KEYS[1], now, ARGV[3])
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+return 1
+"""
+
+# How long to ask clients to wait when they have too many requests in flight
+CONCURRENCY_RETRY_AFTER = 5
+
+_lock = threading.Lock()
+# key -> (tokens, updated_at)
+_buckets: dict[str, tuple[float, float]] = {}
+# key -> {member: started_at}
+_in_flight: dict[str, dict[str, float]] = {}
+# script -> (Redis client, registered script), registered again whenever the client changes (e.g. after a fork)
+_scripts = {}
+
+
+def client_ip() -> str:
+    """Returns the client's IP address, skipping the `TRUSTED_PROXIES` proxies in front of the app."""
+    if config.TRUSTED_PROXIES > 0:
+        forwarded_for = [ip.strip() for ip in flask.request.headers.get("X-Forwarded-For", "").split(",") if ip.strip()]
+        if len(forwarded_for) >= config.TRUSTED_PROXIES:
+            return forwarded_for[-config.TRUSTED_PROXIES]
+    return flask.request.remote_addr or "unknown"
+
+def _too_many_requests(message: str, retry_after: float):
+    response = flask.current_app.json.response({"error": message})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def _script(redis, script: str):
+    registered = _scripts.get(script)
+    if registered is None or registered[0] is not redis:
+        registered = _scripts[script] = (redis, redis.register_script(script))
+    return registered[1]
+
+def _take_local(buckets: list[tuple[str, float, float]], cost: float) -> float:
+    now = time.monotonic()
+    with _lock:
+        levels, wait = [], 0
+        for key, capacity, rate in buckets:
+            tokens, updated_at = _buckets.get(key, (capacity, now))
+            level = min(capacity, tokens + (now - updated_at) * rate)
+            levels.append(level)
+            needed = min(cost, capacity)
+            if level < needed:
+                wait = max(wait, (needed - level) / rate)
+        if wait > 0:
+            return wait
+
+        for (key, capacity, rate), level in zip(buckets, levels):
+            _buckets[key] = (max(0, level - cost), now)
+
+        # Full buckets carry no state, forget them once there are many
+        if len(_buckets) > 10000:
+            for key, (tokens, updated_at) in list(_buckets.items()):
+                if updated_at < now - 24 * 60 * 60:
+                    del _buckets[key]
+        return 0
+
+def _take(buckets: list[tuple[str, float, float]], cost: float) -> float:
+    """Takes `cost` tokens from every `(key, capacity, rate)` bucket, or from none of them.
+    Returns 0 if they were taken, or the number of seconds until they can be."""
+    redis = clients.redis_client()
+    if redis is None:
+        return _take_local(buckets, cost)
+
+    args = [cost]
+    for _, capacity, rate in buckets:
+        args += [capacity, rate]
+    try:
+        return float(_script(redis, TOKEN_BUCKET_SCRIPT)(keys=[key for key, *_ in buckets], args=args))
+    except Exception:
+        logging.exception("Couldn't check rate limits")
+        return 0
+
+def _acquire(key: str, limit: int, member: str) -> bool:
+    redis = clients.redis_client()
+    if redis is None:
+        now = time.monotonic()
+        with _lock:
+            in_flight = _in_flight.setdefault(key, {})
+            for other, started_at in list(in_flight.items()):
+                if started_at < now - config.CONCURRENCY_LEASE_SECONDS:
+                    del in_flight[other]
+            if len(in_flight) >= limit:
+                return False
+            in_flight[member] = now
+            return True
+
+    try:
+        return _script(redis, CONCURRENCY_SCRIPT)(
+            keys=[key],
+            args=[limit, config.CONCURRENCY_LEASE_SECONDS, member]
+        ) == 1
+    except Exception:
+        logging.exception("Couldn't check concurrency limits")
+        return True
+
+def _release(key: str, member: str):
+    redis = clients.redis_client()
+    if redis is None:
+        with _lock:
+            in_flight = _in_flight.get(key, {})
+            in_flight.pop(member, None)
+            if len(in_flight) == 0:
+                _in_flight.pop(key, None)
+        return
+
+    try:
+        redis.zrem(key, member)
+    except Exception:
+        logging.exception("Couldn't release concurrency slot")
+
+def rate_limit(cost: float = 1):
+    """Decorator that takes `cost` tokens from the user's and the client IP's buckets before running the
+    route, and returns a 429 error with a `Retry-After` header instead if there aren't enough."""
+
+    def decorator(route_func):
+        @wraps(route_func)
+        def f(*func_args, **func_kwargs):
+            if not config.RATE_LIMITS:
+                return route_func(*func_args, **func_kwargs)
+
+            buckets = [(f"hoot:rate:ip:{client_ip()}", config.RATE_LIMIT_IP_BURST, config.RATE_LIMIT_IP_RATE)]
+            user_id = current_user_id()
+            if user_id is not None:
+                buckets.append((f"hoot:rate:user:{user_id}", config.RATE_LIMIT_USER_BURST, config.RATE_LIMIT_USER_RATE))
+
+            retry_after = _take(buckets, cost)
+            if retry_after > 0:
+                return _too_many_requests("Too many requests, please try again later", retry_after)
+            return route_func(*func_args, **func_kwargs)
+
+        return f
+
+    return decorator
+
+def concurrency_limit(name: str, limit: int):
+    """Decorator that lets at most `limit` of a user's (or, when logged out, an IP's) requests to routes
+    sharing `name` run at once. Further requests get a 429 error with a `Retry-After` header."""
+
+    def decorator(route_func):
+        @wraps(route_func)
+        def f(*func_args, **func_kwargs):
+            if not config.RATE_LIMITS:
+                return route_func(*func_args, **func_kwargs)
+
+            user_id = current_user_id()
+            key = f"hoot:in-flight:{name}:" + (f"user:{user_id}" if user_id is not None else f"ip:{client_ip()}")
+            member = uuid.uuid4().hex
+            if not _acquire(key, limit, member):
+                return _too_many_requests("Too many requests in progress, please wait for them to finish", CONCURRENCY_RETRY_AFTER)
+            try:
+                return route_func(*func_args, **func_kwargs)
+            finally:
+                _release(key, member)
+
+        return f
+
+    return decorator
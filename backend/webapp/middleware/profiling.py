@@ -0,0 +1,162 @@
+__all__ = [
+    "init_app",
+    "read_profile",
+]
+
+import collections
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import flask
+
+import config
+
+
+class Sampler:
+    """Samples the stacks of registered threads from a single background thread.
+    Stacks are stored in collapsed format (`root;caller;callee`) with their sample count."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stacks: dict[int, collections.Counter] = {}
+        # Set while any thread is registered, so that the sampler sleeps when nothing is profiled
+        self._active = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_running(self):
+        # A thread started before a fork doesn't exist in the child, so start one per process
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._active = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="hoot-profiler", daemon=True)
+        self._thread.start()
+
+    def start(self, thread_id: int):
+        with self._lock:
+            self._ensure_running()
+            self._stacks[thread_id] = collections.Counter()
+            self._active.set()
+
+    def stop(self, thread_id: int) -> collections.Counter:
+        with self._lock:
+            stacks = self._stacks.pop(thread_id, collections.Counter())
+            if len(self._stacks) == 0:
+                self._active.clear()
+            return stacks
+
+    def _run(self):
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                if len(self._stacks) == 0:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, counter in self._stacks.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        counter[collapse_stack(frame)] += 1
+
+
+def collapse_stack(frame) -> str:
+    # Frames are named `module:function`, so that samples taken at different lines of a function merge. Only
+    # the leaf keeps its line, which tells where the time goes without splitting the rest of the stack.
+    names = [f"{_frame_name(frame)}:{frame.f_lineno}"]
+    frame = frame.f_back
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def _frame_name(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+def _write_profile(stacks: collections.Counter, metadata: dict):
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    endpoint = (metadata.get("endpoint") or "unknown").replace("/", "_")
+    path = os.path.join(config.PROFILE_DIR, f"{time.time_ns()}_{endpoint}.collapsed")
+    with open(path, "w") as f:
+        for key, value in metadata.items():
+            f.write(f"# {key}: {value}\n")
+        for stack, count in stacks.items():
+            f.write(f"{stack} {count}\n")
+
+    # Keep the directory as a bounded ring, dropping the oldest profiles first
+    profiles = sorted(name for name in os.listdir(config.PROFILE_DIR) if name.endswith(".collapsed"))
+    for name in profiles[:max(0, len(profiles) - config.PROFILE_MAX_FILES)]:
+        try:
+            os.remove(os.path.join(config.PROFILE_DIR, name))
+        except FileNotFoundError:
+            pass
+
+def read_profile(path: str) -> tuple[dict, collections.Counter]:
+    """Reads a profile written by this middleware, returning its metadata and stack counts."""
+    metadata, stacks = {}, collections.Counter()
+    with open(path, "r") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("# "):
+                key, _, value = line[2:].partition(": ")
+                metadata[key] = value
+            elif line:
+                stack, _, count = line.rpartition(" ")
+                stacks[stack] += int(count)
+    return metadata, stacks
+
+_sampler = None
+
+def _greenlets_patched() -> bool:
+    # Under gevent, every request is a greenlet of the same thread, so a thread's stack doesn't belong to one request
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("threading")
+
+def _before_request():
+    flask.g._profile_start = time.perf_counter()
+    flask.g._profile_sampled = random.random() < config.PROFILE_SAMPLE_RATE
+    _sampler.start(threading.get_ident())
+
+def _teardown_request(exc):
+    start = flask.g.pop("_profile_start", None)
+    if start is None:
+        return
+    stacks = _sampler.stop(threading.get_ident())
+    duration_ms = (time.perf_counter() - start) * 1000
+
+    slow = config.PROFILE_SLOW_MS is not None and duration_ms >= config.PROFILE_SLOW_MS
+    if not (slow or flask.g.pop("_profile_sampled", False)) or len(stacks) == 0:
+        return
+
+    try:
+        _write_profile(stacks, {
+            "endpoint": flask.request.endpoint,
+            "method": flask.request.method,
+            "path": flask.request.path,
+            "user_id": flask.session.get("_user_id"),
+            "payload_size": flask.request.content_length or 0,
+            "duration_ms": round(duration_ms, 2),
+            "reason": "slow" if slow else "sampled",
+            "interval_ms": config.PROFILE_INTERVAL_MS,
+        })
+    except OSError:
+        flask.current_app.logger.exception("Failed to write request profile")
+
+def init_app(app: flask.Flask):
+    """Enables request profiling if either `config.PROFILE_SLOW_MS` or `config.PROFILE_SAMPLE_RATE` is set."""
+    global _sampler
+
+    if config.PROFILE_SLOW_MS is None and config.PROFILE_SAMPLE_RATE <= 0:
+        return
+    if _greenlets_patched():
+        logging.warning("Request profiling is disabled: it doesn't support the gevent worker class")
+        return
+
+    _sampler = Sampler(config.PROFILE_INTERVAL_MS / 1000)
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
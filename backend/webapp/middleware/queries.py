@@ -0,0 +1,170 @@
+__all__ = [
+    "QueryBudgetExceeded",
+    "count_queries",
+    "init_app",
+    "query_budget",
+]
+
+import collections
+import logging
+import re
+import threading
+from contextlib import contextmanager
+
+import flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import config
+
+
+_NUMBER_REGEX = re.compile(r"\b\d+\b")
+_STRING_REGEX = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST_REGEX = re.compile(r"\bIN\s*\((?:[^()]*)\)", re.IGNORECASE)
+_WHITESPACE_REGEX = re.compile(r"\s+")
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryTracker:
+    def __init__(self, label: str):
+        self.label = label
+        self.statements: list[str] = []
+        self.relationships: dict[str, str] = {}
+        self.shapes = collections.Counter()
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def record(self, statement: str, relationship: str | None):
+        shape = statement_shape(statement)
+        self.statements.append(statement)
+        self.shapes[shape] += 1
+        if relationship is not None:
+            self.relationships[shape] = relationship
+
+    def repeated_selects(self, threshold: int):
+        """Returns the `(shape, count, relationship)` of every SELECT that was issued at least `threshold` times."""
+        return [
+            (shape, count, self.relationships.get(shape))
+            for shape, count in self.shapes.items()
+            if count >= threshold and shape.startswith("SELECT")
+        ]
+
+    def violations(self, budget: int | None = None, threshold: int | None = None):
+        threshold = config.QUERY_N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(f"{self.label} issued {self.count} queries (budget is {budget})")
+        for shape, count, relationship in self.repeated_selects(threshold):
+            source = f"lazy load of {relationship}" if relationship is not None else "repeated query"
+            problems.append(f"{self.label} has a possible N+1 ({source}, {count} times): {shape[:200]}")
+        return problems
+
+
+def statement_shape(statement: str) -> str:
+    """Normalizes a SQL statement so that statements that only differ in their literals have the same shape."""
+    shape = _STRING_REGEX.sub("?", statement)
+    shape = _IN_LIST_REGEX.sub("IN (?)", shape)
+    shape = _NUMBER_REGEX.sub("?", shape)
+    return _WHITESPACE_REGEX.sub(" ", shape).strip()
+
+def _active_trackers() -> list[QueryTracker]:
+    if not hasattr(_local, "trackers"):
+        _local.trackers = []
+    return _local.trackers
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trackers = _active_trackers()
+    if len(trackers) == 0:
+        return
+    relationship = getattr(_local, "pending_relationship", None)
+    _local.pending_relationship = None
+    for tracker in trackers:
+        tracker.record(statement, relationship)
+
+def _do_orm_execute(orm_execute_state):
+    if len(_active_trackers()) == 0 or not orm_execute_state.is_relationship_load:
+        return
+    path = orm_execute_state.loader_strategy_path
+    _local.pending_relationship = str(path[-1]) if path is not None and len(path) > 0 else None
+
+def _listen():
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    if not event.contains(Session, "do_orm_execute", _do_orm_execute):
+        event.listen(Session, "do_orm_execute", _do_orm_execute)
+
+@contextmanager
+def count_queries(max_queries: int | None = None, label: str = "block", n_plus_one_threshold: int | None = None):
+    """Context manager that counts every statement issued inside it. Raises `QueryBudgetExceeded` when
+    the block goes over `max_queries` or repeats the same SELECT `n_plus_one_threshold` times.
+    Meant to be used from tests, e.g. `with count_queries(3): client.get("/tracks")`."""
+
+    _listen()
+    tracker = QueryTracker(label)
+    _active_trackers().append(tracker)
+    try:
+        yield tracker
+    finally:
+        _active_trackers().remove(tracker)
+    problems = tracker.violations(max_queries, n_plus_one_threshold)
+    if problems:
+        raise QueryBudgetExceeded("\n".join(problems))
+
+def query_budget(max_queries: int):
+    """Decorator that declares the maximum number of SQL statements a route may issue per request.
+    It is only enforced when query checks are enabled (see `config.QUERY_CHECKS`)."""
+
+    def decorator(route_func):
+        route_func._query_budget = max_queries
+        return route_func
+
+    return decorator
+
+def _before_request():
+    label = f"{flask.request.method} {flask.request.path} ({flask.request.endpoint})"
+    tracker = QueryTracker(label)
+    _active_trackers().append(tracker)
+    flask.g._query_tracker = tracker
+
+def _after_request(response):
+    tracker: QueryTracker | None = flask.g.pop("_query_tracker", None)
+    if tracker is None:
+        return response
+    if tracker in _active_trackers():
+        _active_trackers().remove(tracker)
+
+    view_func = flask.current_app.view_functions.get(flask.request.endpoint)
+    budget = getattr(view_func, "_query_budget", None)
+    response.headers["X-Query-Count"] = str(tracker.count)
+
+    problems = tracker.violations(budget)
+    if not problems:
+        return response
+    if config.QUERY_CHECKS == "raise":
+        raise QueryBudgetExceeded("\n".join(problems))
+    for problem in problems:
+        logging.warning(problem)
+    return response
+
+def _teardown_request(exc):
+    tracker = flask.g.pop("_query_tracker", None)
+    if tracker is not None and tracker in _active_trackers():
+        _active_trackers().remove(tracker)
+
+def init_app(app: flask.Flask):
+    """Enables per-request query counting if `config.QUERY_CHECKS` is set to "warn" or "raise"."""
+    if config.QUERY_CHECKS not in ("warn", "raise"):
+        return
+
+    _listen()
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
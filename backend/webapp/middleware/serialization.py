@@ -0,0 +1,111 @@
+__all__ = [
+    "available_encodings",
+    "compress",
+    "init_app",
+]
+
+import gzip
+
+import flask
+from flask.json.provider import DefaultJSONProvider
+
+import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/html", "text/plain"}
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson. Output matches the default provider's: keys are sorted and anything
+    orjson doesn't handle identically (dates, decimals, ...) goes through the default provider's encoder."""
+
+    options = orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.options).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if self._app.debug:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self.options | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def available_encodings():
+    encodings = {"gzip": lambda data: gzip.compress(data, compresslevel=config.COMPRESSION_GZIP_LEVEL)}
+    if brotli is not None:
+        encodings["br"] = lambda data: brotli.compress(data, quality=config.COMPRESSION_BROTLI_QUALITY)
+    if zstandard is not None:
+        encodings["zstd"] = lambda data: zstandard.ZstdCompressor(level=config.COMPRESSION_ZSTD_LEVEL).compress(data)
+    return encodings
+
+def _negotiate(accept_encoding: str, encodings):
+    """Picks the encoding to use from an Accept-Encoding header, preferring brotli, then zstd, then gzip."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        accepted[name.strip().lower()] = quality
+
+    candidates = [
+        encoding for encoding in ("br", "zstd", "gzip")
+        if encoding in encodings and accepted.get(encoding, accepted.get("*", 0)) > 0
+    ]
+    return candidates[0] if candidates else None
+
+def compress(response: flask.Response):
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < config.COMPRESSION_MIN_SIZE:
+        return response
+
+    encodings = available_encodings()
+    encoding = _negotiate(flask.request.headers.get("Accept-Encoding", ""), encodings)
+    if encoding is None:
+        return response
+
+    response.set_data(encodings[encoding](data))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+def init_app(app: flask.Flask):
+    """Uses orjson for JSON responses when it's installed, and compresses responses the client accepts."""
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+
+    if config.COMPRESSION_MIN_SIZE >= 0:
+        app.after_request(compress)
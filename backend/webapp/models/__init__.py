@@ -2,12 +2,17 @@ __all__ = [
     "Playlist",
     "PlaylistTrack",
     "Track",
+    "TrackStats",
+    "UploadSession",
     "User",
     "db",
+    "init_engines",
 ]
 
-from .db import db
+from .db import db, init_engines
 from .playlist import Playlist
 from .playlist_track import PlaylistTrack
 from .track import Track
+from .track_stats import TrackStats
+from .upload_session import UploadSession
 from .user import User
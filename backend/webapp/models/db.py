@@ -1,7 +1,62 @@
 __all__ = [
-    "db"
+    "db",
+    "init_engines",
 ]
 
+import flask
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
 
-db = SQLAlchemy()
+import config
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the read replica (if one is configured) while handling a route
+    marked with `middleware.database.read_only`. Flushes and explicit writes always go to the primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and "replica" in self._db.engines
+            and flask.has_request_context()
+            and flask.g.get("_read_only", False)
+            and not self._flushing
+            and not isinstance(clause, UpdateBase)
+        ):
+            return self._db.engines["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+
+def _set_statement_timeout(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"SET statement_timeout = {int(config.DB_STATEMENT_TIMEOUT_MS)}")
+    cursor.close()
+
+def _set_local_statement_timeout(session, transaction, connection):
+    # PgBouncer in transaction mode hands out a different server connection for every
+    # transaction, so session-level settings can't be used
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(config.DB_STATEMENT_TIMEOUT_MS)}")
+
+def init_engines(app: flask.Flask):
+    """Installs the statement timeout on every engine. Must be called after `db.init_app(app)`."""
+    if not config.DB_STATEMENT_TIMEOUT_MS:
+        return
+
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    if any(engine.dialect.name != "postgresql" for engine in engines):
+        return
+
+    if config.DB_PGBOUNCER:
+        if not event.contains(RoutingSession, "after_begin", _set_local_statement_timeout):
+            event.listen(RoutingSession, "after_begin", _set_local_statement_timeout)
+        return
+
+    for engine in engines:
+        event.listen(engine, "connect", _set_statement_timeout)
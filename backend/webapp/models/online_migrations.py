@@ -0,0 +1,146 @@
+"""Operations for migrations that run while the app is serving requests.
+
+Plain Alembic operations take locks that block every query on the table for as long as they run: building
+an index blocks writes, and most `ALTER TABLE`s block reads too. The helpers below avoid those locks on
+PostgreSQL, and fall back to the regular operations on other databases (which are only used locally).
+
+Migrations also run with a short `lock_timeout` (see `migrations/env.py`), so a statement that has to wait
+behind a long transaction fails instead of making every other query queue up behind it."""
+
+__all__ = [
+    "backfill",
+    "create_index_concurrently",
+    "create_unique_constraint_concurrently",
+    "drop_index_concurrently",
+]
+
+import logging
+import time
+
+import sqlalchemy as sa
+from alembic import op
+
+
+logger = logging.getLogger("alembic.online_migrations")
+
+
+def _is_postgresql() -> bool:
+    return op.get_bind().dialect.name == "postgresql"
+
+def _quote(name: str) -> str:
+    return op.get_bind().dialect.identifier_preparer.quote(name)
+
+def _offline() -> bool:
+    """Whether the migration is only being rendered as SQL (`flask db upgrade --sql`)."""
+    return op.get_context().as_sql
+
+def _drop_invalid_index(name: str):
+    """Drops the index if an earlier concurrent build of it failed, which leaves it behind as invalid."""
+    if _offline():
+        return
+    invalid = op.get_bind().execute(
+        sa.text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+        {"name": name}
+    ).scalar()
+    if invalid:
+        logger.info(f"Dropping invalid index {name} left by an earlier attempt")
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {_quote(name)}")
+
+def create_index_concurrently(name: str, table: str, columns: list, unique: bool = False, where: str | None = None, **kwargs):
+    """Builds an index without blocking writes to the table. On PostgreSQL this runs outside of the migration's
+    transaction, so it should be the only (or last) operation of its migration. Safe to run again after a failure."""
+    if not _is_postgresql():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(name, columns, unique=unique, **kwargs)
+        return
+
+    with op.get_context().autocommit_block():
+        _drop_invalid_index(name)
+        # Building the index waits for running transactions, but doesn't block anything meanwhile. The migration's
+        # own timeout is put back afterwards: RESET would fall back to the server's default instead.
+        lock_timeout = None if _offline() else op.get_bind().execute(sa.text("SHOW lock_timeout")).scalar()
+        op.execute("SET lock_timeout = 0")
+        try:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=unique,
+                postgresql_where=sa.text(where) if where is not None else None,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+                **kwargs
+            )
+        finally:
+            op.execute("RESET lock_timeout" if lock_timeout is None else f"SET lock_timeout = '{lock_timeout}'")
+
+def drop_index_concurrently(name: str, table: str):
+    """Drops an index without blocking queries on the table."""
+    if not _is_postgresql():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(name)
+        return
+
+    with op.get_context().autocommit_block():
+        op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+def create_unique_constraint_concurrently(name: str, table: str, columns: list[str]):
+    """Adds a unique constraint by building its index concurrently first. Attaching the index only needs a brief
+    exclusive lock, instead of holding one for as long as the index takes to build."""
+    if not _is_postgresql():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_unique_constraint(name, columns)
+        return
+
+    create_index_concurrently(name, table, columns, unique=True)
+    exists = not _offline() and op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_constraint WHERE conname = :name"),
+        {"name": name}
+    ).scalar()
+    if not exists:
+        op.execute(f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(name)} UNIQUE USING INDEX {_quote(name)}")
+
+def backfill(table: str, column: str, value: str, batch_size: int = 10000, pause: float = 0.1, key: str = "id"):
+    """Sets `column` to the SQL expression `value` on every row where it is NULL, `batch_size` rows at a time.
+
+    Each batch is committed on its own, so rows are only locked briefly and replicas keep up. Rows are visited
+    in `key` order, and only NULL ones are updated: after an interruption, running the migration again skips
+    the rows that were already filled in. Runs outside of the migration's transaction on PostgreSQL."""
+    quoted_table, quoted_column, quoted_key = _quote(table), _quote(column), _quote(key)
+    select_batch = sa.text(f"""
+        SELECT MAX({quoted_key}) FROM (
+            SELECT {quoted_key} FROM {quoted_table}
+            WHERE {quoted_key} > :after
+            ORDER BY {quoted_key}
+            LIMIT :batch_size
+        ) AS batch
+    """)
+    update_batch = sa.text(f"""
+        UPDATE {quoted_table} SET {quoted_column} = {value}
+        WHERE {quoted_key} > :after AND {quoted_key} <= :until AND {quoted_column} IS NULL
+    """)
+
+    def run():
+        if _offline():
+            op.execute(f"UPDATE {quoted_table} SET {quoted_column} = {value} WHERE {quoted_column} IS NULL")
+            return
+
+        connection = op.get_bind()
+        after = connection.execute(sa.text(f"SELECT MIN({quoted_key}) - 1 FROM {quoted_table}")).scalar()
+        updated = 0
+        while after is not None:
+            until = connection.execute(select_batch, {"after": after, "batch_size": batch_size}).scalar()
+            if until is None:
+                break
+            updated += connection.execute(update_batch, {"after": after, "until": until}).rowcount
+            after = until
+            if pause > 0:
+                time.sleep(pause)
+        logger.info(f"Backfilled {updated} rows of {table}.{column}")
+
+    if not _is_postgresql():
+        run()
+        return
+
+    with op.get_context().autocommit_block():
+        run()
@@ -3,10 +3,17 @@ from .db import db
 
 class Playlist(db.Model):
     __tablename__ = "playlists"
+    __table_args__ = (
+        db.UniqueConstraint("owner_id", "name", name="uq_playlists_owner_id_name"),
+        db.Index("ix_playlists_share_code", "share_code", unique=True, postgresql_where=db.text("share_code IS NOT NULL")),
+    )
     
     id = db.Column(db.Integer, primary_key=True, nullable=False, autoincrement=True)
     owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     name = db.Column(db.String(64), nullable=False)
 
+    # Set while the playlist is published: anyone with the code can add its tracks to their library
+    share_code = db.Column(db.String(32), nullable=True)
+
     owner = db.relationship("User", back_populates="playlists")
     tracks = db.relationship("Track", secondary="playlist_tracks", back_populates="playlists")
@@ -3,6 +3,9 @@ from .db import db
 
 class PlaylistTrack(db.Model):
     __tablename__ = "playlist_tracks"
+    __table_args__ = (
+        db.UniqueConstraint("playlist_id", "track_id", name="uq_playlist_tracks_playlist_id_track_id"),
+    )
     
     id = db.Column(db.Integer, primary_key=True, nullable=False, autoincrement=True)
     track_id = db.Column(db.Integer, db.ForeignKey("tracks.id"), nullable=False)
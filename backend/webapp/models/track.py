@@ -3,6 +3,11 @@ from .db import db
 
 class Track(db.Model):
     __tablename__ = "tracks"
+    __table_args__ = (
+        db.Index("ix_tracks_deleted_at", "deleted_at", postgresql_where=db.text("deleted_at IS NOT NULL")),
+        # Its migration builds it with COLLATE "C" on PostgreSQL, so autogenerate leaves it alone (see migrations/env.py)
+        db.Index("ix_tracks_object_key", "object_key"),
+    )
     
     id = db.Column(db.Integer, primary_key=True, nullable=False, autoincrement=True)
     owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -14,5 +19,8 @@ class Track(db.Model):
     source = db.Column(db.String(512), nullable=True)
     source_expiration = db.Column(db.DateTime, nullable=True)
 
+    # Set when the track is deleted, until its object is purged from storage
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
     owner = db.relationship("User", back_populates="tracks")
     playlists = db.relationship("Playlist", secondary="playlist_tracks", back_populates="tracks")
@@ -0,0 +1,14 @@
+from .db import db
+
+
+class TrackStats(db.Model):
+    """Daily playback counters of a track, rolled up from the events sent by clients."""
+
+    __tablename__ = "track_stats"
+
+    track_id = db.Column(db.Integer, db.ForeignKey("tracks.id", ondelete="CASCADE"), primary_key=True, nullable=False)
+    day = db.Column(db.Date, primary_key=True, nullable=False)
+    plays = db.Column(db.Integer, nullable=False, server_default='0')
+    skips = db.Column(db.Integer, nullable=False, server_default='0')
+    stops = db.Column(db.Integer, nullable=False, server_default='0')
+    last_event_at = db.Column(db.DateTime, nullable=False)
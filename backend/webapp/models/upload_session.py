@@ -0,0 +1,27 @@
+from .db import db
+
+
+class UploadSession(db.Model):
+    """A resumable upload in progress. Its chunks are uploaded as the parts of an S3 multipart upload."""
+
+    __tablename__ = "upload_sessions"
+
+    id = db.Column(db.String(32), primary_key=True, nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    track_name = db.Column(db.String(64), nullable=False)
+    playlists = db.Column(db.JSON, nullable=False)
+    filename = db.Column(db.String(256), nullable=False)
+    mime = db.Column(db.String(128), nullable=True)
+    size = db.Column(db.Integer, nullable=False)
+
+    # Number of bytes received so far
+    received = db.Column(db.Integer, nullable=False, server_default='0')
+    chunk_size = db.Column(db.Integer, nullable=False)
+
+    object_key = db.Column(db.String(128), nullable=False)
+    multipart_upload_id = db.Column(db.String(256), nullable=False)
+    # [{"PartNumber": ..., "ETag": ...}, ...] for every chunk received
+    parts = db.Column(db.JSON, nullable=False)
+
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
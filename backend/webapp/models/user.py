@@ -1,8 +1,15 @@
+from sqlalchemy import func, select
+
 from .db import db
+from .track import Track
 
 
 class User(db.Model):
     __tablename__ = "users"
+    __table_args__ = (
+        db.Index("ix_users_email", "email"),
+        db.Index("ix_users_verification_code", "verification_code", postgresql_where=db.text("verification_code IS NOT NULL")),
+    )
     
     id = db.Column(db.Integer, primary_key=True, nullable=False, autoincrement=True)
     username = db.Column(db.String(64), nullable=False)
@@ -35,7 +42,13 @@ class User(db.Model):
         return 2 * 1024 * 1024 * 1024
 
     def used_storage(self):
-        return sum([track.size for track in self.tracks])
+        # Deleted tracks stop counting immediately, even before their objects are purged. Tracks that share
+        # an object (cloned from a shared playlist) count once.
+        objects = select(Track.object_key, func.max(Track.size).label("size")).where(
+            Track.owner_id == self.id,
+            Track.deleted_at.is_(None),
+        ).group_by(Track.object_key).subquery()
+        return db.session.scalar(select(func.coalesce(func.sum(objects.c.size), 0)))
 
     def available_storage(self):
         return self.total_storage() - self.used_storage()
@@ -1,11 +1,13 @@
 __all__ = [
     "auth",
+    "relay",
     "tracks",
     "user",
     "webhooks",
 ]
 
 from .auth_route import auth
+from .relay_route import relay
 from .tracks_route import tracks
 from .user_route import user
 from .webhooks_route import webhooks
@@ -7,18 +7,18 @@ import logging
 import traceback
 
 import flask
-import patreon
 from sqlalchemy.orm.session import object_session
 
 import config
 from .. import middleware, models
+from ..services import clients
 from .utils import jsonify
 
 
 auth = flask.Blueprint("auth", __name__, url_prefix="/auth")
 
 def get_or_update_patreon_oauth_token(user: models.User, code = None):
-    oauth_client = patreon.OAuth(config.PATREON_CLIENT_ID, config.PATREON_CLIENT_SECRET)
+    oauth_client = clients.patreon_oauth()
 
     now = datetime.datetime.now(datetime.timezone.utc)
     if user.patreon_access_token and user.patreon_refresh_token and user.patreon_access_token_expiration:
@@ -52,7 +52,7 @@ def update_patreon_status(user: models.User, code = None):
         return
     
     access_token = tokens["access_token"]
-    api_client = patreon.API(access_token)
+    api_client = clients.patreon_api(access_token)
     user_response = api_client.get_identity(
         ["campaign", "memberships"], 
         {
@@ -93,6 +93,7 @@ def update_patreon_status(user: models.User, code = None):
 
 @auth.route("/login", methods=["POST"])
 @jsonify
+@middleware.limits.rate_limit(10)
 def login():
     if not flask.request.is_json:
         return {"error": "Invalid request"}
@@ -133,6 +134,7 @@ def logout():
 
 @auth.route("/password", methods=["PUT"])
 @jsonify
+@middleware.limits.rate_limit(10)
 @middleware.auth.requires_login
 def change_password():
     if not flask.request.is_json:
@@ -148,6 +150,7 @@ def change_password():
 
 @auth.route("/verify/<verification_code>", methods=["POST"])
 @jsonify
+@middleware.limits.rate_limit(5)
 def verify_email(verification_code):
     if not flask.request.is_json:
         return {"error": "Invalid request"}
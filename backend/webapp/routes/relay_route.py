@@ -0,0 +1,63 @@
+__all__ = [
+    "relay"
+]
+
+import flask
+
+import config
+from .. import middleware
+from ..services import relay_service
+from .utils import jsonify
+
+
+relay = flask.Blueprint("relay", __name__, url_prefix="/relay")
+
+def _if_range_matches(cached: relay_service.CachedObject) -> bool:
+    """Returns whether a Range header applies: it doesn't if If-Range names another version of the object."""
+    if_range = flask.request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == cached.etag.strip('"')
+    if if_range.date is not None:
+        return if_range.date >= cached.last_modified.replace(microsecond=0)
+    return True
+
+@relay.route("/<path:key>", methods=["GET"])
+@jsonify
+@middleware.queries.query_budget(0)
+def get_object(key: str):
+    # The signature is the authorization, so that players can load the URL without credentials
+    if not relay_service.verify(key, flask.request.args.get("expires"), flask.request.args.get("signature")):
+        return {"error": "Invalid or expired link", "status_code": 403}
+
+    try:
+        cached = relay_service.open_object(key)
+    except relay_service.RelayError as e:
+        return {"error": str(e), "status_code": e.status_code}
+
+    start, stop, status_code = 0, cached.size, 200
+    byte_range = flask.request.range
+    # Multiple ranges are rare for audio, and serving the whole object instead is allowed
+    if byte_range is not None and byte_range.units == "bytes" and len(byte_range.ranges) == 1 and _if_range_matches(cached):
+        bounds = byte_range.range_for_length(cached.size)
+        if bounds is None:
+            response = flask.Response(status=416)
+            response.headers["Content-Range"] = f"bytes */{cached.size}"
+            return response
+        (start, stop), status_code = bounds, 206
+
+    response = flask.Response(
+        cached.read(start, stop),
+        status=status_code,
+        mimetype=cached.content_type,
+        direct_passthrough=True,
+    )
+    response.content_length = stop - start
+    if status_code == 206:
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{cached.size}"
+    response.accept_ranges = "bytes"
+    response.headers["ETag"] = cached.etag
+    response.last_modified = cached.last_modified
+    response.headers["Cache-Control"] = config.PRESIGN_CACHE_CONTROL
+    response.headers["X-Relay-Cache"] = cached.status
+    # Answers If-None-Match and If-Modified-Since with a 304, without reading the object
+    return response.make_conditional(flask.request)
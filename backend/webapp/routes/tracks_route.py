@@ -3,35 +3,27 @@ __all__ = [
 ]
 
 import datetime
-import io
 import json
-import os
-import re
+import time
 import traceback
 import uuid
-from urllib.parse import urlparse, unquote
 
 import flask
-import magic
-import requests
-from botocore.exceptions import ClientError
 from sqlalchemy.orm import joinedload
 
 import config
 from .. import middleware, models
+from ..services import batch_upload_service, clients, events_service, import_service, library_cache, outbound, playlist_service, presign_service, purge_service, relay_service, search_service, share_service, upload_service
 from .utils import jsonify
 
 
 tracks = flask.Blueprint("tracks", __name__, url_prefix="/tracks")
 
-class FakeFlaskFile:
-    def __init__(self, stream, filename):
-        self.filename = filename
-        self.stream = stream
-
 def generate_presigned_url(key: str, type: str, expiration=3600):
+    from botocore.exceptions import ClientError
+
     try:
-        response = config.S3_CLIENT.generate_presigned_url(
+        response = clients.s3_client().generate_presigned_url(
             "get_object" if type == "download" else "put_object",
             Params={"Bucket": config.S3_BUCKET_NAME, "Key": key},
             ExpiresIn=expiration
@@ -47,12 +39,20 @@ def source_if_valid(track: models.Track, generate_new = False):
     tz_aware_expiration = track.source_expiration
     if tz_aware_expiration is not None:
         tz_aware_expiration = tz_aware_expiration.replace(tzinfo=datetime.timezone.utc)
-    if tz_aware_expiration is not None and tz_aware_expiration > now:
+    # When a new URL can be generated, don't hand out one that is about to expire
+    min_validity = datetime.timedelta(seconds=config.PRESIGN_MIN_VALIDITY_SECONDS if generate_new else 0)
+    if tz_aware_expiration is not None and tz_aware_expiration > now + min_validity:
         return track.source, tz_aware_expiration.timestamp()
     if generate_new:
-        expiration_date = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=3600)
-        pre_signed_url = generate_presigned_url(track.object_key, "download")
-        if pre_signed_url is None:
+        from botocore.exceptions import ClientError
+
+        try:
+            if relay_service.enabled():
+                pre_signed_url, expiration_date = relay_service.relay_url(track.object_key)
+            else:
+                pre_signed_url, expiration_date = presign_service.presign_download(track.object_key)
+        except ClientError:
+            traceback.print_exc()
             return None, None
         track.source = pre_signed_url
         track.source_expiration = expiration_date
@@ -60,54 +60,30 @@ def source_if_valid(track: models.Track, generate_new = False):
 
     return None, None
 
-def download_file(source: str):
-    response = requests.get(source, stream=True, timeout=60)
-    response.raise_for_status()
-
-    # Try to get filename from URL
-    path = urlparse(source).path
-    filename = unquote(os.path.basename(path)) or None
-    
-    # Try to get filename from Content-Disposition header
-    if filename is None:
-        content_disposition = response.headers.get("Content-Disposition")
-        if content_disposition:
-            match = re.search(r'filename="?([^\";]+)"?', content_disposition)
-            if match:
-                filename = match.group(1)
-
-    if filename is None:
-        raise NameError("Filename not specified")
-
-    total_bytes = 0
-    buffer = io.BytesIO()
-    chunk_size = 8192
-    for chunk in response.iter_content(chunk_size=chunk_size):
-        if chunk:
-            total_bytes += len(chunk)
-            if total_bytes > 1024 * 1024 * 1024:
-                raise ValueError("File too large")
-            buffer.write(chunk)
-
-    buffer.seek(0)
-    return FakeFlaskFile(stream=buffer, filename=filename)
-
 @tracks.route("", methods=["GET"])
 @jsonify
+@middleware.queries.query_budget(3)
 @middleware.auth.requires_login
 def get_tracks():
     if not flask.request.is_json:
         return {"error": "Invalid request"}
     
-    user: models.User = middleware.auth.user
-    
+    # Hot libraries are served from a pre-serialized snapshot without loading anything. Snapshots are built
+    # from the primary: a replica may lag behind the change that bumped the version, and a snapshot built
+    # from it would be cached under the new version.
+    user_id = middleware.auth.current_user_id()
+    library_version = library_cache.version(user_id)
+    body = library_cache.get(user_id, library_version)
+    if body is not None:
+        return flask.Response(body, mimetype="application/json", headers={"X-Library-Cache": "hit"})
+
     playlists: list[models.Playlist] = models.Playlist.query.options(
         joinedload(models.Playlist.tracks)
     ).filter_by(
-        owner_id=user.id
+        owner_id=user_id
     ).all()
 
-    return {
+    library = {
         playlist.name: [
             {
                 "id": track.id,
@@ -118,22 +94,184 @@ def get_tracks():
         ] for playlist in playlists
     }
 
+    # The snapshot must not outlive any of the presigned URLs it contains
+    expirations = [track["source_expiration"] for tracks in library.values() for track in tracks if track["source_expiration"]]
+    ttl = (min(expirations) if expirations else time.time() + config.LIBRARY_CACHE_TTL) - time.time()
+    body = flask.current_app.json.response(library).get_data()
+    library_cache.put(user_id, library_version, body, ttl)
+    return flask.Response(body, mimetype="application/json", headers={"X-Library-Cache": "miss"})
+
+def export_library(user_id: int, batch_size: int = 500):
+    """Yields the user's library as JSON chunks in the import format (`[{name, source, playlists}, ...]`).
+    Rows are read through a server-side cursor and presigned a batch at a time, so memory use is constant."""
+
+    rows = models.db.session.execute(
+        models.db.select(
+            models.Track.id,
+            models.Track.name,
+            models.Track.object_key,
+            models.Playlist.name,
+        ).outerjoin(
+            models.PlaylistTrack, models.PlaylistTrack.track_id == models.Track.id
+        ).outerjoin(
+            models.Playlist, models.Playlist.id == models.PlaylistTrack.playlist_id
+        ).where(
+            models.Track.owner_id == user_id,
+            models.Track.deleted_at.is_(None),
+        ).order_by(
+            models.Track.id
+        ).execution_options(yield_per=batch_size)
+    )
+
+    def tracks_with_playlists():
+        current = None
+        for track_id, track_name, object_key, playlist_name in rows:
+            if current is None or current[0] != track_id:
+                if current is not None:
+                    yield current
+                current = (track_id, track_name, object_key, [])
+            if playlist_name is not None:
+                current[3].append(playlist_name)
+        if current is not None:
+            yield current
+
+    def presigned_batch(batch):
+        return ",".join(
+            json.dumps({
+                "name": track_name,
+                "source": generate_presigned_url(object_key, "download", config.EXPORT_URL_EXPIRATION),
+                "playlists": playlists,
+            })
+            for _, track_name, object_key, playlists in batch
+        )
+
+    yield "["
+    separator, batch = "", []
+    for track in tracks_with_playlists():
+        batch.append(track)
+        if len(batch) == batch_size:
+            yield separator + presigned_batch(batch)
+            separator, batch = ",", []
+    if len(batch) > 0:
+        yield separator + presigned_batch(batch)
+    yield "]"
+
+@tracks.route("/export", methods=["GET"])
+@jsonify
+@middleware.limits.rate_limit(10)
+@middleware.auth.requires_login
+@middleware.database.read_only
+def export_tracks():
+    user_id = middleware.auth.user.id
+    return flask.Response(
+        flask.stream_with_context(export_library(user_id)),
+        mimetype="application/json",
+        headers={"Content-Disposition": "attachment; filename=tracks.json"}
+    )
+
+@tracks.route("/search", methods=["GET"])
+@jsonify
+@middleware.queries.query_budget(3)
+@middleware.auth.requires_login
+@middleware.database.read_only
+def search_tracks():
+    query = flask.request.args.get("q", "").strip()
+    if len(query) == 0:
+        return {"error": "Invalid request"}
+
+    try:
+        limit = int(flask.request.args.get("limit", 20))
+        offset = max(0, int(flask.request.args.get("offset", 0)))
+    except ValueError:
+        return {"error": "Invalid request"}
+
+    results, more = search_service.search_tracks(
+        middleware.auth.current_user_id(),
+        query,
+        flask.request.args.getlist("playlist"),
+        limit,
+        offset
+    )
+    return {
+        "tracks": [
+            {
+                "id": track.id,
+                "name": track.name,
+                **(dict(zip(("source", "source_expiration"), source_if_valid(track)))),
+                "size": track.size,
+                "playlists": [playlist.name for playlist in track.playlists],
+            } for track in results
+        ],
+        "next_offset": offset + len(results) if more else None,
+    }
+
+@tracks.route("/events", methods=["POST"])
+@jsonify
+@middleware.limits.rate_limit(1)
+@middleware.queries.query_budget(0)
+@middleware.auth.requires_login
+def record_events():
+    # Events are only counted in memory here, see events_service
+    data = flask.request.get_json(silent=True)
+    events = data.get("events") if isinstance(data, dict) else None
+    if not isinstance(events, list) or len(events) == 0 or len(events) > config.EVENTS_MAX_BATCH:
+        return {"error": "Invalid request"}
+
+    parsed = []
+    for event in events:
+        if not isinstance(event, dict):
+            return {"error": "Invalid request"}
+        track_id, event_type = event.get("track_id"), event.get("type")
+        if type(track_id) is not int or event_type not in events_service.EVENT_TYPES:
+            return {"error": "Invalid event"}
+        parsed.append((track_id, event_type))
+
+    accepted = events_service.record(middleware.auth.current_user_id(), parsed)
+    response = flask.current_app.json.response({"accepted": accepted})
+    response.status_code = 202
+    return response
+
+@tracks.route("/stats", methods=["GET"])
+@jsonify
+@middleware.queries.query_budget(1)
+@middleware.auth.requires_login
+@middleware.database.read_only
+def get_stats():
+    try:
+        days = min(max(1, int(flask.request.args.get("days", 30))), 365)
+    except ValueError:
+        return {"error": "Invalid request"}
+
+    stats = events_service.recent_stats(middleware.auth.current_user_id(), days)
+    return {
+        "days": days,
+        "tracks": [
+            {"id": track_id, "plays": plays, "skips": skips, "stops": stops}
+            for track_id, plays, skips, stops in stats
+        ],
+    }
+
 @tracks.route("/<track_id>", methods=["GET"])
 @jsonify
+@middleware.queries.query_budget(5)
 @middleware.auth.requires_login
 def get_track(track_id):
     if not flask.request.is_json:
         return {"error": "Invalid request"}
     track: models.Track = models.Track.query.filter_by(
         id=int(track_id),
-        owner_id=middleware.auth.user.id
+        owner_id=middleware.auth.user.id,
+        deleted_at=None
     ).first()
 
     if track is None:
         return {"error": "Invalid track"}
     
     track_source, source_expiration = source_if_valid(track, True)
+    refreshed = models.db.session.is_modified(track)
     models.db.session.commit()
+    if refreshed:
+        library_cache.invalidate(track.owner_id)
     
     return {
         "id": track.id,
@@ -144,8 +282,72 @@ def get_track(track_id):
         "playlists": [playlist.name for playlist in track.playlists]
     }
 
+@tracks.route("/resolve", methods=["POST"])
+@jsonify
+@middleware.limits.rate_limit(2)
+@middleware.queries.query_budget(4)
+@middleware.auth.requires_login
+def resolve_tracks():
+    if not flask.request.is_json:
+        return {"error": "Invalid request"}
+
+    track_ids = flask.request.json.get("track_ids", [])
+    playlist_names = flask.request.json.get("playlists", [])
+
+    if not isinstance(track_ids, list) or not all(isinstance(track_id, int) for track_id in track_ids):
+        return {"error": "Invalid request"}
+    if not isinstance(playlist_names, list) or not all(isinstance(name, str) for name in playlist_names):
+        return {"error": "Invalid request"}
+
+    user_id = middleware.auth.user.id
+    playlist_track_ids = models.db.select(models.PlaylistTrack.track_id).join(
+        models.Playlist, models.Playlist.id == models.PlaylistTrack.playlist_id
+    ).where(
+        models.Playlist.owner_id == user_id,
+        models.Playlist.name.in_(playlist_names),
+    )
+    resolved_tracks: list[models.Track] = models.Track.query.options(
+        joinedload(models.Track.playlists)
+    ).filter(
+        models.Track.owner_id == user_id,
+        models.Track.deleted_at.is_(None),
+        models.db.or_(
+            models.Track.id.in_(track_ids),
+            models.Track.id.in_(playlist_track_ids),
+        )
+    ).order_by(models.Track.id).all()
+
+    requested_playlists = set(playlist_names)
+    result = {
+        "tracks": [],
+        "playlists": {name: [] for name in requested_playlists},
+    }
+    for track in resolved_tracks:
+        track_source, source_expiration = source_if_valid(track, True)
+        track_playlists = [playlist.name for playlist in track.playlists]
+        result["tracks"].append({
+            "id": track.id,
+            "name": track.name,
+            "source": track_source,
+            "source_expiration": source_expiration,
+            "size": track.size,
+            "playlists": track_playlists,
+        })
+        for name in requested_playlists.intersection(track_playlists):
+            result["playlists"][name].append(track.id)
+
+    # Only the tracks whose presigned URL was refreshed are written back
+    refreshed = len(models.db.session.dirty) > 0
+    models.db.session.commit()
+    if refreshed:
+        library_cache.invalidate(user_id)
+    return result
+
 @tracks.route("/new", methods=["POST"])
 @jsonify
+@middleware.limits.rate_limit(5)
+@middleware.limits.concurrency_limit("uploads", config.MAX_CONCURRENT_UPLOADS)
+@middleware.deadlines.time_limit(config.TRANSFER_DEADLINE)
 @middleware.auth.requires_login
 def create_track():
     metadata = json.loads(flask.request.form.get("metadata", "{}"))
@@ -157,74 +359,121 @@ def create_track():
     if uploaded_file is None and file_source is None:
         return {"error": "No file provided"}
 
+    if track_name is None:
+        return {"error": "Invalid request"}
+
+    available_storage = middleware.auth.user.available_storage()
+
     if uploaded_file is None:
         try:
-            uploaded_file = download_file(file_source)
+            remote_file = import_service.preflight(file_source, available_storage)
+        except import_service.ImportRejected as e:
+            return {"error": str(e)}
         except Exception as e:
             return {"error": f"Error downloading file ({str(e)})"}
+        filename, mime = remote_file.filename, remote_file.mime
+    else:
+        import magic
 
-    if track_name is None:
-        return {"error": "Invalid request"}
+        uploaded_file.stream.seek(0)
+        file_sample = uploaded_file.stream.read(import_service.SNIFF_SIZE)
+        filename, mime = uploaded_file.filename, magic.from_buffer(file_sample, mime=True)
 
-    uploaded_file.stream.seek(0)
+        uploaded_file.stream.seek(0, 2)
+        file_size = uploaded_file.stream.tell()
+        uploaded_file.stream.seek(0)
 
-    file_sample = uploaded_file.stream.read()
-    mime = magic.from_buffer(file_sample, mime=True)
+        if file_size > available_storage:
+            return {"error": "File size exceeds your quota"}
 
     if not mime.startswith("audio/"):
+        if uploaded_file is None:
+            remote_file.close()
         return {"error": "Invalid file type (only audio allowed)"}
-    
-    uploaded_file.stream.seek(0, 2)
-    file_size = uploaded_file.stream.tell()
-    uploaded_file.stream.seek(0)
 
-    if file_size > middleware.auth.user.available_storage():
-        return {"error": "File size exceeds your quota"}
-    
-    extension = uploaded_file.filename.rsplit(".", 1)[-1].lower()
+    extension = filename.rsplit(".", 1)[-1].lower()
     object_key = f"user_{middleware.auth.user.id}/track_{uuid.uuid4()}.{extension}"
 
     try:
-        config.S3_CLIENT.upload_fileobj(
-            uploaded_file.stream,
-            config.S3_BUCKET_NAME,
-            object_key,
-            ExtraArgs={
-                "ContentType": mime,
-                "ACL": "private"
-            }
-        )
+        if uploaded_file is None:
+            file_size = import_service.transfer(remote_file, config.S3_BUCKET_NAME, object_key, mime, available_storage)
+        else:
+            clients.s3_client().upload_fileobj(
+                uploaded_file.stream,
+                config.S3_BUCKET_NAME,
+                object_key,
+                ExtraArgs={
+                    "ContentType": mime,
+                    "ACL": "private"
+                }
+            )
+    except import_service.ImportRejected as e:
+        return {"error": str(e)}
     except Exception as e:
         traceback.print_exc()
         return {"error": f"Upload failed: {str(e)}", "status_code": 500}
 
+    return add_track(middleware.auth.user.id, track_name, file_size, object_key, playlists)
+
+@tracks.route("/batch", methods=["POST"])
+@jsonify
+@middleware.limits.rate_limit(5)
+@middleware.limits.concurrency_limit("uploads", config.MAX_CONCURRENT_UPLOADS)
+@middleware.deadlines.time_limit(config.TRANSFER_DEADLINE)
+@middleware.queries.query_budget(12)
+@middleware.auth.requires_login
+def create_tracks():
+    """Creates a track for each file of a multipart body. Its `metadata` field holds a JSON object whose `tracks`
+    list has the `track_name` and `playlists` of every file, in the order the files appear in the body."""
+    from werkzeug.exceptions import RequestEntityTooLarge
+
+    boundary = flask.request.mimetype_params.get("boundary")
+    if flask.request.mimetype != "multipart/form-data" or not boundary:
+        return {"error": "Invalid request"}
+
+    user_id = middleware.auth.user.id
+    available_storage = middleware.auth.user.available_storage()
+    # The session isn't needed while the files are received, so its connection goes back to the pool
+    models.db.session.rollback()
+
     try:
-        set_playlists = set(playlists)
-        existing_playlists = models.Playlist.query.filter_by(
-            owner_id=middleware.auth.user.id
-        ).all()
-        existing_playlist_names = set(playlist.name for playlist in existing_playlists)
+        batch = batch_upload_service.receive(flask.request.stream, boundary, user_id, available_storage)
+        created = batch_upload_service.create_tracks(user_id, batch)
+    except batch_upload_service.BatchRejected as e:
+        return {"error": str(e)}
+    except RequestEntityTooLarge:
+        return {"error": "Request too large", "status_code": 413}
+    except outbound.DeadlineExceeded:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        return {"error": f"Upload failed: {str(e)}", "status_code": 500}
 
-        new_playlists = set_playlists.difference(existing_playlist_names)
-        new_playlist_objects = [
-            models.Playlist(
-                name=playlist_name,
-                owner_id=middleware.auth.user.id
-            )
-            for playlist_name in new_playlists
-        ]
-        models.db.session.add_all(new_playlist_objects)
+    return {
+        "tracks": created,
+        "rejected": [{"position": position, "filename": filename, "error": error} for position, filename, error in batch.rejected],
+        "used_storage": middleware.auth.user.used_storage(),
+    }
 
-        total_playlists = [playlist for playlist in existing_playlists if playlist.name in set_playlists] + [playlist for playlist in new_playlist_objects]
+def add_track(owner_id: int, track_name: str, size: int, object_key: str, playlists: list[str], upload: models.UploadSession | None = None):
+    """Creates the track of an uploaded object and adds it to its playlists, deleting the upload session it
+    came from, if any, in the same transaction."""
+    try:
         new_track = models.Track(
-            owner_id=middleware.auth.user.id,
+            owner_id=owner_id,
             name=track_name,
-            size=file_size,
+            size=size,
             object_key=object_key,
-            playlists=total_playlists
         )
         models.db.session.add(new_track)
+        models.db.session.flush()
+
+        playlist_ids = playlist_service.resolve_playlists(owner_id, playlists)
+        playlist_service.add_tracks_to_playlists([new_track.id], playlist_ids.values())
+        if upload is not None:
+            models.db.session.delete(upload)
         models.db.session.commit()
+        library_cache.invalidate(owner_id)
     except Exception as e:
         traceback.print_exc()
         return {"error": f"Track creation failed: {str(e)}", "status_code": 500}
@@ -234,7 +483,328 @@ def create_track():
         "name": new_track.name,
         "source": None,
         "size": new_track.size,
-        "playlists": [playlist.name for playlist in total_playlists]
+        "playlists": list(playlist_ids)
+    }
+
+def upload_status(upload: models.UploadSession, **kwargs):
+    """Returns the state of an upload session, with tus-style headers for clients that only look at those."""
+    response = flask.current_app.json.response({
+        "id": upload.id,
+        "offset": upload.received,
+        "size": upload.size,
+        "chunk_size": upload.chunk_size,
+        "expires_at": upload.expires_at.replace(tzinfo=datetime.timezone.utc).timestamp(),
+        **kwargs,
+    })
+    response.headers["Upload-Offset"] = str(upload.received)
+    response.headers["Upload-Length"] = str(upload.size)
+    response.headers["Upload-Expires"] = upload.expires_at.replace(tzinfo=datetime.timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT")
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+@tracks.route("/uploads", methods=["POST"])
+@jsonify
+@middleware.limits.rate_limit(5)
+@middleware.auth.requires_login
+def create_upload():
+    if not flask.request.is_json:
+        return {"error": "Invalid request"}
+
+    track_name = flask.request.json.get("track_name")
+    playlists = flask.request.json.get("playlists", [])
+    filename = flask.request.json.get("filename")
+    size = flask.request.json.get("size")
+    if track_name is None or filename is None or not isinstance(size, int) or not isinstance(playlists, list):
+        return {"error": "Invalid request"}
+
+    try:
+        upload = upload_service.create(middleware.auth.user, track_name, playlists, filename, size)
+        models.db.session.commit()
+    except upload_service.UploadRejected as e:
+        return {"error": str(e), "status_code": e.status_code}
+
+    response = upload_status(upload)
+    response.status_code = 201
+    response.headers["Location"] = flask.url_for("tracks.upload_offset", upload_id=upload.id)
+    return response
+
+@tracks.route("/uploads/<upload_id>", methods=["GET"])
+@jsonify
+@middleware.auth.requires_login
+def upload_offset(upload_id):
+    upload = upload_service.find(middleware.auth.current_user_id(), upload_id)
+    if upload is None:
+        return {"error": "Upload not found", "status_code": 404}
+    return upload_status(upload)
+
+@tracks.route("/uploads/<upload_id>", methods=["PATCH"])
+@jsonify
+@middleware.limits.rate_limit(1)
+@middleware.limits.concurrency_limit("uploads", config.MAX_CONCURRENT_UPLOADS)
+@middleware.deadlines.time_limit(config.TRANSFER_DEADLINE)
+@middleware.auth.requires_login
+def upload_chunk(upload_id):
+    offset = flask.request.headers.get("Upload-Offset", "")
+    if not offset.isdigit():
+        return {"error": "Missing Upload-Offset header"}
+
+    upload = upload_service.find(middleware.auth.current_user_id(), upload_id)
+    if upload is None:
+        return {"error": "Upload not found", "status_code": 404}
+
+    # Refuse oversized chunks before reading them
+    if flask.request.content_length is None or flask.request.content_length > upload.chunk_size:
+        return {"error": f"Chunks must be at most {upload.chunk_size} bytes", "status_code": 413}
+
+    try:
+        upload_service.write_chunk(
+            upload,
+            int(offset),
+            flask.request.get_data(cache=False),
+            flask.request.headers.get("Upload-Checksum")
+        )
+    except upload_service.UploadRejected as e:
+        return {"error": str(e), "status_code": e.status_code}
+    return upload_status(upload)
+
+@tracks.route("/uploads/<upload_id>/complete", methods=["POST"])
+@jsonify
+@middleware.limits.rate_limit(2)
+@middleware.deadlines.time_limit(config.TRANSFER_DEADLINE)
+@middleware.auth.requires_login
+def complete_upload(upload_id):
+    upload = upload_service.find(middleware.auth.current_user_id(), upload_id)
+    if upload is None:
+        return {"error": "Upload not found", "status_code": 404}
+
+    # Other uploads may have been completed since this one was started
+    if upload.size > middleware.auth.user.available_storage():
+        upload_service.abort(upload)
+        models.db.session.commit()
+        return {"error": "File size exceeds your quota"}
+
+    try:
+        upload_service.complete(upload)
+    except upload_service.UploadRejected as e:
+        return {"error": str(e), "status_code": e.status_code}
+    except Exception as e:
+        traceback.print_exc()
+        return {"error": f"Upload failed: {str(e)}", "status_code": 500}
+
+    return add_track(upload.owner_id, upload.track_name, upload.size, upload.object_key, upload.playlists, upload)
+
+@tracks.route("/uploads/<upload_id>", methods=["DELETE"])
+@jsonify
+@middleware.auth.requires_login
+def delete_upload(upload_id):
+    upload = upload_service.find(middleware.auth.current_user_id(), upload_id)
+    if upload is None:
+        return {"error": "Upload not found", "status_code": 404}
+
+    upload_service.abort(upload)
+    models.db.session.commit()
+    return {"result": "Upload cancelled"}
+
+def parse_track_edit(edit) -> dict | None:
+    """Returns the validated edit of a track, or `None` if it is invalid."""
+    if not isinstance(edit, dict) or not isinstance(edit.get("id"), int):
+        return None
+
+    name = edit.get("name")
+    if name is not None and (not isinstance(name, str) or not 0 < len(name) <= 64):
+        return None
+
+    playlists = {}
+    for field in ("add_playlists", "remove_playlists"):
+        names = edit.get(field, [])
+        if not isinstance(names, list) or not all(isinstance(playlist, str) and 0 < len(playlist) <= 64 for playlist in names):
+            return None
+        playlists[field] = set(names)
+    if len(playlists["add_playlists"] & playlists["remove_playlists"]) > 0:
+        return None
+
+    return {"id": edit["id"], "name": name, **playlists}
+
+def edit_tracks(owner_id: int, edits: list[dict]):
+    """Renames tracks and adds them to or removes them from playlists in a single transaction, with one
+    statement per kind of change however many tracks are edited. Their objects are left alone."""
+    session = models.db.session
+    track_ids = set(edit["id"] for edit in edits)
+    if len(track_ids) < len(edits):
+        return {"error": "Invalid request"}
+
+    # Locking the tracks keeps them from being deleted (and leaving their playlists) until this commits
+    found_ids = session.scalars(
+        models.db.select(models.Track.id).where(
+            models.Track.owner_id == owner_id,
+            models.Track.id.in_(track_ids),
+            models.Track.deleted_at.is_(None),
+        ).with_for_update()
+    ).all()
+    if len(found_ids) < len(track_ids):
+        session.rollback()
+        return {"error": "Invalid track"}
+
+    try:
+        renames = {edit["id"]: edit["name"] for edit in edits if edit["name"] is not None}
+        if len(renames) > 0:
+            session.execute(
+                models.db.update(models.Track).where(
+                    models.Track.id.in_(renames)
+                ).values(
+                    name=models.db.case(renames, value=models.Track.id)
+                )
+            )
+
+        added = [(edit["id"], name) for edit in edits for name in edit["add_playlists"]]
+        playlist_ids = playlist_service.resolve_playlists(owner_id, (name for _, name in added))
+        playlist_service.add_memberships((track_id, playlist_ids[name]) for track_id, name in added)
+        playlist_service.remove_memberships(owner_id, ((edit["id"], name) for edit in edits for name in edit["remove_playlists"]))
+
+        session.commit()
+        library_cache.invalidate(owner_id)
+    except Exception as e:
+        traceback.print_exc()
+        return {"error": f"Couldn't update tracks ({str(e)})", "status_code": 500}
+
+    return None
+
+@tracks.route("/<track_id>", methods=["PATCH"])
+@jsonify
+@middleware.queries.query_budget(10)
+@middleware.auth.requires_login
+def update_track(track_id):
+    if not flask.request.is_json:
+        return {"error": "Invalid request"}
+
+    edit = parse_track_edit({**flask.request.json, "id": int(track_id)})
+    if edit is None:
+        return {"error": "Invalid request"}
+
+    user_id = middleware.auth.user.id
+    error = edit_tracks(user_id, [edit])
+    if error is not None:
+        return error
+
+    track: models.Track = models.Track.query.options(
+        joinedload(models.Track.playlists)
+    ).filter_by(
+        id=edit["id"],
+        owner_id=user_id,
+    ).first()
+    return {
+        "id": track.id,
+        "name": track.name,
+        "size": track.size,
+        "playlists": [playlist.name for playlist in track.playlists],
+    }
+
+@tracks.route("", methods=["PATCH"])
+@jsonify
+@middleware.limits.rate_limit(2)
+@middleware.queries.query_budget(10)
+@middleware.auth.requires_login
+def update_tracks():
+    if not flask.request.is_json:
+        return {"error": "Invalid request"}
+
+    edits = flask.request.json.get("tracks")
+    if not isinstance(edits, list) or len(edits) == 0:
+        return {"error": "Invalid request"}
+    edits = [parse_track_edit(edit) for edit in edits]
+    if any(edit is None for edit in edits):
+        return {"error": "Invalid request"}
+
+    error = edit_tracks(middleware.auth.user.id, edits)
+    if error is not None:
+        return error
+    return {"result": "Success", "updated": len(edits)}
+
+@tracks.route("/shares", methods=["POST"])
+@jsonify
+@middleware.queries.query_budget(4)
+@middleware.auth.requires_login
+def share_playlist():
+    if not flask.request.is_json:
+        return {"error": "Invalid request"}
+
+    playlist_name = flask.request.json.get("playlist")
+    if not isinstance(playlist_name, str):
+        return {"error": "Invalid request"}
+
+    code = share_service.publish(middleware.auth.user.id, playlist_name)
+    if code is None:
+        return {"error": "Invalid playlist"}
+    models.db.session.commit()
+    return {"code": code}
+
+@tracks.route("/shares", methods=["DELETE"])
+@jsonify
+@middleware.queries.query_budget(4)
+@middleware.auth.requires_login
+def unshare_playlist():
+    if not flask.request.is_json:
+        return {"error": "Invalid request"}
+
+    playlist_name = flask.request.json.get("playlist")
+    if not isinstance(playlist_name, str):
+        return {"error": "Invalid request"}
+
+    if not share_service.unpublish(middleware.auth.user.id, playlist_name):
+        return {"error": "Invalid playlist"}
+    models.db.session.commit()
+    return {"result": "Success"}
+
+@tracks.route("/shares/<code>", methods=["GET"])
+@jsonify
+@middleware.queries.query_budget(4)
+@middleware.auth.requires_login
+@middleware.database.read_only
+def get_shared_playlist(code):
+    playlist = share_service.shared_playlist(code)
+    if playlist is None:
+        return {"error": "Invalid share code", "status_code": 404}
+
+    tracks = [track for track in playlist.tracks if track.deleted_at is None]
+    return {
+        "playlist": playlist.name,
+        "owner": playlist.owner.username,
+        "tracks": [{"name": track.name, "size": track.size} for track in tracks],
+        "size": sum(track.size for track in tracks),
+    }
+
+@tracks.route("/shares/<code>/clone", methods=["POST"])
+@jsonify
+@middleware.limits.rate_limit(5)
+@middleware.deadlines.time_limit(config.TRANSFER_DEADLINE)
+@middleware.queries.query_budget(14)
+@middleware.auth.requires_login
+def clone_shared_playlist(code):
+    if not flask.request.is_json:
+        return {"error": "Invalid request"}
+
+    playlist_name = flask.request.json.get("playlist")
+    copy = flask.request.json.get("copy", False)
+    if (playlist_name is not None and (not isinstance(playlist_name, str) or not 0 < len(playlist_name) <= 64)) or not isinstance(copy, bool):
+        return {"error": "Invalid request"}
+
+    try:
+        playlist_name, new_tracks = share_service.clone(middleware.auth.user, code, playlist_name, copy)
+    except share_service.ShareRejected as e:
+        return {"error": str(e)}
+    except outbound.DeadlineExceeded:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        return {"error": f"Couldn't add the playlist ({str(e)})", "status_code": 500}
+
+    return {
+        "playlist": playlist_name,
+        "tracks": [
+            {**track, "playlists": [playlist_name]}
+            for track in new_tracks
+        ],
+        "used_storage": middleware.auth.user.used_storage(),
     }
 
 @tracks.route("/<track_id>", methods=["DELETE"])
@@ -244,20 +814,58 @@ def delete_track(track_id):
     if not flask.request.is_json:
         return {"error": "Invalid request"}
     
-    track = models.Track.query.filter_by(
-        id=int(track_id),
-        owner_id=middleware.auth.user.id
-    ).first()
+    try:
+        deleted = purge_service.soft_delete_tracks(middleware.auth.user.id, [int(track_id)])
+        models.db.session.commit()
+        library_cache.invalidate(middleware.auth.user.id)
+    except Exception as e:
+        traceback.print_exc()
+        return {"error": f"Couldn't delete track ({str(e)})", "status_code": 500}
 
-    if track is None:
+    if deleted == 0:
         return {"error": "Invalid track"}
 
+    purge_service.wake_purger()
+    return {"result": "Success"}
+
+@tracks.route("", methods=["DELETE"])
+@jsonify
+@middleware.auth.requires_login
+def delete_tracks():
+    if not flask.request.is_json:
+        return {"error": "Invalid request"}
+
+    track_ids = flask.request.json.get("ids")
+    playlist_name = flask.request.json.get("playlist")
+
+    if (track_ids is None) == (playlist_name is None):
+        return {"error": "Invalid request"}
+
+    user_id = middleware.auth.user.id
+    playlist = None
+    if playlist_name is not None:
+        playlist = models.Playlist.query.filter_by(owner_id=user_id, name=playlist_name).first()
+        if playlist is None:
+            return {"error": "Invalid playlist"}
+        track_ids = models.db.session.scalars(
+            models.db.select(models.PlaylistTrack.track_id).filter_by(playlist_id=playlist.id)
+        ).all()
+    elif not isinstance(track_ids, list) or not all(isinstance(track_id, int) for track_id in track_ids):
+        return {"error": "Invalid request"}
+
     try:
-        config.S3_CLIENT.delete_object(Bucket=config.S3_BUCKET_NAME, Key=track.object_key)
-        models.db.session.delete(track)
+        deleted = purge_service.soft_delete_tracks(user_id, track_ids)
+        if playlist is not None:
+            models.db.session.delete(playlist)
         models.db.session.commit()
+        library_cache.invalidate(user_id)
     except Exception as e:
         traceback.print_exc()
-        return {"error": f"Couldn't delete track ({str(e)})", "status_code": 500}
-    
-    return {"result": "Success"}
+        return {"error": f"Couldn't delete tracks ({str(e)})", "status_code": 500}
+
+    purge_service.wake_purger()
+    return {
+        "result": "Success",
+        "deleted": deleted,
+        "used_storage": middleware.auth.user.used_storage(),
+    }
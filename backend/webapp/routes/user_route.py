@@ -6,14 +6,13 @@ import datetime
 import os
 import traceback
 
-import bcrypt
 import flask
 import secrets
 
 
 import config
 from .. import middleware, models
-from ..services import EmailClient
+from ..services import clients
 from .utils import jsonify, valid_email, valid_username
 
 
@@ -21,7 +20,9 @@ user = flask.Blueprint("user", __name__, url_prefix="/user")
 
 @user.route("", methods=["GET"])
 @jsonify
+@middleware.queries.query_budget(2)
 @middleware.auth.supports_login
+@middleware.database.read_only
 def status():
     if not flask.request.is_json:
         return {"error": "Invalid request"}
@@ -39,6 +40,7 @@ def status():
 
 @user.route("", methods=["PUT"])
 @jsonify
+@middleware.limits.rate_limit(20)
 def create_user():
     if not flask.request.is_json:
         return {"error": "Invalid request"}
@@ -71,6 +73,8 @@ def create_user():
     if matched_user is not None and matched_user.verified:
         return {"error": "A user already exists with that email"}
 
+    import bcrypt
+
     verification_code = secrets.token_urlsafe(32)
     hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
     verification_code_expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=10)
@@ -96,14 +100,7 @@ def create_user():
         with open(os.path.join(os.path.dirname(__file__), "..", "services", "resources", "new_user_email_template.html"), "r") as f:
             email_html = f.read().replace("{verification_url}", verification_url)
             
-        ec = EmailClient(
-            config.EMAIL_USER,
-            config.EMAIL_PASSWORD,
-            config.EMAIL_SERVER,
-            config.EMAIL_PORT,
-            config.EMAIL_NAME,
-        )
-        ec.send_email(
+        clients.email_client().send_email(
             "Hoot - Verify your email",
             f"To verify your account, please follow visit this website: {verification_url}",
             email_html,
@@ -7,11 +7,11 @@ import sys
 import traceback
 from functools import wraps
 
-import email_validator
 import flask
 
 sys.path.append(".")
 import config
+from ..services import outbound
 
 USERNAME_REGEX = r"^(?! )[A-Za-z0-9 _-]{1,63}(?<! )$"
 
@@ -21,6 +21,9 @@ def jsonify(func):
     def wrapper(*args, **kwargs):
         try:
             result = func(*args, **kwargs)
+        except outbound.DeadlineExceeded:
+            flask.current_app.logger.warning(f"Route function '{func.__name__}' ran past its deadline")
+            return {"error": "The request took too long, please try again later"}, 504
         except Exception as e:
             flask.current_app.logger.exception(f"Unhandled exception in route function '{func.__name__}'")
             if config.ENVIRONMENT == "prod":
@@ -29,6 +32,9 @@ def jsonify(func):
                 traceback_details = traceback.extract_tb(sys.exc_info()[2])
                 filename, line, *_ = traceback_details[-1]
                 return {"error": str(e), "traceback": traceback.format_exc(), "file": filename, "line": line}, 500
+        if isinstance(result, flask.Response):
+            # Streamed and other pre-built responses are returned as they are
+            return result
         status_code = 200
         if "error" in result:
             if "status_code" in result:
@@ -48,6 +54,8 @@ def valid_username(username: str):
     return re.fullmatch(USERNAME_REGEX, username) is not None
 
 def valid_email(email: str):
+    import email_validator
+
     if len(email) > 128:
         return False
     try:
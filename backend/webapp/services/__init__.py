@@ -1,5 +1,22 @@
 __all__ = [
     "EmailClient",
+    "batch_upload_service",
+    "clients",
+    "events_service",
+    "gc_service",
+    "import_service",
+    "library_cache",
+    "maintenance_service",
+    "outbound",
+    "playlist_service",
+    "presign_service",
+    "purge_service",
+    "rehearsal_service",
+    "relay_service",
+    "search_service",
+    "share_service",
+    "upload_service",
 ]
 
+from . import batch_upload_service, clients, events_service, gc_service, import_service, library_cache, maintenance_service, outbound, playlist_service, presign_service, purge_service, rehearsal_service, relay_service, search_service, share_service, upload_service
 from .email_service import EmailClient
@@ -0,0 +1,227 @@
+"""Uploads of many files in a single multipart request.
+
+The body is parsed as it arrives rather than after it has been received in full. Each file is spooled
+(in memory, then on disk past `SPOOL_MEMORY_SIZE`), and its upload to storage starts as soon as the
+file ends, on a pool of `UPLOAD_BATCH_PARALLELISM` threads, while the following files are still being
+received. Once every file has been uploaded, their tracks are created in a single transaction."""
+
+__all__ = [
+    "BatchRejected",
+    "BatchUpload",
+    "create_tracks",
+    "receive",
+]
+
+import json
+import logging
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import insert
+
+import config
+from .. import models
+from . import clients, library_cache, outbound, playlist_service, purge_service
+
+
+READ_SIZE = 64 * 1024
+SNIFF_SIZE = 8192
+SPOOL_MEMORY_SIZE = 1024 * 1024
+MAX_FORM_MEMORY_SIZE = 1024 * 1024
+
+
+class BatchRejected(Exception):
+    """Raised when a batch can't be uploaded. The message is meant to be shown to the user."""
+    pass
+
+
+class _SpooledFile:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_SIZE)
+        self.size = 0
+        self.sample = b""
+
+    def write(self, data: bytes):
+        if len(self.sample) < SNIFF_SIZE:
+            self.sample += data[:SNIFF_SIZE - len(self.sample)]
+        self.file.write(data)
+        self.size += len(data)
+
+
+class BatchUpload:
+    """Files received in a batch: the ones uploaded to storage, and the ones rejected with the reason why."""
+
+    def __init__(self):
+        # (position in the body, filename, size, object_key)
+        self.uploaded = []
+        # (position in the body, filename, error)
+        self.rejected = []
+        self.files = 0
+        self.metadata = None
+
+
+def _upload(spooled: _SpooledFile, object_key: str, mime: str, request_deadline: float | None):
+    from boto3.s3.transfer import TransferConfig
+
+    try:
+        with outbound.deadline(request_deadline):
+            outbound.check_deadline()
+            spooled.file.seek(0)
+            # The pool already bounds how many transfers run at once
+            clients.s3_client().upload_fileobj(
+                spooled.file,
+                config.S3_BUCKET_NAME,
+                object_key,
+                ExtraArgs={"ContentType": mime, "ACL": "private"},
+                Config=TransferConfig(use_threads=False),
+            )
+    finally:
+        spooled.file.close()
+
+def receive(stream, boundary: str, owner_id: int, available_storage: int) -> BatchUpload:
+    """Reads a multipart body from `stream`, uploading its files as they arrive. The body must have a
+    `metadata` field, anywhere in it. Files that aren't audio are rejected; if the files don't fit in
+    `available_storage` or any upload fails, every object uploaded so far is deleted and the error is raised."""
+    import magic
+    from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+    decoder = MultipartDecoder(boundary.encode(), MAX_FORM_MEMORY_SIZE, max_parts=config.UPLOAD_BATCH_MAX_FILES * 2)
+    batch = BatchUpload()
+    request_deadline = outbound.current_deadline()
+    pending = []
+    total_size = 0
+    position = 0
+    current = None
+    field = None
+
+    executor = ThreadPoolExecutor(config.UPLOAD_BATCH_PARALLELISM)
+    try:
+        finished = False
+        while not finished:
+            chunk = stream.read(READ_SIZE)
+            decoder.receive_data(chunk if len(chunk) > 0 else None)
+            event = decoder.next_event()
+            while not isinstance(event, NeedData):
+                if isinstance(event, File):
+                    current = _SpooledFile(event.filename or "")
+                elif isinstance(event, Field):
+                    field = (event.name, bytearray())
+                elif isinstance(event, Data) and current is not None:
+                    current.write(event.data)
+                    if not event.more_data:
+                        spooled, current = current, None
+                        mime = magic.from_buffer(spooled.sample, mime=True)
+                        if not mime.startswith("audio/"):
+                            batch.rejected.append((position, spooled.filename, "Invalid file type (only audio allowed)"))
+                            spooled.file.close()
+                        else:
+                            total_size += spooled.size
+                            if total_size > available_storage:
+                                spooled.file.close()
+                                raise BatchRejected("Files exceed your quota")
+                            extension = spooled.filename.rsplit(".", 1)[-1].lower()
+                            object_key = f"user_{owner_id}/track_{uuid.uuid4()}.{extension}"
+                            batch.uploaded.append((position, spooled.filename, spooled.size, object_key))
+                            pending.append(executor.submit(_upload, spooled, object_key, mime, request_deadline))
+                            # Stop reading while too many files wait for their upload, so that they don't pile up on disk
+                            if len(pending) - sum(future.done() for future in pending) >= config.UPLOAD_BATCH_PARALLELISM * 2:
+                                next(future for future in pending if not future.done()).result()
+                        position += 1
+                        if position > config.UPLOAD_BATCH_MAX_FILES:
+                            raise BatchRejected(f"Too many files (at most {config.UPLOAD_BATCH_MAX_FILES})")
+                elif isinstance(event, Data) and field is not None:
+                    field[1].extend(event.data)
+                    if not event.more_data:
+                        if field[0] == "metadata":
+                            try:
+                                batch.metadata = json.loads(field[1])
+                            except ValueError:
+                                raise BatchRejected("Invalid metadata")
+                        field = None
+                elif isinstance(event, Epilogue):
+                    finished = True
+                    break
+                event = decoder.next_event()
+            if len(chunk) == 0:
+                finished = True
+
+        if current is not None or field is not None:
+            raise BatchRejected("Incomplete request")
+        for future in pending:
+            future.result()
+        batch.files = position
+    except BaseException:
+        if current is not None:
+            current.file.close()
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        with outbound.deadline(None):
+            failed_keys = purge_service.delete_objects(object_key for _, _, _, object_key in batch.uploaded)
+        if len(failed_keys) > 0:
+            logging.warning(f"Couldn't delete {len(failed_keys)} objects of a failed batch upload")
+        raise
+    executor.shutdown()
+
+    return batch
+
+def _track_metadata(batch: BatchUpload) -> list[dict] | None:
+    tracks = batch.metadata.get("tracks") if isinstance(batch.metadata, dict) else None
+    if not isinstance(tracks, list) or len(tracks) != batch.files:
+        return None
+    for track in tracks:
+        if not isinstance(track, dict):
+            return None
+        name, playlists = track.get("track_name"), track.get("playlists", [])
+        if not isinstance(name, str) or not 0 < len(name) <= 64:
+            return None
+        if not isinstance(playlists, list) or not all(isinstance(playlist, str) and 0 < len(playlist) <= 64 for playlist in playlists):
+            return None
+    return tracks
+
+def create_tracks(owner_id: int, batch: BatchUpload) -> list[dict]:
+    """Creates the tracks of the uploaded files and adds them to their playlists in a single transaction.
+    The batch's metadata must hold the name and playlists of every file of the batch, in order. Returns the
+    new tracks. Deletes the uploaded objects if the tracks can't be created."""
+    session = models.db.session
+    try:
+        tracks = _track_metadata(batch)
+        if tracks is None:
+            raise BatchRejected("Invalid metadata")
+
+        created = [
+            {
+                "name": tracks[position]["track_name"],
+                "size": size,
+                "playlists": sorted(set(tracks[position].get("playlists", []))),
+                "object_key": object_key,
+            }
+            for position, _, size, object_key in batch.uploaded
+        ]
+        if len(created) > 0:
+            # A single multi-row insert. Object keys are unique, so they tell which id each track got.
+            track_ids = dict(session.execute(
+                insert(models.Track).values([
+                    {"owner_id": owner_id, "name": track["name"], "size": track["size"], "object_key": track["object_key"]}
+                    for track in created
+                ]).returning(models.Track.object_key, models.Track.id)
+            ).all())
+            for track in created:
+                track["id"] = track_ids[track.pop("object_key")]
+
+        playlist_ids = playlist_service.resolve_playlists(owner_id, set(name for track in created for name in track["playlists"]))
+        playlist_service.add_memberships(
+            (track["id"], playlist_ids[name])
+            for track in created
+            for name in track["playlists"]
+        )
+        session.commit()
+    except Exception:
+        session.rollback()
+        purge_service.delete_objects(object_key for _, _, _, object_key in batch.uploaded)
+        raise
+
+    library_cache.invalidate(owner_id)
+    return created
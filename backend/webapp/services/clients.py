@@ -0,0 +1,166 @@
+"""Lazily created, per-process clients for external services.
+
+Heavy third-party modules (boto3, patreon, ...) are only imported the first time a client is needed,
+and clients are never shared across a fork: each worker builds its own after it starts."""
+
+__all__ = [
+    "email_client",
+    "patreon_api",
+    "patreon_oauth",
+    "preload_modules",
+    "redis_client",
+    "s3_client",
+]
+
+import importlib
+import os
+import threading
+
+import config
+from . import outbound
+
+
+HEAVY_MODULES = [
+    "bcrypt",
+    "boto3",
+    "botocore.exceptions",
+    "email_validator",
+    "magic",
+    "patreon",
+    "redis",
+    "requests",
+]
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def _reset_after_fork():
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _get_or_create(name: str, factory):
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _lock:
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
+
+def _check_deadline(**kwargs):
+    # Runs before every attempt, so retries stop too once the request's deadline has passed
+    outbound.check_deadline()
+
+def _create_s3_client():
+    import boto3
+    from botocore.config import Config
+
+    client = boto3.client(
+        "s3",
+        aws_access_key_id=config.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
+        region_name="eu-west-3",
+        endpoint_url=config.S3_ENDPOINT_URL,
+        config=Config(
+            connect_timeout=config.CONNECT_TIMEOUT,
+            read_timeout=config.S3_READ_TIMEOUT,
+            # Adaptive retries back off on throttling, and share botocore's retry quota that stops
+            # retrying once most calls fail
+            retries={"mode": "adaptive", "total_max_attempts": config.S3_MAX_ATTEMPTS},
+            # Enough for every request thread plus the parallel parts of an import
+            max_pool_connections=config.S3_MAX_POOL_CONNECTIONS,
+        )
+    )
+    client.meta.events.register("before-send.s3", _check_deadline)
+    return client
+
+class _PatreonRequests:
+    """Stands in for `requests` in the Patreon client, which sends every request without a timeout."""
+
+    def __getattr__(self, name):
+        import requests
+
+        return getattr(requests, name)
+
+    def _timeout(self):
+        timeout = outbound.timeout(config.PATREON_TIMEOUT)
+        return min(config.CONNECT_TIMEOUT, timeout), timeout
+
+    def get(self, url, **kwargs):
+        import requests
+
+        return requests.get(url, timeout=self._timeout(), **kwargs)
+
+    def post(self, url, **kwargs):
+        import requests
+
+        return requests.post(url, timeout=self._timeout(), **kwargs)
+
+def _patch_patreon():
+    import patreon.api
+    import patreon.oauth
+
+    if not isinstance(patreon.api.requests, _PatreonRequests):
+        patreon.api.requests = patreon.oauth.requests = _PatreonRequests()
+
+def _create_patreon_oauth():
+    import patreon
+
+    _patch_patreon()
+    return patreon.OAuth(config.PATREON_CLIENT_ID, config.PATREON_CLIENT_SECRET)
+
+def _create_email_client():
+    from .email_service import EmailClient
+
+    return EmailClient(
+        config.EMAIL_USER,
+        config.EMAIL_PASSWORD,
+        config.EMAIL_SERVER,
+        config.EMAIL_PORT,
+        config.EMAIL_NAME,
+        timeout=config.EMAIL_TIMEOUT,
+    )
+
+def s3_client():
+    """Returns this process' S3 client, creating it on first use."""
+    return _get_or_create("s3", _create_s3_client)
+
+def patreon_oauth():
+    """Returns this process' Patreon OAuth client, creating it on first use."""
+    return _get_or_create("patreon_oauth", _create_patreon_oauth)
+
+def patreon_api(access_token: str):
+    """Returns a Patreon API client for `access_token`. These are bound to a user, so they aren't cached."""
+    import patreon
+
+    _patch_patreon()
+    return patreon.API(access_token)
+
+def email_client():
+    """Returns this process' email client, creating it on first use."""
+    return _get_or_create("email", _create_email_client)
+
+def _create_redis_client():
+    import redis
+
+    return redis.Redis.from_url(
+        config.REDIS_URL,
+        socket_timeout=config.REDIS_TIMEOUT,
+        socket_connect_timeout=config.REDIS_TIMEOUT
+    )
+
+def redis_client():
+    """Returns this process' Redis client, or `None` if no shared store is configured."""
+    if config.REDIS_URL is None:
+        return None
+    return _get_or_create("redis", _create_redis_client)
+
+def preload_modules():
+    """Imports every heavy module without creating any client. Called by gunicorn's master process when
+    preloading the app, so the modules are shared copy-on-write between workers."""
+    for module in HEAVY_MODULES:
+        importlib.import_module(module)
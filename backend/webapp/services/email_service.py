@@ -9,14 +9,17 @@ from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
+from . import outbound
+
 
 class EmailClient:
-    def __init__(self, user: str, password: str, server: str, port: int, name: typing.Optional[str] = None):
+    def __init__(self, user: str, password: str, server: str, port: int, name: typing.Optional[str] = None, timeout: float = 10):
         self._email_user = user
         self._email_password = password
         self._email_name = name or self._email_user
         self._email_server = server
         self._email_port = port
+        self._timeout = timeout
         
     def send_email(self, subject: str, body_text: str, body_html: str, recipient: str, attachment_file_path: typing.Optional[str] = None, image_folder_path: typing.Optional[str] = None):
         msg = MIMEMultipart("related")
@@ -59,15 +62,17 @@ class EmailClient:
             msg.attach(part)
             attachment.close()
 
+        server = None
         try:
-            # Connect to email's SMTP server
+            # Connect to email's SMTP server, giving up before the request's deadline
+            timeout = outbound.timeout(self._timeout)
             if self._email_port == 587:
-                server = smtplib.SMTP(self._email_server, self._email_port)
+                server = smtplib.SMTP(self._email_server, self._email_port, timeout=timeout)
                 server.ehlo()
                 server.starttls(context=ssl.create_default_context())
                 server.ehlo()
             else:
-                server = smtplib.SMTP_SSL(self._email_server, self._email_port)
+                server = smtplib.SMTP_SSL(self._email_server, self._email_port, timeout=timeout)
             server.login(self._email_user, self._email_password)
 
             # Send the email
@@ -77,5 +82,9 @@ class EmailClient:
             traceback.print_exc()
             return False
         finally:
-            server.quit()
+            if server is not None:
+                try:
+                    server.quit()
+                except OSError:
+                    pass
         return True
@@ -0,0 +1,197 @@
+"""Playback events.
+
+Clients report when tracks are played, skipped or stopped. Events are only counted in memory while handling
+the request: a background thread in each worker adds the counters to `track_stats` every
+`EVENTS_FLUSH_INTERVAL` seconds with a single multi-row upsert, so reporting events never waits on the
+database. Workers flush what's left when they exit (see `gunicorn.conf.py`); counters of a worker that crashes
+are lost, which is fine for statistics."""
+
+__all__ = [
+    "EVENT_TYPES",
+    "flush",
+    "recent_stats",
+    "record",
+]
+
+import collections
+import datetime
+import logging
+import os
+import threading
+
+import flask
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+import config
+from .. import models
+
+
+EVENT_TYPES = {
+    "play": "plays",
+    "skip": "skips",
+    "stop": "stops",
+}
+
+_lock = threading.Lock()
+# (owner_id, track_id, day) -> {"plays": ..., "skips": ..., "stops": ...}
+_counters: dict[tuple[int, int, datetime.date], collections.Counter] = {}
+_last_event_at: dict[tuple[int, int, datetime.date], datetime.datetime] = {}
+# owner_id -> number of counters of the user in the buffer
+_owner_counters = collections.Counter()
+_dropped = 0
+_wake = threading.Event()
+_thread = None
+_pid = None
+
+
+def record(owner_id: int, events: list[tuple[int, str]]) -> int:
+    """Counts `(track_id, event_type)` events of the user in memory. Returns the number of events accepted,
+    which is lower when the buffer, or the user's share of it, is full. Track ids aren't checked until the
+    counters are flushed, so the share keeps a user from filling the buffer with made-up ids."""
+    global _dropped
+
+    _ensure_flusher()
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    accepted = 0
+    with _lock:
+        for track_id, event_type in events:
+            key = (owner_id, track_id, now.date())
+            if key not in _counters:
+                if len(_counters) >= config.EVENTS_MAX_BUFFERED or _owner_counters[owner_id] >= config.EVENTS_MAX_BUFFERED_PER_USER:
+                    _dropped += 1
+                    continue
+                _counters[key] = collections.Counter()
+                _owner_counters[owner_id] += 1
+            _counters[key][EVENT_TYPES[event_type]] += 1
+            _last_event_at[key] = now
+            accepted += 1
+        full = len(_counters) >= config.EVENTS_MAX_BUFFERED
+    if full:
+        _wake.set()
+    return accepted
+
+def _take():
+    global _dropped
+
+    with _lock:
+        counters, last_event_at, dropped = dict(_counters), dict(_last_event_at), _dropped
+        _counters.clear()
+        _last_event_at.clear()
+        _owner_counters.clear()
+        _dropped = 0
+    return counters, last_event_at, dropped
+
+def _put_back(counters, last_event_at):
+    """Returns counters that couldn't be written to the buffer, unless it has filled up meanwhile."""
+    with _lock:
+        for key, counter in counters.items():
+            if key not in _counters:
+                if len(_counters) >= config.EVENTS_MAX_BUFFERED:
+                    continue
+                _owner_counters[key[0]] += 1
+            _counters.setdefault(key, collections.Counter()).update(counter)
+            _last_event_at[key] = max(_last_event_at.get(key, last_event_at[key]), last_event_at[key])
+
+def flush() -> int:
+    """Adds the counters buffered by this process to `track_stats`, in a single upsert. Events for tracks the
+    user doesn't own (or that no longer exist) are discarded. Returns the number of rows written. Must be
+    called inside an app context."""
+    counters, last_event_at, dropped = _take()
+    if dropped > 0:
+        logging.warning(f"Dropped {dropped} playback events because the buffer was full")
+    if len(counters) == 0:
+        return 0
+
+    session = models.db.session
+    try:
+        owners = dict(session.execute(
+            select(models.Track.id, models.Track.owner_id).where(
+                models.Track.id.in_(set(track_id for _, track_id, _ in counters)),
+                models.Track.deleted_at.is_(None),
+            )
+        ).all())
+        rows = [
+            {
+                "track_id": track_id,
+                "day": day,
+                "plays": counter["plays"],
+                "skips": counter["skips"],
+                "stops": counter["stops"],
+                "last_event_at": last_event_at[(owner_id, track_id, day)],
+            }
+            for (owner_id, track_id, day), counter in counters.items()
+            if owners.get(track_id) == owner_id
+        ]
+        # Every worker upserts in the same key order, so that concurrent flushes can't deadlock on each other
+        rows.sort(key=lambda row: (row["track_id"], row["day"]))
+        if len(rows) > 0:
+            dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+            statement = dialect.insert(models.TrackStats).values(rows)
+            session.execute(statement.on_conflict_do_update(
+                index_elements=[models.TrackStats.track_id, models.TrackStats.day],
+                set_={
+                    "plays": models.TrackStats.plays + statement.excluded.plays,
+                    "skips": models.TrackStats.skips + statement.excluded.skips,
+                    "stops": models.TrackStats.stops + statement.excluded.stops,
+                    "last_event_at": func.greatest(models.TrackStats.last_event_at, statement.excluded.last_event_at)
+                        if dialect is postgresql else func.max(models.TrackStats.last_event_at, statement.excluded.last_event_at),
+                }
+            ))
+        session.commit()
+        return len(rows)
+    except Exception:
+        session.rollback()
+        _put_back(counters, last_event_at)
+        raise
+
+def _run(app: flask.Flask):
+    while True:
+        _wake.wait(config.EVENTS_FLUSH_INTERVAL)
+        _wake.clear()
+        try:
+            with app.app_context():
+                flush()
+        except Exception:
+            logging.exception("Playback events flush failed")
+
+def _ensure_flusher():
+    global _thread, _pid
+
+    if _thread is not None and _pid == os.getpid():
+        return
+    with _lock:
+        # Threads don't survive a fork, so each worker starts its own
+        if _thread is None or _pid != os.getpid():
+            _pid = os.getpid()
+            _thread = threading.Thread(
+                target=_run,
+                args=(flask.current_app._get_current_object(),),
+                name="hoot-events",
+                daemon=True
+            )
+            _thread.start()
+
+def recent_stats(owner_id: int, days: int = 30, limit: int = 100) -> list[tuple[int, int, int, int]]:
+    """Returns `(track_id, plays, skips, stops)` of the user's most played tracks over the last `days` days."""
+    since = datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=days)
+    plays = func.sum(models.TrackStats.plays)
+    return models.db.session.execute(
+        select(
+            models.TrackStats.track_id,
+            plays,
+            func.sum(models.TrackStats.skips),
+            func.sum(models.TrackStats.stops),
+        ).join(
+            models.Track, models.Track.id == models.TrackStats.track_id
+        ).where(
+            models.Track.owner_id == owner_id,
+            models.Track.deleted_at.is_(None),
+            models.TrackStats.day >= since,
+        ).group_by(
+            models.TrackStats.track_id
+        ).order_by(
+            plays.desc(),
+            models.TrackStats.track_id
+        ).limit(limit)
+    ).all()
@@ -0,0 +1,164 @@
+__all__ = [
+    "collect_orphans",
+]
+
+import datetime
+import logging
+import re
+
+from sqlalchemy import String, case, cast, func, literal, select
+
+import config
+from .. import models
+from . import clients
+
+
+USER_PREFIX_REGEX = re.compile(r"^user_(\d+)/$")
+
+
+class GCReport:
+    def __init__(self):
+        self.objects_checked = 0
+        self.orphaned_objects = 0
+        self.deleted_objects = 0
+        self.deleted_bytes = 0
+        self.missing_objects = 0
+
+
+def _user_prefixes():
+    """Yields the `user_{id}/` prefixes of the bucket, in the order S3 lists them in."""
+    paginator = clients.s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=config.S3_BUCKET_NAME, Prefix="user_", Delimiter="/"):
+        for prefix in page.get("CommonPrefixes", []):
+            match = USER_PREFIX_REGEX.match(prefix["Prefix"])
+            if match is not None:
+                yield prefix["Prefix"]
+
+def _objects(prefix: str):
+    paginator = clients.s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=config.S3_BUCKET_NAME, Prefix=prefix, PaginationConfig={"PageSize": 1000}):
+        yield from page.get("Contents", [])
+
+def _tracks(prefix: str):
+    """Yields `(object_key, owner_id)` for the objects under `prefix` that tracks reference, in the same
+    (bytewise) order S3 lists keys in. Tracks of other users may reference them too, if they were cloned from
+    a shared playlist, so `owner_id` is the lowest id among the owners of the live tracks, or `None` once every
+    track that references the object is deleted."""
+    object_key = models.Track.object_key
+    if models.db.session.get_bind().dialect.name == "postgresql":
+        object_key = object_key.collate("C")
+    # Every key that starts with the prefix sorts between it and the prefix with its last character incremented
+    prefix_end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    statement = select(
+        object_key,
+        func.min(case((models.Track.deleted_at.is_(None), models.Track.owner_id))),
+    ).where(
+        object_key >= prefix,
+        object_key < prefix_end,
+    ).group_by(object_key).order_by(object_key).execution_options(yield_per=1000)
+    yield from models.db.session.execute(statement)
+
+def _owner_prefixes():
+    """Yields the `user_{id}/` prefix of every user who has tracks, in the same (bytewise) order S3 lists
+    prefixes in. Read a page at a time, so that no cursor stays open across the rollbacks of `collect_orphans`."""
+    prefix = literal("user_") + cast(models.Track.owner_id, String) + literal("/")
+    if models.db.session.get_bind().dialect.name == "postgresql":
+        prefix = prefix.collate("C")
+    last = ""
+    while True:
+        page = models.db.session.scalars(
+            select(prefix).where(
+                models.Track.deleted_at.is_(None),
+                prefix > last,
+            ).distinct().order_by(prefix).limit(1000)
+        ).all()
+        yield from page
+        if len(page) < 1000:
+            return
+        last = page[-1]
+
+def _delete(keys: list[str], report: GCReport):
+    response = clients.s3_client().delete_objects(
+        Bucket=config.S3_BUCKET_NAME,
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+    )
+    errors = response.get("Errors", [])
+    for error in errors:
+        logging.warning(f"Couldn't delete orphaned object '{error['Key']}': {error.get('Message')}")
+    report.deleted_objects += len(keys) - len(errors)
+
+def _report_missing(owner_id: int, object_key: str):
+    logging.warning(f"Track object '{object_key}' of user {owner_id} is missing from storage")
+
+def _report_unlisted(prefix: str, report: GCReport, on_missing):
+    for object_key, owner_id in _tracks(prefix):
+        if owner_id is not None:
+            report.missing_objects += 1
+            on_missing(owner_id, object_key)
+
+def collect_orphans(grace_period: datetime.timedelta, dry_run: bool = False, on_missing=_report_missing) -> GCReport:
+    """Reconciles the bucket against the tracks table, one `user_{id}/` prefix at a time.
+
+    Both sides are streamed in key order and merge-joined, so memory use doesn't depend on the size of
+    the bucket. Objects without a track that are older than `grace_period` are deleted (unless `dry_run`),
+    and tracks whose object doesn't exist are passed to `on_missing`, including those of users who have no
+    objects at all. Must be called inside an app context."""
+
+    report = GCReport()
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - grace_period
+    owner_prefixes = _owner_prefixes()
+    owner_prefix = next(owner_prefixes, None)
+
+    for prefix in _user_prefixes():
+        # Users whose prefix sorts before this one aren't in the listing, so none of their tracks has an object
+        while owner_prefix is not None and owner_prefix < prefix:
+            _report_unlisted(owner_prefix, report, on_missing)
+            owner_prefix = next(owner_prefixes, None)
+        if owner_prefix == prefix:
+            owner_prefix = next(owner_prefixes, None)
+
+        pending_deletes = []
+        tracks = _tracks(prefix)
+        track = next(tracks, None)
+
+        for obj in _objects(prefix):
+            report.objects_checked += 1
+            while track is not None and track[0] < obj["Key"]:
+                if track[1] is not None:
+                    report.missing_objects += 1
+                    on_missing(track[1], track[0])
+                track = next(tracks, None)
+
+            if track is not None and track[0] == obj["Key"]:
+                track = next(tracks, None)
+                continue
+
+            # Recent objects may belong to an upload whose track hasn't been committed yet
+            if obj["LastModified"] > cutoff:
+                continue
+
+            report.orphaned_objects += 1
+            report.deleted_bytes += obj["Size"]
+            if dry_run:
+                continue
+            pending_deletes.append(obj["Key"])
+            if len(pending_deletes) == 1000:
+                _delete(pending_deletes, report)
+                pending_deletes = []
+
+        while track is not None:
+            if track[1] is not None:
+                report.missing_objects += 1
+                on_missing(track[1], track[0])
+            track = next(tracks, None)
+
+        if len(pending_deletes) > 0:
+            _delete(pending_deletes, report)
+        models.db.session.rollback()
+
+    while owner_prefix is not None:
+        _report_unlisted(owner_prefix, report, on_missing)
+        owner_prefix = next(owner_prefixes, None)
+    models.db.session.rollback()
+
+    return report
@@ -0,0 +1,245 @@
+__all__ = [
+    "ImportRejected",
+    "RemoteFile",
+    "preflight",
+    "transfer",
+]
+
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from urllib.parse import unquote, urlparse
+
+import config
+from . import clients, outbound
+
+
+SNIFF_SIZE = 8192
+MAX_FILE_SIZE = 1024 * 1024 * 1024
+
+
+class ImportRejected(Exception):
+    """Raised when a remote file can't be imported. The message is meant to be shown to the user."""
+    pass
+
+
+class RemoteFile:
+    def __init__(self, url: str, filename: str, size: int | None, supports_ranges: bool, sample: bytes, response=None):
+        self.url = url
+        self.filename = filename
+        self.size = size
+        self.supports_ranges = supports_ranges
+        self.sample = sample
+        # Open streaming response, if the sample was read from a full GET
+        self.response = response
+
+    @property
+    def mime(self):
+        import magic
+
+        return magic.from_buffer(self.sample, mime=True)
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+
+
+class _LimitedReader:
+    """File-like object that replays `sample`, then reads the rest of `raw`, failing once `max_size` or `MAX_FILE_SIZE` is exceeded."""
+
+    def __init__(self, sample: bytes, raw, max_size: int):
+        self._sample = sample
+        self._raw = raw
+        self.max_size = max_size
+        self.total = 0
+        # Reads may happen in the uploader's threads, which don't see the request's deadline
+        self._deadline = outbound.current_deadline()
+
+    def read(self, size=-1):
+        # Callers treat a short read as the end of the file, so keep reading until `size` bytes are available
+        chunks, remaining = [], size if size is not None and size >= 0 else float("inf")
+        while remaining > 0:
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                raise outbound.DeadlineExceeded("Deadline exceeded")
+            if self._sample:
+                chunk, self._sample = self._sample[:remaining], self._sample[remaining:]
+            else:
+                chunk = self._raw.read(min(remaining, 1024 * 1024), decode_content=True)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            self.total += len(chunk)
+            # Sources that announce no size are held to the same limits as the others
+            _check_size(self.total, self.max_size)
+        return b"".join(chunks)
+
+
+def _timeout():
+    """Returns the `(connect, read)` timeout of a request to a remote source."""
+    timeout = outbound.timeout(config.IMPORT_TIMEOUT)
+    return min(config.CONNECT_TIMEOUT, timeout), timeout
+
+def _check_size(size: int, max_size: int):
+    if size > MAX_FILE_SIZE:
+        raise ImportRejected("File too large")
+    if size > max_size:
+        raise ImportRejected("File size exceeds your quota")
+
+def _filename(url: str, headers) -> str:
+    # Try to get filename from URL
+    filename = unquote(os.path.basename(urlparse(url).path)) or None
+
+    # Try to get filename from Content-Disposition header
+    if filename is None:
+        content_disposition = headers.get("Content-Disposition")
+        if content_disposition:
+            match = re.search(r'filename="?([^\";]+)"?', content_disposition)
+            if match:
+                filename = match.group(1)
+
+    if filename is None:
+        raise NameError("Filename not specified")
+    return filename
+
+def preflight(source: str, max_size: int) -> RemoteFile:
+    """Finds out the size, name and type of a remote file, reading only its first few KB.
+    Raises `ImportRejected` if it is known to be too large for `max_size`."""
+    import requests
+
+    url, size, supports_ranges, headers = source, None, False, {}
+    try:
+        head = requests.head(source, allow_redirects=True, timeout=_timeout())
+        if head.ok:
+            url, headers = head.url, head.headers
+            if head.headers.get("Content-Length", "").isdigit():
+                size = int(head.headers["Content-Length"])
+            supports_ranges = head.headers.get("Accept-Ranges") == "bytes" and size is not None
+    except requests.RequestException:
+        pass
+
+    if size is not None:
+        _check_size(size, max_size)
+
+    if supports_ranges:
+        response = requests.get(url, headers={"Range": f"bytes=0-{SNIFF_SIZE - 1}"}, timeout=_timeout())
+        if response.status_code == 206:
+            return RemoteFile(url, _filename(url, headers), size, True, response.content)
+        response.close()
+
+    response = requests.get(url, stream=True, timeout=_timeout())
+    response.raise_for_status()
+    try:
+        if response.headers.get("Content-Length", "").isdigit():
+            size = int(response.headers["Content-Length"])
+            _check_size(size, max_size)
+        filename = _filename(response.url, response.headers)
+        sample = response.raw.read(SNIFF_SIZE, decode_content=True)
+    except Exception:
+        response.close()
+        raise
+    return RemoteFile(response.url, filename, size, False, sample, response)
+
+def _parallel_transfer(remote: RemoteFile, bucket: str, object_key: str, mime: str):
+    import requests
+
+    s3_client = clients.s3_client()
+    upload_id = s3_client.create_multipart_upload(
+        Bucket=bucket,
+        Key=object_key,
+        ContentType=mime,
+        ACL="private"
+    )["UploadId"]
+
+    # S3 rejects parts smaller than 5 MiB (except for the last one)
+    part_size = max(config.IMPORT_PART_SIZE, 5 * 1024 * 1024)
+    parts = [
+        (number + 1, start, min(start + part_size, remote.size) - 1)
+        for number, start in enumerate(range(0, remote.size, part_size))
+    ]
+
+    def fetch_part(start: int, end: int) -> bytes:
+        response = requests.get(remote.url, headers={"Range": f"bytes={start}-{end}"}, timeout=_timeout())
+        if response.status_code != 206 or len(response.content) != end - start + 1:
+            raise IOError("Source didn't honour range request")
+        return response.content
+
+    # Parts are transferred in worker threads, which must give up at the request's deadline too
+    request_deadline = outbound.current_deadline()
+    # Set once a part failed, so that the parts still running don't upload anything
+    stopped = threading.Event()
+
+    def transfer_part(part):
+        number, start, end = part
+        with outbound.deadline(request_deadline):
+            if stopped.is_set():
+                return None
+            content = outbound.with_retries("imports", lambda: fetch_part(start, end), 3, retry_on=(requests.RequestException,))
+            if stopped.is_set():
+                return None
+            etag = s3_client.upload_part(
+                Bucket=bucket,
+                Key=object_key,
+                UploadId=upload_id,
+                PartNumber=number,
+                Body=content
+            )["ETag"]
+        return {"PartNumber": number, "ETag": etag}
+
+    executor = ThreadPoolExecutor(config.IMPORT_PARALLELISM)
+    try:
+        futures = [executor.submit(transfer_part, part) for part in parts]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if future.exception() is not None:
+                raise future.exception()
+        completed_parts = [future.result() for future in futures]
+        executor.shutdown()
+        s3_client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=object_key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": completed_parts}
+        )
+    except Exception:
+        # The parts that haven't started are dropped. The running ones are waited for, so that none of them
+        # uploads a part after the upload is aborted.
+        stopped.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        # Clean up even if the request ran out of time
+        with outbound.deadline(None):
+            s3_client.abort_multipart_upload(Bucket=bucket, Key=object_key, UploadId=upload_id)
+        raise
+
+def transfer(remote: RemoteFile, bucket: str, object_key: str, mime: str, max_size: int) -> int:
+    """Copies a preflighted remote file into storage without buffering it whole, returning its size.
+    Large files from sources that support range requests are fetched in parallel into multipart parts."""
+    import requests
+
+    if remote.supports_ranges and remote.size >= 2 * max(config.IMPORT_PART_SIZE, 5 * 1024 * 1024):
+        _parallel_transfer(remote, bucket, object_key, mime)
+        return remote.size
+
+    response = remote.response
+    sample = remote.sample
+    if response is None:
+        response = requests.get(remote.url, stream=True, timeout=_timeout())
+        response.raise_for_status()
+        sample = b""
+
+    try:
+        reader = _LimitedReader(sample, response.raw, max_size)
+        clients.s3_client().upload_fileobj(
+            reader,
+            bucket,
+            object_key,
+            ExtraArgs={
+                "ContentType": mime,
+                "ACL": "private"
+            }
+        )
+    finally:
+        response.close()
+    return reader.total
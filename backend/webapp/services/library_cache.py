@@ -0,0 +1,104 @@
+__all__ = [
+    "get",
+    "invalidate",
+    "put",
+    "version",
+]
+
+import collections
+import logging
+import threading
+import time
+
+import config
+from . import clients
+
+
+_lock = threading.Lock()
+# (user_id, version) -> (expiration, body)
+_snapshots = collections.OrderedDict()
+_versions: dict[int, int] = {}
+
+
+def _version_key(user_id: int):
+    return f"hoot:library-version:{user_id}"
+
+def _snapshot_key(user_id: int, library_version: int):
+    return f"hoot:library:{user_id}:{library_version}"
+
+def version(user_id: int) -> int:
+    """Returns the current version of the user's library. Snapshots are stored under the version that was
+    current before they were built, so a snapshot built concurrently with a change is never served."""
+    redis = clients.redis_client()
+    if redis is not None:
+        try:
+            return int(redis.get(_version_key(user_id)) or 0)
+        except Exception:
+            logging.exception("Couldn't read library version")
+            return -1
+    with _lock:
+        return _versions.get(user_id, 0)
+
+def get(user_id: int, library_version: int) -> bytes | None:
+    if library_version < 0:
+        return None
+
+    now = time.time()
+    with _lock:
+        entry = _snapshots.get((user_id, library_version))
+        if entry is not None:
+            if entry[0] > now:
+                _snapshots.move_to_end((user_id, library_version))
+                return entry[1]
+            del _snapshots[(user_id, library_version)]
+
+    redis = clients.redis_client()
+    if redis is None:
+        return None
+    try:
+        body = redis.get(_snapshot_key(user_id, library_version))
+        ttl = redis.ttl(_snapshot_key(user_id, library_version)) if body is not None else 0
+    except Exception:
+        logging.exception("Couldn't read library snapshot")
+        return None
+    if body is not None and ttl > 0:
+        _put_local(user_id, library_version, body, now + ttl)
+    return body
+
+def _put_local(user_id: int, library_version: int, body: bytes, expiration: float):
+    with _lock:
+        _snapshots[(user_id, library_version)] = (expiration, body)
+        _snapshots.move_to_end((user_id, library_version))
+        while len(_snapshots) > config.LIBRARY_CACHE_ENTRIES:
+            _snapshots.popitem(last=False)
+
+def put(user_id: int, library_version: int, body: bytes, ttl: float):
+    """Stores a serialized library for at most `ttl` seconds."""
+    ttl = int(min(ttl, config.LIBRARY_CACHE_TTL))
+    if library_version < 0 or ttl <= 0:
+        return
+
+    redis = clients.redis_client()
+    if redis is None:
+        _put_local(user_id, library_version, body, time.time() + min(ttl, config.LIBRARY_CACHE_LOCAL_TTL))
+        return
+
+    _put_local(user_id, library_version, body, time.time() + ttl)
+    try:
+        redis.set(_snapshot_key(user_id, library_version), body, ex=ttl)
+    except Exception:
+        logging.exception("Couldn't store library snapshot")
+
+def invalidate(user_id: int):
+    """Discards the user's snapshots. Must be called after every committed change to their library."""
+    with _lock:
+        _versions[user_id] = _versions.get(user_id, 0) + 1
+        for key in [key for key in _snapshots if key[0] == user_id]:
+            del _snapshots[key]
+
+    redis = clients.redis_client()
+    if redis is not None:
+        try:
+            redis.incr(_version_key(user_id))
+        except Exception:
+            logging.exception("Couldn't invalidate library snapshot")
@@ -0,0 +1,241 @@
+__all__ = [
+    "MaintenanceReport",
+    "clear_expired_codes",
+    "purge_sessions",
+    "purge_unverified_users",
+    "run",
+    "start_worker",
+]
+
+import datetime
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import flask
+from sqlalchemy import and_, delete, exists, select, update
+
+import config
+from .. import models
+from . import upload_service
+
+
+_lock = threading.Lock()
+_thread = None
+_pid = None
+
+
+class MaintenanceReport:
+    def __init__(self):
+        self.unverified_users = 0
+        self.expired_codes = 0
+        self.sessions_checked = 0
+        self.sessions = 0
+        self.session_bytes = 0
+        self.expired_uploads = 0
+        self.untracked_uploads = 0
+        self.duration = 0.0
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+def _pause():
+    if config.MAINTENANCE_PAUSE_SECONDS > 0:
+        time.sleep(config.MAINTENANCE_PAUSE_SECONDS)
+
+def _batches(condition, batch_size: int):
+    """Yields the ids of the users matching `condition` in ascending batches, walking the primary key
+    so that each batch is a short index range scan instead of a scan of everything already visited.
+    Rows locked by a running request are skipped until the next run."""
+
+    session = models.db.session
+    after = 0
+    while True:
+        ids = session.scalars(
+            select(models.User.id).where(
+                models.User.id > after,
+                condition,
+            ).order_by(
+                models.User.id
+            ).limit(batch_size).with_for_update(skip_locked=True)
+        ).all()
+        if len(ids) == 0:
+            session.rollback()
+            return
+        yield ids
+        after = ids[-1]
+
+def purge_unverified_users(older_than: datetime.timedelta, batch_size: int | None = None) -> int:
+    """Deletes users who never verified their email and whose last verification code was sent more than
+    `older_than` ago, unless they own anything. Returns the number of users deleted."""
+
+    batch_size = batch_size or config.MAINTENANCE_BATCH_SIZE
+    session = models.db.session
+    # Signing up again with the same email refreshes the expiration, so the condition is checked again when
+    # deleting in case that happened since the batch was selected
+    condition = and_(
+        models.User.verified.is_(False),
+        models.User.verification_code_expiration < _now() - older_than,
+        ~exists().where(models.Playlist.owner_id == models.User.id),
+        ~exists().where(models.Track.owner_id == models.User.id),
+        ~exists().where(models.UploadSession.owner_id == models.User.id),
+    )
+
+    total = 0
+    for ids in _batches(condition, batch_size):
+        total += session.execute(
+            delete(models.User).where(models.User.id.in_(ids), condition)
+        ).rowcount
+        session.commit()
+        _pause()
+    return total
+
+def clear_expired_codes(batch_size: int | None = None) -> int:
+    """Removes verification codes that can no longer be used, so that the partial index on them only holds
+    pending codes. Their expiration is kept: it is when the user last signed up. Returns the number of codes
+    removed."""
+
+    batch_size = batch_size or config.MAINTENANCE_BATCH_SIZE
+    session = models.db.session
+    condition = and_(
+        models.User.verification_code.is_not(None),
+        models.User.verification_code_expiration < _now(),
+    )
+
+    total = 0
+    for ids in _batches(condition, batch_size):
+        total += session.execute(
+            update(models.User).where(
+                models.User.id.in_(ids), condition
+            ).values(
+                verification_code=None
+            )
+        ).rowcount
+        session.commit()
+        _pause()
+    return total
+
+def _session_cache():
+    cache = getattr(flask.current_app.session_interface, "cache", None)
+    # Only the filesystem backend leaves expired sessions behind
+    if cache is None or not hasattr(cache, "_is_mgmt"):
+        return None
+    return cache
+
+def _host_lock(path: str):
+    """Takes an exclusive lock shared by every process on this host, returning its file, or `None` if another
+    process holds it."""
+    try:
+        import fcntl
+    except ImportError:
+        return open(os.devnull, "w")
+
+    name = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+    lock_file = open(os.path.join(tempfile.gettempdir(), f"hoot-sessions-{name}.lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def purge_sessions(report: MaintenanceReport, batch_size: int | None = None):
+    """Deletes the files of expired sessions. Flask-Session only removes them once there are more than its
+    threshold, and then also evicts live sessions to make room, logging their users out."""
+
+    cache = _session_cache()
+    if cache is None:
+        return
+
+    batch_size = batch_size or config.MAINTENANCE_BATCH_SIZE
+    lock_file = _host_lock(cache._path)
+    if lock_file is None:
+        return
+
+    with lock_file:
+        now = time.time()
+        removed = 0
+        with os.scandir(cache._path) as entries:
+            for entry in entries:
+                if cache._is_mgmt(entry.name) or not entry.is_file():
+                    continue
+                report.sessions_checked += 1
+                try:
+                    with open(entry.path, "rb") as f:
+                        expires = struct.unpack("I", f.read(4))[0]
+                    if expires == 0 or expires >= now:
+                        continue
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                except (OSError, struct.error):
+                    logging.warning(f"Couldn't check session file {entry.name}", exc_info=True)
+                    continue
+
+                report.sessions += 1
+                report.session_bytes += size
+                removed += 1
+                if removed == batch_size:
+                    cache._update_count(delta=-removed)
+                    removed = 0
+                    _pause()
+
+        if removed > 0:
+            cache._update_count(delta=-removed)
+
+def run(older_than: datetime.timedelta | None = None) -> MaintenanceReport:
+    """Runs every maintenance task once. Must be called inside an app context."""
+
+    if older_than is None:
+        older_than = datetime.timedelta(days=config.UNVERIFIED_USER_DAYS)
+
+    report = MaintenanceReport()
+    start = time.monotonic()
+    report.expired_codes = clear_expired_codes()
+    report.unverified_users = purge_unverified_users(older_than)
+    purge_sessions(report)
+    # Releases the quota reserved by abandoned upload sessions and the storage of their parts
+    report.expired_uploads, report.untracked_uploads = upload_service.expire_sessions(config.MAINTENANCE_BATCH_SIZE)
+    report.duration = time.monotonic() - start
+    return report
+
+def _run(app: flask.Flask):
+    # Workers that start together shouldn't all run at once
+    time.sleep(config.MAINTENANCE_INTERVAL_SECONDS * (0.1 + 0.9 * (os.getpid() % 97) / 97))
+    while True:
+        try:
+            with app.app_context():
+                report = run()
+            logging.info(
+                f"Maintenance: deleted {report.unverified_users} unverified users, cleared {report.expired_codes} "
+                f"expired codes, deleted {report.sessions} expired sessions ({report.session_bytes} bytes) and aborted "
+                f"{report.expired_uploads} expired and {report.untracked_uploads} abandoned uploads in {report.duration:.1f}s"
+            )
+        except Exception:
+            logging.exception("Maintenance failed")
+        time.sleep(config.MAINTENANCE_INTERVAL_SECONDS)
+
+def start_worker(app: flask.Flask | None = None):
+    """Starts this process' maintenance thread if needed. Does nothing if `MAINTENANCE_INTERVAL_SECONDS` is 0."""
+    global _thread, _pid
+
+    if config.MAINTENANCE_INTERVAL_SECONDS <= 0:
+        return
+
+    with _lock:
+        # Threads don't survive a fork, so each worker starts its own
+        if _thread is None or _pid != os.getpid():
+            _pid = os.getpid()
+            _thread = threading.Thread(
+                target=_run,
+                args=(app or flask.current_app._get_current_object(),),
+                name="hoot-maintenance",
+                daemon=True
+            )
+            _thread.start()
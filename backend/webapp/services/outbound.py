@@ -0,0 +1,139 @@
+"""Deadlines, timeouts and retry budgets for calls to external services (S3, Patreon, SMTP, remote sources).
+
+Requests run under a deadline (see `middleware.deadlines`). Outbound calls ask `timeout()` for their
+timeout, which is their own limit capped by what is left of the deadline, so a slow dependency fails the
+request instead of holding a worker long after the client gave up. Once the deadline has passed, no new
+call or retry is started. Code that runs outside of a request has no deadline unless it sets one.
+
+Retries are capped by a budget per dependency: when a dependency is failing, retrying every call would
+multiply the load on it exactly when it can least take it."""
+
+__all__ = [
+    "DeadlineExceeded",
+    "RetryBudget",
+    "check_deadline",
+    "current_deadline",
+    "deadline",
+    "remaining",
+    "retry_budget",
+    "set_deadline",
+    "timeout",
+    "with_retries",
+]
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+
+
+_local = threading.local()
+_budgets_lock = threading.Lock()
+_budgets = {}
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class RetryBudget:
+    """Token bucket that allows retries while they stay under `ratio` of the calls made, plus a trickle of
+    `min_per_second` retries so that a dependency that is rarely called can still be retried."""
+
+    def __init__(self, ratio: float, min_per_second: float, window: float = 10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = max(1.0, min_per_second * window)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.min_per_second)
+        self._updated_at = now
+
+    def record_call(self):
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def try_retry(self) -> bool:
+        """Takes a token for one retry, returning whether the retry may happen."""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def current_deadline() -> float | None:
+    """Returns the current thread's deadline as a `time.monotonic()` value, or `None` if there is none."""
+    return getattr(_local, "deadline", None)
+
+def set_deadline(value: float | None):
+    """Sets the current thread's deadline, a `time.monotonic()` value, or `None` for no deadline."""
+    _local.deadline = value
+
+def remaining() -> float | None:
+    """Returns the number of seconds left before the deadline, or `None` if there is none."""
+    value = current_deadline()
+    return None if value is None else value - time.monotonic()
+
+def check_deadline():
+    """Raises `DeadlineExceeded` if the deadline has passed."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+
+def timeout(limit: float) -> float:
+    """Returns the timeout of a call whose own limit is `limit` seconds: the time left before the deadline, if
+    that is shorter. Raises `DeadlineExceeded` if no time is left."""
+    left = remaining()
+    if left is None:
+        return limit
+    if left <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+    return min(limit, left)
+
+@contextmanager
+def deadline(value: float | None):
+    """Applies `value` (a `time.monotonic()` value, or `None` for no deadline) to the current thread for the
+    duration of the block, e.g. to carry a request's deadline into worker threads."""
+    previous = current_deadline()
+    set_deadline(value)
+    try:
+        yield
+    finally:
+        set_deadline(previous)
+
+def retry_budget(dependency: str) -> RetryBudget:
+    """Returns this process' retry budget for `dependency`."""
+    budget = _budgets.get(dependency)
+    if budget is not None:
+        return budget
+    with _budgets_lock:
+        if dependency not in _budgets:
+            _budgets[dependency] = RetryBudget(config.RETRY_BUDGET_RATIO, config.RETRY_BUDGET_MIN_PER_SECOND)
+        return _budgets[dependency]
+
+def with_retries(dependency: str, func, attempts: int, backoff: float = 0.5, retry_on=(Exception,)):
+    """Calls `func`, retrying up to `attempts - 1` times with exponential backoff when it raises one of `retry_on`.
+    A retry only happens if the dependency's retry budget allows it and the backoff ends before the deadline;
+    otherwise the last error is raised."""
+    budget = retry_budget(dependency)
+    budget.record_call()
+    for attempt in range(attempts):
+        check_deadline()
+        try:
+            return func()
+        except retry_on:
+            delay = backoff * 2 ** attempt
+            left = remaining()
+            if attempt == attempts - 1 or (left is not None and left <= delay) or not budget.try_retry():
+                raise
+            logging.warning(f"Call to {dependency} failed (attempt {attempt + 1}), retrying in {delay:.1f}s", exc_info=True)
+            time.sleep(delay)
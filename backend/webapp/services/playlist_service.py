@@ -0,0 +1,102 @@
+__all__ = [
+    "add_memberships",
+    "add_tracks_to_playlists",
+    "remove_memberships",
+    "resolve_playlists",
+]
+
+from sqlalchemy import delete, insert, select, tuple_
+from sqlalchemy.dialects import postgresql
+
+from .. import models
+
+
+def resolve_playlists(owner_id: int, names) -> dict[str, int]:
+    """Returns a `{name: playlist_id}` mapping for the given playlist names, creating the ones that don't
+    exist yet. Only the requested playlists are touched, no matter how many the user owns."""
+
+    names = set(names)
+    if len(names) == 0:
+        return {}
+
+    session = models.db.session
+    existing = select(models.Playlist.id, models.Playlist.name).where(
+        models.Playlist.owner_id == owner_id,
+        models.Playlist.name.in_(names),
+    )
+
+    if session.get_bind().dialect.name != "postgresql":
+        playlists = {name: playlist_id for playlist_id, name in session.execute(existing)}
+        for name in names.difference(playlists):
+            playlist = models.Playlist(owner_id=owner_id, name=name)
+            session.add(playlist)
+            session.flush()
+            playlists[name] = playlist.id
+        return playlists
+
+    # Insert the missing playlists and read the existing ones in a single statement
+    inserted = postgresql.insert(models.Playlist).values([
+        {"owner_id": owner_id, "name": name} for name in names
+    ]).on_conflict_do_nothing(
+        constraint="uq_playlists_owner_id_name"
+    ).returning(
+        models.Playlist.id, models.Playlist.name
+    ).cte("inserted")
+    statement = select(inserted.c.id, inserted.c.name).union_all(existing)
+    playlists = {name: playlist_id for playlist_id, name in session.execute(statement)}
+
+    # A concurrent upload may have committed one of the playlists after this statement's snapshot was taken
+    if len(playlists) < len(names):
+        playlists.update({name: playlist_id for playlist_id, name in session.execute(existing)})
+    return playlists
+
+def add_tracks_to_playlists(track_ids, playlist_ids) -> None:
+    """Adds every track to every playlist with a single multi-row insert, skipping existing memberships."""
+    add_memberships(
+        (track_id, playlist_id)
+        for track_id in track_ids
+        for playlist_id in playlist_ids
+    )
+
+def add_memberships(pairs) -> None:
+    """Adds each `(track_id, playlist_id)` membership with a single multi-row insert, skipping existing ones."""
+    rows = [{"track_id": track_id, "playlist_id": playlist_id} for track_id, playlist_id in set(pairs)]
+    if len(rows) == 0:
+        return
+
+    session = models.db.session
+    if session.get_bind().dialect.name == "postgresql":
+        statement = postgresql.insert(models.PlaylistTrack).on_conflict_do_nothing(
+            constraint="uq_playlist_tracks_playlist_id_track_id"
+        )
+    else:
+        statement = insert(models.PlaylistTrack).prefix_with("OR IGNORE", dialect="sqlite")
+    session.execute(statement, rows)
+
+def remove_memberships(owner_id: int, pairs) -> int:
+    """Removes each `(track_id, playlist name)` membership of the owner's playlists with a single delete.
+    Playlists that don't exist are ignored. Returns the number of memberships removed."""
+
+    pairs = set(pairs)
+    if len(pairs) == 0:
+        return 0
+
+    session = models.db.session
+    playlist_ids = {
+        name: playlist_id
+        for playlist_id, name in session.execute(
+            select(models.Playlist.id, models.Playlist.name).where(
+                models.Playlist.owner_id == owner_id,
+                models.Playlist.name.in_(set(name for _, name in pairs)),
+            )
+        )
+    }
+    rows = [(track_id, playlist_ids[name]) for track_id, name in pairs if name in playlist_ids]
+    if len(rows) == 0:
+        return 0
+
+    return session.execute(
+        delete(models.PlaylistTrack).where(
+            tuple_(models.PlaylistTrack.track_id, models.PlaylistTrack.playlist_id).in_(rows)
+        )
+    ).rowcount
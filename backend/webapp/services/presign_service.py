@@ -0,0 +1,74 @@
+"""Cache-friendly presigned download URLs.
+
+Presigned URLs embed their signing time, so presigning the same object twice normally yields two different
+URLs, and browsers download the audio again. Here the signing time is rounded down to the start of a fixed
+time bucket: every presign of an object within the same bucket returns exactly the same URL.
+
+A URL is signed at the bucket's start and expires `PRESIGN_BUCKET_SECONDS + PRESIGN_MIN_VALIDITY_SECONDS`
+later, so it is still valid for at least `PRESIGN_MIN_VALIDITY_SECONDS` whenever it's handed out. A client
+that fetches the same track twice, `t` seconds apart, reuses its cached copy unless a bucket boundary falls
+between the two fetches, which happens with probability `min(1, t / PRESIGN_BUCKET_SECONDS)`."""
+
+__all__ = [
+    "presign_download",
+]
+
+import datetime
+import mimetypes
+import threading
+
+import config
+from . import clients
+
+
+_signing_time = threading.local()
+
+
+def _install_signing_clock():
+    import botocore.auth
+
+    if getattr(botocore.auth, "_hoot_signing_clock", False) or not hasattr(botocore.auth, "get_current_datetime"):
+        return
+    get_current_datetime = botocore.auth.get_current_datetime
+
+    def signing_clock(*args, **kwargs):
+        override = getattr(_signing_time, "value", None)
+        if override is None:
+            return get_current_datetime(*args, **kwargs)
+        return override
+
+    botocore.auth.get_current_datetime = signing_clock
+    botocore.auth._hoot_signing_clock = True
+
+def signing_window(now: datetime.datetime | None = None):
+    """Returns the start of the current bucket and the number of seconds URLs signed in it are valid for."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    bucket = config.PRESIGN_BUCKET_SECONDS
+    start = datetime.datetime.fromtimestamp(int(now.timestamp()) // bucket * bucket, datetime.timezone.utc)
+    # SigV4 presigned URLs can't be valid for more than 7 days
+    expires_in = min(bucket + config.PRESIGN_MIN_VALIDITY_SECONDS, 7 * 24 * 60 * 60)
+    return start, expires_in
+
+def presign_download(key: str) -> tuple[str, datetime.datetime]:
+    """Returns a presigned download URL for `key` that is identical for the whole current time bucket,
+    and the date it expires at."""
+    _install_signing_clock()
+    start, expires_in = signing_window()
+
+    params = {
+        "Bucket": config.S3_BUCKET_NAME,
+        "Key": key,
+        # Objects are never modified once uploaded, so players may keep them for as long as they like
+        "ResponseCacheControl": config.PRESIGN_CACHE_CONTROL,
+    }
+    content_type, _ = mimetypes.guess_type(key)
+    if content_type is not None:
+        params["ResponseContentType"] = content_type
+
+    _signing_time.value = start.replace(tzinfo=None)
+    try:
+        url = clients.s3_client().generate_presigned_url("get_object", Params=params, ExpiresIn=expires_in)
+    finally:
+        _signing_time.value = None
+
+    return url, start + datetime.timedelta(seconds=expires_in)
@@ -0,0 +1,145 @@
+__all__ = [
+    "delete_objects",
+    "purge_deleted_tracks",
+    "soft_delete_tracks",
+    "start_purger",
+    "wake_purger",
+]
+
+import datetime
+import logging
+import os
+import threading
+
+import flask
+from sqlalchemy import delete, select, update
+
+import config
+from .. import models
+from . import clients, outbound
+
+
+_wake = threading.Event()
+_lock = threading.Lock()
+_thread = None
+_pid = None
+
+
+def soft_delete_tracks(owner_id: int, track_ids) -> int:
+    """Marks the given tracks as deleted and removes them from every playlist. Their objects are removed from
+    storage later by the purger. Returns the number of tracks that were deleted. The caller must commit."""
+
+    track_ids = list(track_ids)
+    if len(track_ids) == 0:
+        return 0
+
+    session = models.db.session
+    deleted_ids = session.scalars(
+        update(models.Track).where(
+            models.Track.owner_id == owner_id,
+            models.Track.id.in_(track_ids),
+            models.Track.deleted_at.is_(None),
+        ).values(
+            deleted_at=datetime.datetime.now(datetime.timezone.utc)
+        ).returning(models.Track.id)
+    ).all()
+
+    if len(deleted_ids) > 0:
+        session.execute(delete(models.PlaylistTrack).where(models.PlaylistTrack.track_id.in_(deleted_ids)))
+    return len(deleted_ids)
+
+def _delete_objects(keys: list[str]) -> set[str]:
+    """Deletes the objects in a single request, retrying on failure. Returns the keys that couldn't be deleted."""
+    def delete_objects():
+        return clients.s3_client().delete_objects(
+            Bucket=config.S3_BUCKET_NAME,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+
+    try:
+        response = outbound.with_retries("s3", delete_objects, config.PURGE_MAX_RETRIES, backoff=1)
+    except Exception:
+        logging.exception(f"Failed to delete {len(keys)} objects")
+        return set(keys)
+    return set(error["Key"] for error in response.get("Errors", []))
+
+def delete_objects(keys) -> set[str]:
+    """Deletes the objects, 1000 per request. Returns the keys that couldn't be deleted."""
+    keys = list(keys)
+    failed_keys = set()
+    for start in range(0, len(keys), 1000):
+        failed_keys.update(_delete_objects(keys[start:start + 1000]))
+    return failed_keys
+
+def purge_deleted_tracks(batch_size: int | None = None) -> int:
+    """Removes the objects of one batch of soft-deleted tracks from storage, then the rows themselves.
+    Rows are locked with SKIP LOCKED so that purgers in several workers never process the same tracks.
+    Returns the number of tracks purged. Must be called inside an app context."""
+
+    batch_size = min(batch_size or config.PURGE_BATCH_SIZE, 1000)
+    session = models.db.session
+    tracks = session.execute(
+        select(models.Track.id, models.Track.object_key).where(
+            models.Track.deleted_at.is_not(None)
+        ).order_by(
+            models.Track.deleted_at
+        ).limit(batch_size).with_for_update(skip_locked=True)
+    ).all()
+
+    if len(tracks) == 0:
+        session.rollback()
+        return 0
+
+    # Objects shared with other tracks (see share_service) are kept until the last of them is purged. If two
+    # of them are purged at the same time, each may see the other and keep the object: the garbage collector
+    # deletes it later.
+    track_ids = [track_id for track_id, _ in tracks]
+    shared_keys = set(session.scalars(
+        select(models.Track.object_key).where(
+            models.Track.object_key.in_(set(object_key for _, object_key in tracks)),
+            models.Track.id.not_in(track_ids),
+        )
+    ))
+    unshared_keys = set(object_key for _, object_key in tracks) - shared_keys
+    failed_keys = _delete_objects(list(unshared_keys)) if len(unshared_keys) > 0 else set()
+    purged_ids = [track_id for track_id, object_key in tracks if object_key not in failed_keys]
+    if len(purged_ids) > 0:
+        session.execute(delete(models.TrackStats).where(models.TrackStats.track_id.in_(purged_ids)))
+        session.execute(delete(models.Track).where(models.Track.id.in_(purged_ids)))
+    session.commit()
+
+    if len(failed_keys) > 0:
+        logging.warning(f"Couldn't delete {len(failed_keys)} objects, will retry later")
+    return len(purged_ids)
+
+def _run(app: flask.Flask):
+    while True:
+        _wake.wait(config.PURGE_INTERVAL_SECONDS)
+        _wake.clear()
+        try:
+            with app.app_context():
+                while purge_deleted_tracks() > 0:
+                    pass
+        except Exception:
+            logging.exception("Track purge failed")
+
+def start_purger(app: flask.Flask | None = None):
+    """Starts this process' purger thread if needed. It then purges every `PURGE_INTERVAL_SECONDS`."""
+    global _thread, _pid
+
+    with _lock:
+        # Threads don't survive a fork, so each worker starts its own
+        if _thread is None or _pid != os.getpid():
+            _pid = os.getpid()
+            _thread = threading.Thread(
+                target=_run,
+                args=(app or flask.current_app._get_current_object(),),
+                name="hoot-purger",
+                daemon=True
+            )
+            _thread.start()
+
+def wake_purger():
+    """Starts this process' purger thread if needed and asks it to run as soon as possible."""
+    start_purger()
+    _wake.set()
@@ -0,0 +1,241 @@
+"""Migration rehearsals.
+
+Pending migrations are run against a scratch PostgreSQL database filled with a production-sized synthetic
+dataset, while other connections watch which locks each migration holds, and for how long reads and writes
+to every table are blocked. This shows whether a migration can safely run while the app is serving requests,
+before it runs against the real database."""
+
+__all__ = [
+    "RevisionReport",
+    "current_revision",
+    "rehearse",
+    "seed",
+]
+
+import threading
+import time
+
+import flask
+import flask_migrate
+import sqlalchemy as sa
+
+from .. import models
+
+
+MIGRATION_APPLICATION_NAME = "hoot-migration"
+# Lock modes that conflict with the ROW EXCLUSIVE lock taken by INSERT, UPDATE and DELETE
+WRITE_BLOCKING_LOCKS = {"ShareLock", "ShareRowExclusiveLock", "ExclusiveLock", "AccessExclusiveLock"}
+# Lock modes that conflict with the ACCESS SHARE lock taken by SELECT
+READ_BLOCKING_LOCKS = {"AccessExclusiveLock"}
+SEED_BATCH_SIZE = 500000
+
+
+class RevisionReport:
+    def __init__(self, revision: str, description: str):
+        self.revision = revision
+        self.description = description
+        self.duration = 0.0
+        # (table, lock mode) -> seconds the migration held the lock
+        self.locks: dict[tuple[str, str], float] = {}
+        # table -> slowest probe query, in seconds
+        self.read_latency: dict[str, float] = {}
+        self.write_latency: dict[str, float] = {}
+
+    def blocked(self, table: str, modes: set[str]) -> float:
+        """Returns how long the migration held a lock on `table` in one of `modes`."""
+        return max([duration for (name, mode), duration in self.locks.items() if name == table and mode in modes], default=0)
+
+
+class _LockMonitor(threading.Thread):
+    """Polls pg_locks for the table locks held by the migration's connection."""
+
+    def __init__(self, engine: sa.Engine, report: RevisionReport, interval: float):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.report = report
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        first_seen = {}
+        query = sa.text("""
+            SELECT c.relname, l.mode
+            FROM pg_locks l
+            JOIN pg_stat_activity a ON a.pid = l.pid
+            JOIN pg_class c ON c.oid = l.relation
+            WHERE a.application_name = :application_name
+                AND l.locktype = 'relation'
+                AND l.granted
+                AND c.relkind IN ('r', 'p')
+                AND c.relnamespace = 'public'::regnamespace
+        """)
+        with self.engine.connect() as connection:
+            while not self.stopped.is_set():
+                now = time.monotonic()
+                held = set(connection.execute(query, {"application_name": MIGRATION_APPLICATION_NAME}).all())
+                connection.rollback()
+                for lock in held:
+                    first_seen.setdefault(lock, now)
+                    self.report.locks[lock] = now - first_seen[lock] + self.interval
+                for lock in list(first_seen):
+                    if lock not in held:
+                        del first_seen[lock]
+                self.stopped.wait(self.interval)
+
+
+class _Probe(threading.Thread):
+    """Keeps querying `table` like requests would, recording the slowest reads and writes."""
+
+    def __init__(self, engine: sa.Engine, table: str, key_column: str, report: RevisionReport, interval: float):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.table = table
+        self.key_column = key_column
+        self.report = report
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def _timed(self, connection, statement, latencies):
+        start = time.monotonic()
+        connection.execute(statement)
+        connection.rollback()
+        latencies[self.table] = max(latencies.get(self.table, 0), time.monotonic() - start)
+
+    def run(self):
+        table = self.engine.dialect.identifier_preparer.quote(self.table)
+        key_column = self.engine.dialect.identifier_preparer.quote(self.key_column)
+        read = sa.text(f"SELECT * FROM {table} LIMIT 1")
+        # Updates nothing, but takes the same table lock as any write
+        write = sa.text(f"UPDATE {table} SET {key_column} = {key_column} WHERE false")
+        with self.engine.connect() as connection:
+            while not self.stopped.is_set():
+                try:
+                    self._timed(connection, read, self.report.read_latency)
+                    self._timed(connection, write, self.report.write_latency)
+                except sa.exc.DBAPIError:
+                    # The table is being dropped or rewritten
+                    connection.rollback()
+                self.stopped.wait(self.interval)
+
+
+def _key_column(inspector, table: str) -> str:
+    """Returns a column that a no-op update of `table` can set to itself: the first of its primary key, if any."""
+    primary_key = inspector.get_pk_constraint(table).get("constrained_columns") or []
+    return primary_key[0] if len(primary_key) > 0 else inspector.get_columns(table)[0]["name"]
+
+def _column_value(column: sa.Column, row_counts: dict[str, int]) -> str | None:
+    """Returns an SQL expression of the series value `g` for a synthetic value of `column`, or `None` to leave
+    it to its default."""
+    for foreign_key in column.foreign_keys:
+        referenced_rows = row_counts.get(foreign_key.column.table.name, 0)
+        if referenced_rows > 0:
+            return f"((g - 1) % {referenced_rows}) + 1"
+    if column.primary_key or column.nullable or column.server_default is not None:
+        return None
+
+    if isinstance(column.type, sa.Boolean):
+        return "(g % 2 = 0)"
+    if isinstance(column.type, sa.Integer):
+        return "(g % 1000000)"
+    if isinstance(column.type, (sa.Float, sa.Numeric)):
+        return "(g * 1.0)"
+    if isinstance(column.type, sa.DateTime):
+        return "(now() - g * interval '1 second')"
+    if isinstance(column.type, sa.JSON):
+        return "'[]'::json"
+    length = getattr(column.type, "length", None)
+    return f"left('{column.name} ' || g, {length})" if length else f"('{column.name} ' || g)"
+
+def seed(engine: sa.Engine, row_counts: dict[str, int], echo=print):
+    """Fills every table of the (empty) database with `row_counts[table]` synthetic rows. Foreign keys point
+    at existing rows, and every generated value is unique, so unique constraints hold."""
+    metadata = sa.MetaData()
+    metadata.reflect(engine)
+
+    for table in metadata.sorted_tables:
+        rows = row_counts.get(table.name, 0)
+        if rows == 0:
+            continue
+
+        values = {column.name: _column_value(column, row_counts) for column in table.columns}
+        values = {name: value for name, value in values.items() if value is not None}
+        quote = engine.dialect.identifier_preparer.quote
+        insert = sa.text(f"""
+            INSERT INTO {quote(table.name)} ({", ".join(quote(name) for name in values)})
+            SELECT {", ".join(values.values())} FROM generate_series(:start, :end) AS g
+        """)
+
+        start = time.monotonic()
+        for batch_start in range(1, rows + 1, SEED_BATCH_SIZE):
+            with engine.begin() as connection:
+                connection.execute(insert, {"start": batch_start, "end": min(batch_start + SEED_BATCH_SIZE - 1, rows)})
+        echo(f"Inserted {rows} rows into {table.name} in {time.monotonic() - start:.1f}s")
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(sa.text("ANALYZE"))
+
+def _script_directory():
+    from alembic.script import ScriptDirectory
+
+    migrate = flask.current_app.extensions["migrate"]
+    return ScriptDirectory.from_config(migrate.migrate.get_config(migrate.directory))
+
+def current_revision() -> str | None:
+    """Returns the revision the app's database is at."""
+    with models.db.engine.connect() as connection:
+        if not sa.inspect(connection).has_table("alembic_version"):
+            return None
+        return connection.execute(sa.text("SELECT version_num FROM alembic_version")).scalar()
+
+def rehearse(
+    database_url: str,
+    base: str | None,
+    row_counts: dict[str, int],
+    interval: float = 0.05,
+    echo=print
+) -> list[RevisionReport]:
+    """Resets the scratch database at `database_url`, migrates it to `base`, seeds it, then applies every
+    following migration one at a time while measuring the locks it takes. Must be called inside an app context."""
+    engine = sa.create_engine(database_url, poolclass=sa.pool.NullPool)
+    if engine.dialect.name != "postgresql":
+        raise ValueError("Rehearsals need a PostgreSQL database")
+
+    with engine.begin() as connection:
+        connection.execute(sa.text("DROP SCHEMA public CASCADE"))
+        connection.execute(sa.text("CREATE SCHEMA public"))
+
+    x_arg = [f"database_url={engine.url.render_as_string(hide_password=False)}"]
+    if base is not None:
+        flask_migrate.upgrade(revision=base, x_arg=x_arg)
+    seed(engine, row_counts, echo)
+
+    revisions = list(_script_directory().iterate_revisions("heads", base or "base"))
+    revisions.reverse()
+    if base is not None:
+        revisions = [revision for revision in revisions if revision.revision != base]
+
+    reports = []
+    for revision in revisions:
+        report = RevisionReport(revision.revision, revision.doc)
+        inspector = sa.inspect(engine)
+        watchers = [_LockMonitor(engine, report, interval)] + [
+            _Probe(engine, table, _key_column(inspector, table), report, interval)
+            for table in inspector.get_table_names() if table != "alembic_version"
+        ]
+        for watcher in watchers:
+            watcher.start()
+
+        echo(f"Applying {revision.revision} ({revision.doc})")
+        start = time.monotonic()
+        try:
+            flask_migrate.upgrade(revision=revision.revision, x_arg=x_arg)
+        finally:
+            report.duration = time.monotonic() - start
+            for watcher in watchers:
+                watcher.stopped.set()
+            for watcher in watchers:
+                watcher.join()
+        reports.append(report)
+
+    engine.dispose()
+    return reports
@@ -0,0 +1,398 @@
+"""Read-through cache of stored audio, served through `/relay`.
+
+When `RELAY_URL` is set, tracks' sources point at the relay instead of S3: `/relay/<object key>` with an
+expiration and an HMAC signature, and they expire along the same time buckets as presigned URLs (see
+`presign_service`), so players keep caching them the same way.
+
+Objects are kept whole in `RELAY_CACHE_DIR`, and the least recently served ones are deleted once they
+take more than `RELAY_CACHE_BYTES`. The cache is shared by every process on the host, through file locks
+that only POSIX hosts have (the module itself can be imported anywhere):
+
+- `<hash>` holds an object, and `<hash>.json` its size, ETag, type and modification date;
+- `<hash>.part` holds an object being fetched, while its fetcher holds an exclusive lock on `<hash>.lock`.
+
+An object that isn't cached is fetched from storage once, however many clients ask for it at the same time,
+by a thread of whichever process asks first. Every client (including the first) reads the part file as it
+grows, so responses start as soon as the first bytes arrive and no object is ever held in memory."""
+
+__all__ = [
+    "CachedObject",
+    "RelayError",
+    "RelayStats",
+    "enabled",
+    "evict",
+    "open_object",
+    "relay_url",
+    "stats",
+    "verify",
+]
+
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+import config
+from . import clients, presign_service
+
+
+CHUNK_SIZE = 256 * 1024
+POLL_SECONDS = 0.01
+STATS_FLUSH_SECONDS = 10
+STATS_FIELDS = ("requests", "hits", "coalesced", "misses", "bytes_served", "bytes_fetched")
+
+_lock = threading.Lock()
+# Keys fetched by this process right now
+_fetching: set[str] = set()
+# Keys whose last fetch by this process failed -> (time, error)
+_failures: dict[str, tuple[float, str]] = {}
+# Bytes cached as of the last eviction pass, plus what was fetched since
+_cached_bytes = None
+
+
+class RelayStats:
+    def __init__(self):
+        for field in STATS_FIELDS:
+            setattr(self, field, 0)
+
+    def hit_ratio(self) -> float:
+        return (self.hits + self.coalesced) / self.requests if self.requests > 0 else 0.0
+
+    def bytes_saved(self) -> int:
+        return max(0, self.bytes_served - self.bytes_fetched)
+
+
+_stats = RelayStats()
+_stats_flushed_at = time.monotonic()
+
+
+class RelayError(Exception):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CachedObject:
+    """An object being served from the cache, possibly still being fetched."""
+
+    def __init__(self, path: str, metadata: dict, status: str):
+        self.path = path
+        self.size = metadata["size"]
+        self.etag = metadata["etag"]
+        self.content_type = metadata["content_type"]
+        self.last_modified = datetime.datetime.fromtimestamp(metadata["last_modified"], datetime.timezone.utc)
+        # "hit", "coalesced" (joined a running fetch) or "miss"
+        self.status = status
+
+    def read(self, start: int, stop: int):
+        """Yields the bytes from `start` to `stop` (excluded), waiting for them while the object is fetched.
+        Stops early if the fetch stalls or fails, which truncates the response."""
+        served = 0
+        try:
+            # Opening the part file keeps it readable after it is renamed to, or replaced by, the complete file
+            try:
+                f = _open_data(self.path)
+            except FileNotFoundError:
+                logging.warning(f"Relay fetch of {os.path.basename(self.path)} failed before it could be served")
+                return
+            with f:
+                f.seek(start)
+                position = start
+                waited = 0.0
+                while position < stop:
+                    data = f.read(min(CHUNK_SIZE, stop - position))
+                    if len(data) > 0:
+                        position += len(data)
+                        served += len(data)
+                        waited = 0.0
+                        yield data
+                        continue
+                    if waited >= config.RELAY_STALL_SECONDS:
+                        logging.warning(f"Relay fetch of {os.path.basename(self.path)} stalled, giving up")
+                        return
+                    time.sleep(POLL_SECONDS)
+                    waited += POLL_SECONDS
+        finally:
+            _record(bytes_served=served)
+
+
+def enabled() -> bool:
+    return config.RELAY_URL is not None and config.RELAY_SECRET is not None
+
+def _signature(key: str, expires: int) -> str:
+    message = f"{key}\n{expires}".encode()
+    return hmac.new(config.RELAY_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+def relay_url(key: str) -> tuple[str, datetime.datetime]:
+    """Returns a relay URL for `key` that is identical for the whole current presign bucket, and the date it
+    expires at, like `presign_service.presign_download`."""
+    start, expires_in = presign_service.signing_window()
+    expiration = start + datetime.timedelta(seconds=expires_in)
+    expires = int(expiration.timestamp())
+    query = urllib.parse.urlencode({"expires": expires, "signature": _signature(key, expires)})
+    return f"{config.RELAY_URL.rstrip('/')}/relay/{urllib.parse.quote(key)}?{query}", expiration
+
+def verify(key: str, expires: str | None, signature: str | None) -> bool:
+    """Returns whether a relay URL's signature is valid and it hasn't expired."""
+    if not enabled() or expires is None or signature is None or not expires.isdigit():
+        return False
+    if int(expires) < time.time():
+        return False
+    return hmac.compare_digest(_signature(key, int(expires)), signature)
+
+def _path(key: str) -> str:
+    name = hashlib.sha256(key.encode()).hexdigest()
+    return os.path.join(config.RELAY_CACHE_DIR, name[:2], name)
+
+def _open_data(path: str):
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        pass
+    try:
+        return open(path + ".part", "rb")
+    except FileNotFoundError:
+        # The fetch just finished
+        return open(path, "rb")
+
+def _read_metadata(path: str) -> dict | None:
+    try:
+        with open(path + ".json", "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_atomically(path: str, data: bytes):
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(data)
+    os.replace(temporary_path, path)
+
+def _fetch(key: str, path: str, lock_file):
+    """Downloads `key` into `<path>.part`, then renames it to `path`. Runs in its own thread, holding the
+    object's lock, so that a client that disconnects doesn't abort the download for the others."""
+    global _cached_bytes
+    import fcntl
+
+    fetched = 0
+    try:
+        response = clients.s3_client().get_object(Bucket=config.S3_BUCKET_NAME, Key=key)
+        body = response["Body"]
+        metadata = {
+            "size": response["ContentLength"],
+            "etag": response["ETag"],
+            "content_type": response.get("ContentType") or "application/octet-stream",
+            "last_modified": response["LastModified"].timestamp(),
+        }
+        # Unbuffered, so readers see every chunk as soon as it is written
+        with open(path + ".part", "wb", buffering=0) as f:
+            _write_atomically(path + ".json", json.dumps(metadata).encode())
+            for chunk in body.iter_chunks(CHUNK_SIZE):
+                f.write(chunk)
+                fetched += len(chunk)
+        body.close()
+        if fetched != metadata["size"]:
+            raise IOError(f"Expected {metadata['size']} bytes, got {fetched}")
+        os.replace(path + ".part", path)
+    except Exception as e:
+        from botocore.exceptions import ClientError
+
+        logging.exception(f"Couldn't fetch {key} for the relay")
+        missing = isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404")
+        with _lock:
+            _failures[key] = (time.monotonic(), "missing" if missing else "failed")
+        for suffix in (".part", ".json"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+    finally:
+        with _lock:
+            _fetching.discard(key)
+            if _cached_bytes is not None:
+                _cached_bytes += fetched
+            over_budget = _cached_bytes is None or _cached_bytes > config.RELAY_CACHE_BYTES
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+        _record(bytes_fetched=fetched)
+
+    if over_budget:
+        evict()
+
+def _start_fetch(key: str, path: str) -> bool:
+    """Starts fetching `key` unless this or another process already is, or it was cached in the meantime.
+    Returns whether this process started the fetch."""
+    import fcntl
+
+    with _lock:
+        if key in _fetching:
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock_file = open(path + ".lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        if os.path.exists(path) and _read_metadata(path) is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+            return False
+        _fetching.add(key)
+        _failures.pop(key, None)
+
+    threading.Thread(target=_fetch, args=(key, path, lock_file), name="hoot-relay-fetch", daemon=True).start()
+    return True
+
+def open_object(key: str) -> CachedObject:
+    """Returns the cached object for `key`, starting to fetch it if needed. Waits for the fetch to get the
+    object's metadata, then returns without waiting for its content. Raises `RelayError` if it can't be fetched."""
+    path = _path(key)
+
+    metadata = _read_metadata(path)
+    if metadata is not None and os.path.exists(path):
+        # The modification time is the recency used by eviction
+        try:
+            os.utime(path)
+            _record(requests=1, hits=1)
+            return CachedObject(path, metadata, "hit")
+        except FileNotFoundError:
+            # Evicted just now
+            pass
+
+    started = _start_fetch(key, path)
+    _record(requests=1, **({"misses": 1} if started else {"coalesced": 1}))
+
+    waited = 0.0
+    while True:
+        metadata = _read_metadata(path)
+        if metadata is not None:
+            return CachedObject(path, metadata, "miss" if started else "coalesced")
+        with _lock:
+            failure = _failures.get(key)
+            fetching = key in _fetching
+        if failure is not None and not fetching:
+            raise RelayError("Track not found", 404) if failure[1] == "missing" else RelayError("Storage unavailable", 502)
+        if waited >= config.RELAY_STALL_SECONDS:
+            raise RelayError("Storage unavailable", 504)
+        time.sleep(POLL_SECONDS)
+        waited += POLL_SECONDS
+
+def evict() -> int | None:
+    """Deletes the least recently served objects until the cache fits in its budget, along with part files
+    abandoned by processes that died. Only one process of the host runs this at a time. Returns the number
+    of bytes cached afterwards, or `None` if another process is already evicting."""
+    global _cached_bytes
+    import fcntl
+
+    root = config.RELAY_CACHE_DIR
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, "evict.lock"), "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return None
+
+        now = time.time()
+        entries = []
+        total = 0
+        for directory in os.scandir(root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if "." not in entry.name:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+                elif entry.name.endswith(".part") and now - stat.st_mtime > config.RELAY_STALL_SECONDS * 10:
+                    _remove_abandoned(entry.path)
+                elif entry.name.endswith(".tmp") and now - stat.st_mtime > config.RELAY_STALL_SECONDS * 10:
+                    _remove_abandoned(entry.path, check_lock=False)
+
+        entries.sort()
+        # Leave some room so that the next few fetches don't trigger another pass
+        target = config.RELAY_CACHE_BYTES * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            # Lock files are kept: deleting one while another process opens it would let two processes fetch
+            for suffix in ("", ".json"):
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    with _lock:
+        _cached_bytes = total
+    return total
+
+def _remove_abandoned(path: str, check_lock: bool = True):
+    import fcntl
+
+    try:
+        if not check_lock:
+            os.remove(path)
+            return
+        with open(path.removesuffix(".part") + ".lock", "a") as lock_file:
+            # Skip it if it is still being fetched
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.remove(path)
+    except OSError:
+        pass
+
+def _record(**deltas):
+    global _stats_flushed_at
+
+    with _lock:
+        for field, delta in deltas.items():
+            setattr(_stats, field, getattr(_stats, field) + delta)
+        if time.monotonic() - _stats_flushed_at < STATS_FLUSH_SECONDS:
+            return
+        _stats_flushed_at = time.monotonic()
+        pending = {field: getattr(_stats, field) for field in STATS_FIELDS}
+        for field in STATS_FIELDS:
+            setattr(_stats, field, 0)
+
+    try:
+        _add_to_host_stats(pending)
+    except Exception:
+        logging.exception("Couldn't save relay stats")
+
+def _add_to_host_stats(counts: dict):
+    import fcntl
+
+    os.makedirs(config.RELAY_CACHE_DIR, exist_ok=True)
+    path = os.path.join(config.RELAY_CACHE_DIR, "stats.json")
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with open(path, "r") as f:
+                totals = json.load(f)
+        except (FileNotFoundError, ValueError):
+            totals = {}
+        for field, count in counts.items():
+            totals[field] = totals.get(field, 0) + count
+        _write_atomically(path, json.dumps(totals).encode())
+
+def stats() -> RelayStats:
+    """Returns the relay's counters, summed over every process of this host. Counts from the last
+    `STATS_FLUSH_SECONDS` of each process may be missing."""
+    _record()
+    try:
+        with open(os.path.join(config.RELAY_CACHE_DIR, "stats.json"), "r") as f:
+            totals = json.load(f)
+    except (FileNotFoundError, ValueError):
+        totals = {}
+    result = RelayStats()
+    for field in STATS_FIELDS:
+        setattr(result, field, totals.get(field, 0))
+    return result
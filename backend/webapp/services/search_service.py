@@ -0,0 +1,65 @@
+__all__ = [
+    "search_tracks",
+]
+
+from sqlalchemy import and_, case, exists, func, literal, or_, select
+from sqlalchemy.orm import selectinload
+
+from .. import models
+
+
+MAX_LIMIT = 100
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_tracks(owner_id: int, query: str, playlists: list[str] | None = None, limit: int = 20, offset: int = 0):
+    """Returns one page of the user's tracks whose name matches `query`, best matches first, and whether
+    there are more. Names starting with the query rank first, then names containing it or, on PostgreSQL,
+    a word closely resembling it. Only tracks in one of `playlists` are included, if given.
+
+    On PostgreSQL, matching is served by the trigram index on `(owner_id, lower(name))`, so it doesn't
+    depend on the size of the library."""
+
+    query = " ".join(query.lower().split())
+    limit = max(1, min(limit, MAX_LIMIT))
+    name = func.lower(models.Track.name)
+    starts_with = name.like(_escape_like(query) + "%", escape="\\")
+    contains = name.like("%" + _escape_like(query) + "%", escape="\\")
+
+    conditions = [
+        models.Track.owner_id == owner_id,
+        models.Track.deleted_at.is_(None),
+    ]
+    if playlists:
+        conditions.append(exists().where(
+            models.PlaylistTrack.track_id == models.Track.id,
+            models.PlaylistTrack.playlist_id == models.Playlist.id,
+            models.Playlist.owner_id == owner_id,
+            models.Playlist.name.in_(playlists),
+        ))
+
+    if models.db.session.get_bind().dialect.name == "postgresql":
+        # `<%` is true when the query closely resembles part of the name (pg_trgm word similarity)
+        resembles = literal(query).op("<%")(name)
+        conditions.append(or_(contains, resembles))
+        order_by = [
+            case((starts_with, 0), else_=1),
+            func.word_similarity(literal(query), name).desc(),
+            func.similarity(name, literal(query)).desc(),
+        ]
+    else:
+        conditions.append(contains)
+        order_by = [case((starts_with, 0), else_=1)]
+
+    statement = select(models.Track).where(and_(*conditions)).order_by(
+        *order_by,
+        models.Track.name,
+        models.Track.id,
+    ).options(
+        selectinload(models.Track.playlists)
+    ).limit(limit + 1).offset(offset)
+
+    tracks = models.db.session.scalars(statement).all()
+    return tracks[:limit], len(tracks) > limit
@@ -0,0 +1,167 @@
+"""Playlist sharing.
+
+A published playlist has a share code, and anyone with the code can clone it into their library. Clones
+reference the same stored objects as the originals, so no bytes are copied: an object is only deleted
+by the purger once no track references it any more. Users who want copies of their own (that survive
+anything the publisher does to theirs) get them through server-side copies within the bucket.
+
+Every track counts towards its owner's quota, whether its object is shared or not, so a user's quota
+never depends on what other users keep or delete. Tracks of the same user that share an object count once."""
+
+__all__ = [
+    "ShareRejected",
+    "clone",
+    "publish",
+    "shared_playlist",
+    "unpublish",
+]
+
+import secrets
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+
+import config
+from .. import models
+from . import clients, library_cache, outbound, playlist_service, purge_service
+
+
+# Larger objects have to be copied in parts
+MAX_COPY_OBJECT_SIZE = 5 * 1024 * 1024 * 1024
+
+
+class ShareRejected(Exception):
+    """Raised when a shared playlist can't be cloned. The message is meant to be shown to the user."""
+    pass
+
+
+def publish(owner_id: int, playlist_name: str) -> str | None:
+    """Publishes the playlist, returning its share code (the same one if it already was published), or `None`
+    if the user has no such playlist. The caller must commit."""
+    playlist = models.Playlist.query.filter_by(owner_id=owner_id, name=playlist_name).with_for_update().first()
+    if playlist is None:
+        return None
+    if playlist.share_code is None:
+        playlist.share_code = secrets.token_urlsafe(16)
+    return playlist.share_code
+
+def unpublish(owner_id: int, playlist_name: str) -> bool:
+    """Stops sharing the playlist. Tracks already cloned from it are kept. Returns whether the user has such a
+    playlist. The caller must commit."""
+    playlist = models.Playlist.query.filter_by(owner_id=owner_id, name=playlist_name).first()
+    if playlist is None:
+        return False
+    playlist.share_code = None
+    return True
+
+def shared_playlist(code: str) -> models.Playlist | None:
+    return models.Playlist.query.filter_by(share_code=code).first()
+
+def _shared_tracks(playlist_id: int, lock: bool):
+    statement = select(
+        models.Track.name,
+        models.Track.size,
+        models.Track.object_key,
+    ).join(
+        models.PlaylistTrack, models.PlaylistTrack.track_id == models.Track.id
+    ).where(
+        models.PlaylistTrack.playlist_id == playlist_id,
+        models.Track.deleted_at.is_(None),
+    ).order_by(models.Track.id)
+    if lock:
+        # Keeps the tracks from being deleted, and their objects purged, before the clones are committed
+        statement = statement.with_for_update(of=models.Track, read=True)
+    return models.db.session.execute(statement).all()
+
+def _copy_objects(owner_id: int, tracks) -> list[str]:
+    """Copies the objects of the tracks within the bucket, several at a time, and returns the new keys.
+    If any copy fails, the copies already made are deleted and the error is raised."""
+    s3_client = clients.s3_client()
+    request_deadline = outbound.current_deadline()
+
+    def copy(track):
+        _, size, object_key = track
+        extension = object_key.rsplit(".", 1)[-1]
+        new_key = f"user_{owner_id}/track_{uuid.uuid4()}.{extension}"
+        source = {"Bucket": config.S3_BUCKET_NAME, "Key": object_key}
+        with outbound.deadline(request_deadline):
+            outbound.check_deadline()
+            if size <= MAX_COPY_OBJECT_SIZE:
+                s3_client.copy_object(CopySource=source, Bucket=config.S3_BUCKET_NAME, Key=new_key, ACL="private")
+            else:
+                s3_client.copy(source, config.S3_BUCKET_NAME, new_key, ExtraArgs={"ACL": "private"})
+        return new_key
+
+    with ThreadPoolExecutor(config.SHARE_COPY_PARALLELISM) as executor:
+        futures = [executor.submit(copy, track) for track in tracks]
+    copied = [future.result() for future in futures if future.exception() is None]
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if len(errors) > 0:
+        # Whatever isn't deleted here is left to the garbage collector
+        with outbound.deadline(None):
+            purge_service.delete_objects(copied)
+        raise errors[0]
+    return copied
+
+def clone(user: models.User, code: str, playlist_name: str | None = None, copy: bool = False) -> tuple[str, list[dict]]:
+    """Adds the tracks of the playlist shared with `code` to the user's library, in a playlist of the same
+    name unless `playlist_name` is given. The new tracks reference the original objects, unless `copy` is
+    set. Returns the name of the playlist and the id, name and size of the new tracks. Raises `ShareRejected`
+    if the playlist isn't shared or the user doesn't have enough storage left. Commits."""
+
+    session = models.db.session
+    user_id = user.id
+    playlist = shared_playlist(code)
+    if playlist is None:
+        raise ShareRejected("Invalid share code")
+    playlist_name = playlist_name or playlist.name
+
+    tracks = _shared_tracks(playlist.id, lock=not copy)
+    if len(tracks) == 0:
+        session.rollback()
+        raise ShareRejected("The playlist is empty")
+
+    if copy:
+        added_size = sum(size for _, size, _ in tracks)
+    else:
+        # Objects the user already has a track of don't count twice
+        owned_keys = set(session.scalars(
+            select(models.Track.object_key).where(
+                models.Track.owner_id == user_id,
+                models.Track.object_key.in_(set(object_key for _, _, object_key in tracks)),
+                models.Track.deleted_at.is_(None),
+            )
+        ))
+        added_size = sum(size for _, size, object_key in {track[2]: track for track in tracks}.values() if object_key not in owned_keys)
+    if added_size > user.available_storage():
+        session.rollback()
+        raise ShareRejected("The playlist exceeds your quota")
+
+    if copy:
+        # No transaction is held open while the objects are copied
+        session.rollback()
+        object_keys = _copy_objects(user_id, tracks)
+    else:
+        object_keys = [object_key for _, _, object_key in tracks]
+
+    try:
+        new_tracks = [
+            models.Track(owner_id=user_id, name=name, size=size, object_key=object_key)
+            for (name, size, _), object_key in zip(tracks, object_keys)
+        ]
+        session.add_all(new_tracks)
+        session.flush()
+
+        playlist_ids = playlist_service.resolve_playlists(user_id, [playlist_name])
+        playlist_service.add_tracks_to_playlists([track.id for track in new_tracks], playlist_ids.values())
+        added = [{"id": track.id, "name": track.name, "size": track.size} for track in new_tracks]
+        session.commit()
+    except Exception:
+        session.rollback()
+        if copy:
+            purge_service.delete_objects(object_keys)
+        raise
+
+    library_cache.invalidate(user_id)
+    return playlist_name, added
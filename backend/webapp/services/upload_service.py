@@ -0,0 +1,255 @@
+"""Resumable uploads.
+
+An upload session is created with the file's size, then the file is sent in chunks, each at the offset the
+server has received so far. Every chunk is uploaded straight to storage as one part of an S3 multipart
+upload, so the app server never holds more than a chunk, and a failed chunk is the only thing a client
+has to send again. Once every byte was received, the session is finalized into a track.
+
+Sessions that receive nothing for `UPLOAD_SESSION_TTL` seconds expire, and `expire_sessions()` aborts
+their multipart uploads so S3 stops storing (and billing) the parts."""
+
+__all__ = [
+    "UploadRejected",
+    "abort",
+    "complete",
+    "create",
+    "expire_sessions",
+    "find",
+    "write_chunk",
+]
+
+import base64
+import datetime
+import hashlib
+import logging
+import mimetypes
+import uuid
+
+from sqlalchemy import func, select, update
+
+import config
+from .. import models
+from . import clients
+from .import_service import MAX_FILE_SIZE, SNIFF_SIZE
+
+
+CHECKSUM_ALGORITHMS = {
+    "md5": hashlib.md5,
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+}
+
+
+class UploadRejected(Exception):
+    """Raised when an upload request can't be accepted. The message is meant to be shown to the user."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+def reserved_storage(owner_id: int) -> int:
+    """Returns the number of bytes promised to the user's unexpired upload sessions."""
+    return models.db.session.scalar(
+        select(func.coalesce(func.sum(models.UploadSession.size), 0)).where(
+            models.UploadSession.owner_id == owner_id,
+            models.UploadSession.expires_at > _now(),
+        )
+    )
+
+def find(owner_id: int, upload_id: str) -> models.UploadSession | None:
+    """Returns the user's upload session, unless it doesn't exist or expired."""
+    return models.UploadSession.query.filter(
+        models.UploadSession.id == upload_id,
+        models.UploadSession.owner_id == owner_id,
+        models.UploadSession.expires_at > _now(),
+    ).first()
+
+def create(user: models.User, track_name: str, playlists: list[str], filename: str, size: int) -> models.UploadSession:
+    """Starts a multipart upload for a file of `size` bytes and returns its session. The caller must commit."""
+    if size <= 0:
+        raise UploadRejected("Invalid file size")
+    if size > MAX_FILE_SIZE:
+        raise UploadRejected("File too large")
+    if size > user.available_storage() - reserved_storage(user.id):
+        raise UploadRejected("File size exceeds your quota")
+
+    extension = filename.rsplit(".", 1)[-1].lower()
+    object_key = f"user_{user.id}/track_{uuid.uuid4()}.{extension}"
+    # The content is only sniffed once the first chunk arrives, by which point the object's type can't change
+    content_type, _ = mimetypes.guess_type(filename)
+    multipart_upload_id = clients.s3_client().create_multipart_upload(
+        Bucket=config.S3_BUCKET_NAME,
+        Key=object_key,
+        ContentType=content_type or "application/octet-stream",
+        ACL="private"
+    )["UploadId"]
+
+    now = _now()
+    upload = models.UploadSession(
+        id=uuid.uuid4().hex,
+        owner_id=user.id,
+        track_name=track_name,
+        playlists=playlists,
+        filename=filename,
+        size=size,
+        received=0,
+        chunk_size=config.UPLOAD_CHUNK_SIZE,
+        object_key=object_key,
+        multipart_upload_id=multipart_upload_id,
+        parts=[],
+        created_at=now,
+        expires_at=now + datetime.timedelta(seconds=config.UPLOAD_SESSION_TTL),
+    )
+    models.db.session.add(upload)
+    return upload
+
+def _verify_checksum(data: bytes, checksum: str):
+    """Checks `data` against a tus-style `<algorithm> <base64 digest>` checksum."""
+    algorithm, _, digest = checksum.strip().partition(" ")
+    if algorithm.lower() not in CHECKSUM_ALGORITHMS:
+        raise UploadRejected(f"Unsupported checksum algorithm, use one of {', '.join(CHECKSUM_ALGORITHMS)}")
+    try:
+        expected = base64.b64decode(digest.strip(), validate=True)
+    except ValueError:
+        raise UploadRejected("Invalid checksum")
+    if CHECKSUM_ALGORITHMS[algorithm.lower()](data).digest() != expected:
+        raise UploadRejected("Checksum mismatch", 460)
+
+def write_chunk(upload: models.UploadSession, offset: int, data: bytes, checksum: str | None = None) -> int:
+    """Uploads the chunk starting at `offset` as a multipart upload part and commits the session's new offset,
+    which is returned. Chunks must be sent in order, and all but the last must be `chunk_size` bytes long."""
+    if offset != upload.received:
+        raise UploadRejected(f"Expected offset {upload.received}", 409)
+    expected_size = min(upload.chunk_size, upload.size - offset)
+    if len(data) != expected_size:
+        raise UploadRejected(f"Expected a chunk of {expected_size} bytes")
+    if checksum is not None:
+        _verify_checksum(data, checksum)
+
+    mime = upload.mime
+    if offset == 0:
+        import magic
+
+        mime = magic.from_buffer(data[:SNIFF_SIZE], mime=True)
+        if not mime.startswith("audio/"):
+            abort(upload)
+            models.db.session.commit()
+            raise UploadRejected("Invalid file type (only audio allowed)")
+
+    part_number = offset // upload.chunk_size + 1
+    etag = clients.s3_client().upload_part(
+        Bucket=config.S3_BUCKET_NAME,
+        Key=upload.object_key,
+        UploadId=upload.multipart_upload_id,
+        PartNumber=part_number,
+        Body=data,
+        ContentMD5=base64.b64encode(hashlib.md5(data).digest()).decode()
+    )["ETag"]
+
+    # Another request may have written the same chunk meanwhile, in which case this one lost
+    parts = [part for part in upload.parts if part["PartNumber"] != part_number]
+    parts.append({"PartNumber": part_number, "ETag": etag})
+    result = models.db.session.execute(
+        update(models.UploadSession).where(
+            models.UploadSession.id == upload.id,
+            models.UploadSession.received == offset,
+        ).values(
+            received=offset + len(data),
+            parts=parts,
+            mime=mime,
+            expires_at=_now() + datetime.timedelta(seconds=config.UPLOAD_SESSION_TTL),
+        )
+    )
+    models.db.session.commit()
+    if result.rowcount == 0:
+        raise UploadRejected("Chunk was already received", 409)
+    return offset + len(data)
+
+def complete(upload: models.UploadSession):
+    """Assembles the uploaded parts into the final object. The caller creates the track and deletes the session."""
+    if upload.received != upload.size:
+        raise UploadRejected(f"Upload incomplete ({upload.received} of {upload.size} bytes received)", 409)
+
+    clients.s3_client().complete_multipart_upload(
+        Bucket=config.S3_BUCKET_NAME,
+        Key=upload.object_key,
+        UploadId=upload.multipart_upload_id,
+        MultipartUpload={"Parts": sorted(upload.parts, key=lambda part: part["PartNumber"])}
+    )
+
+def _abort_multipart_upload(object_key: str, multipart_upload_id: str):
+    from botocore.exceptions import ClientError
+
+    try:
+        clients.s3_client().abort_multipart_upload(
+            Bucket=config.S3_BUCKET_NAME,
+            Key=object_key,
+            UploadId=multipart_upload_id
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "NoSuchUpload":
+            raise
+
+def abort(upload: models.UploadSession):
+    """Discards the uploaded parts and deletes the session. The caller must commit."""
+    _abort_multipart_upload(upload.object_key, upload.multipart_upload_id)
+    models.db.session.delete(upload)
+
+def _abort_untracked_uploads(cutoff: datetime.datetime) -> int:
+    """Aborts multipart uploads older than `cutoff` that have no session, e.g. because the app stopped between
+    starting the upload and committing its session."""
+    aborted = 0
+    paginator = clients.s3_client().get_paginator("list_multipart_uploads")
+    for page in paginator.paginate(Bucket=config.S3_BUCKET_NAME, Prefix="user_"):
+        uploads = [
+            upload for upload in page.get("Uploads", [])
+            if upload["Initiated"].astimezone(datetime.timezone.utc).replace(tzinfo=None) < cutoff
+        ]
+        if len(uploads) == 0:
+            continue
+
+        tracked = set(models.db.session.scalars(
+            select(models.UploadSession.multipart_upload_id).where(
+                models.UploadSession.multipart_upload_id.in_([upload["UploadId"] for upload in uploads])
+            )
+        ))
+        for upload in uploads:
+            if upload["UploadId"] not in tracked:
+                _abort_multipart_upload(upload["Key"], upload["UploadId"])
+                aborted += 1
+    return aborted
+
+def expire_sessions(batch_size: int = 100) -> tuple[int, int]:
+    """Aborts expired upload sessions, then multipart uploads that were abandoned before they got a session.
+    Returns the number of each. Must be called inside an app context."""
+    session = models.db.session
+    expired = 0
+    while True:
+        uploads = session.scalars(
+            select(models.UploadSession).where(
+                models.UploadSession.expires_at <= _now()
+            ).limit(batch_size).with_for_update(skip_locked=True)
+        ).all()
+        if len(uploads) == 0:
+            session.rollback()
+            break
+
+        aborted = 0
+        for upload in uploads:
+            try:
+                abort(upload)
+                aborted += 1
+            except Exception:
+                logging.exception(f"Couldn't abort upload session {upload.id}")
+        session.commit()
+        expired += aborted
+        # Sessions that couldn't be aborted are retried on the next run
+        if len(uploads) < batch_size or aborted == 0:
+            break
+
+    untracked = _abort_untracked_uploads(_now() - datetime.timedelta(seconds=config.UPLOAD_SESSION_TTL))
+    return expired, untracked
@@ -56,6 +56,69 @@ function addTrack(name: string, playlists: string[], file: File): ApiResponse<On
     );
 }
 
+type UploadStatus = {
+    id: string;
+    offset: number;
+    size: number;
+    chunk_size: number;
+    expires_at: number;
+};
+
+async function uploadChunk(upload: UploadStatus, chunk: Blob): ApiResponse<UploadStatus> {
+    const data = await chunk.arrayBuffer();
+    const digest = new Uint8Array(await crypto.subtle.digest("SHA-256", data));
+    const headers = new Headers();
+    headers.append("Content-Type", "application/offset+octet-stream");
+    headers.append("Upload-Offset", upload.offset.toString());
+    headers.append("Upload-Checksum", `sha256 ${btoa(String.fromCharCode(...digest))}`);
+
+    const req = await fetch(`${ENDPOINT}/tracks/uploads/${upload.id}`, {
+        method: "PATCH",
+        credentials: "include",
+        headers: headers,
+        body: data
+    });
+    return req.json();
+}
+
+async function addTrackResumable(name: string, playlists: string[], file: File, onProgress?: (sent: number, total: number) => void, maxRetries = 5): ApiResponse<OnlineTrack> {
+    let upload: UploadStatus|ApiError = await request(
+        "/tracks/uploads",
+        "POST",
+        JSON.stringify({
+            track_name: name,
+            playlists,
+            filename: file.name,
+            size: file.size
+        })
+    );
+    if (isError(upload)) return upload;
+
+    let retries = 0;
+    while (upload.offset < upload.size) {
+        let result: UploadStatus|ApiError;
+        try {
+            result = await uploadChunk(upload, file.slice(upload.offset, upload.offset + upload.chunk_size));
+        } catch (e) {
+            result = { error: String(e) };
+        }
+
+        if (isError(result)) {
+            if (++retries > maxRetries) return result;
+            // Resume from wherever the server got to
+            await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** retries));
+            result = await request(`/tracks/uploads/${upload.id}`, "GET");
+            if (isError(result)) return result;
+        } else {
+            retries = 0;
+        }
+        upload = result;
+        onProgress?.(upload.offset, upload.size);
+    }
+
+    return request(`/tracks/uploads/${upload.id}/complete`, "POST");
+}
+
 function addTrackFromURL(name: string, playlists: string[], source: string): ApiResponse<OnlineTrack> {
     const formData = new FormData();
     formData.append("metadata", JSON.stringify({
@@ -72,6 +135,35 @@ function addTrackFromURL(name: string, playlists: string[], source: string): Api
     );
 }
 
+function addTracks(tracks: { name: string, playlists: string[], file: File }[]): ApiResponse<{ tracks: OnlineTrack[], rejected: { position: number, filename: string, error: string }[], used_storage: number }> {
+    const formData = new FormData();
+    // The metadata comes first, so the server knows every track before their files arrive
+    formData.append("metadata", JSON.stringify({
+        tracks: tracks.map(({ name, playlists }) => ({ track_name: name, playlists }))
+    }));
+    for (const { file } of tracks) {
+        formData.append("file", file);
+    }
+
+    return request(
+        "/tracks/batch",
+        "POST",
+        formData,
+        false
+    );
+}
+
+function cloneSharedPlaylist(code: string, playlist?: string, copy = false): ApiResponse<{ playlist: string, tracks: OnlineTrack[], used_storage: number }> {
+    return request(
+        `/tracks/shares/${encodeURIComponent(code)}/clone`,
+        "POST",
+        JSON.stringify({
+            playlist,
+            copy
+        })
+    );
+}
+
 function deleteTrack(id: number, playlist?: string): ApiResponse<OnlineTrack> {
     return request(
         `/tracks/${id}`,
@@ -82,10 +174,43 @@ function deleteTrack(id: number, playlist?: string): ApiResponse<OnlineTrack> {
     );
 }
 
+function deleteTracks(ids?: number[], playlist?: string): ApiResponse<{ deleted: number, used_storage: number }> {
+    return request(
+        "/tracks",
+        "DELETE",
+        JSON.stringify({
+            ids,
+            playlist
+        })
+    );
+}
+
+async function exportTracks(): Promise<Blob> {
+    const req = await fetch(`${ENDPOINT}/tracks/export`, {
+        method: "GET",
+        credentials: "include",
+    });
+    if (!req.ok) {
+        throw new Error(`Request failed: ${req.status} ${req.statusText}`);
+    }
+    return req.blob();
+}
+
 function getProfile(): ApiResponse<User> {
     return request("/user", "GET");
 }
 
+export type SharedPlaylist = {
+    playlist: string;
+    owner: string;
+    tracks: { name: string, size: number }[];
+    size: number;
+};
+
+function getSharedPlaylist(code: string): ApiResponse<SharedPlaylist> {
+    return request(`/tracks/shares/${encodeURIComponent(code)}`, "GET");
+}
+
 function getTrack(trackId: number): ApiResponse<OnlineTrack> {
     return request(`/tracks/${trackId}`, "GET");
 }
@@ -112,6 +237,48 @@ function logout(): ApiResponse<never> {
     );
 }
 
+function resolveTracks(trackIds: number[], playlists: string[]): ApiResponse<{ tracks: OnlineTrack[], playlists: Record<string, number[]> }> {
+    return request(
+        "/tracks/resolve",
+        "POST",
+        JSON.stringify({
+            track_ids: trackIds,
+            playlists
+        })
+    );
+}
+
+function searchTracks(query: string, playlists: string[] = [], limit = 20, offset = 0): ApiResponse<{ tracks: OnlineTrack[], next_offset: number|null }> {
+    const params = new URLSearchParams({ q: query, limit: limit.toString(), offset: offset.toString() });
+    playlists.forEach(playlist => params.append("playlist", playlist));
+    return request(`/tracks/search?${params}`, "GET");
+}
+
+export type TrackEvent = {
+    track_id: number;
+    type: "play"|"skip"|"stop";
+};
+
+function sendTrackEvents(events: TrackEvent[]): ApiResponse<{ accepted: number }> {
+    return request(
+        "/tracks/events",
+        "POST",
+        JSON.stringify({
+            events
+        })
+    );
+}
+
+function sharePlaylist(playlist: string): ApiResponse<{ code: string }> {
+    return request(
+        "/tracks/shares",
+        "POST",
+        JSON.stringify({
+            playlist
+        })
+    );
+}
+
 function signup(email: string, username: string, password: string, confirmPassword: string): ApiResponse<never> {
     return request(
         "/user",
@@ -132,6 +299,41 @@ function unlinkPatreon(): ApiResponse<never> {
     );
 }
 
+function unsharePlaylist(playlist: string): ApiResponse<never> {
+    return request(
+        "/tracks/shares",
+        "DELETE",
+        JSON.stringify({
+            playlist
+        })
+    );
+}
+
+export type TrackEdit = {
+    id: number;
+    name?: string;
+    add_playlists?: string[];
+    remove_playlists?: string[];
+};
+
+function updateTrack({ id, ...edit }: TrackEdit): ApiResponse<OnlineTrack> {
+    return request(
+        `/tracks/${id}`,
+        "PATCH",
+        JSON.stringify(edit)
+    );
+}
+
+function updateTracks(tracks: TrackEdit[]): ApiResponse<{ updated: number }> {
+    return request(
+        "/tracks",
+        "PATCH",
+        JSON.stringify({
+            tracks
+        })
+    );
+}
+
 function verifyEmail(verificationCode: string) {
     return request(
         `/auth/verify/${verificationCode}`,
@@ -142,13 +344,26 @@ function verifyEmail(verificationCode: string) {
 export const apiService = {
     addTrack,
     addTrackFromURL,
+    addTrackResumable,
+    addTracks,
+    cloneSharedPlaylist,
     deleteTrack,
+    deleteTracks,
+    exportTracks,
     getProfile,
+    getSharedPlaylist,
     getTrack,
     getTracks,
     login,
     logout,
+    resolveTracks,
+    searchTracks,
+    sendTrackEvents,
+    sharePlaylist,
     signup,
     unlinkPatreon,
+    unsharePlaylist,
+    updateTrack,
+    updateTracks,
     verifyEmail,
 };
@@ -1,4 +1,11 @@
 #!/bin/bash
 echo "Running database migrations..."
 cd backend
-flask db upgrade
\ No newline at end of file
+# Migrations give up on locks they can't take within HOOT_MIGRATION_LOCK_TIMEOUT_MS instead of blocking
+# requests, so retry a few times before failing the release
+for attempt in 1 2 3 4 5; do
+    flask db upgrade && exit 0
+    echo "Migration attempt $attempt failed"
+    sleep $((attempt * 10))
+done
+exit 1